@@ -0,0 +1,363 @@
+import argparse
+import io
+import json
+import logging
+import struct
+import time
+from decimal import Decimal
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+import psycopg2
+import pyarrow as pa
+from psycopg2.extras import execute_values
+
+from lib.bulk_load import copy_buffer, encode_csv
+
+logger = logging.getLogger(__name__)
+
+# Signature, flags and header extension length of a binary COPY stream
+COPY_HEADER = b"PGCOPY\n\xff\r\n\x00" + struct.pack(">ii", 0, 0)
+COPY_TRAILER = struct.pack(">h", -1)
+
+# Rows encoded at a time; bounds the padded field matrices
+CHUNK_ROWS = 65_536
+
+# Fixed-width wire formats by information_schema data type
+FIXED_TYPES = {
+    "smallint": ">i2",
+    "integer": ">i4",
+    "bigint": ">i8",
+    "real": ">f4",
+    "double precision": ">f8",
+}
+TEXT_TYPES = {"character varying", "character", "text"}
+TIMESTAMP_TYPES = {"timestamp without time zone", "timestamp with time zone"}
+
+# Digits after the point tried when looking for the exact decimal of a float;
+# floats needing more (0.1 + 0.2) are encoded from their repr, up to 17
+# significant digits, matching text COPY and the row hashes
+MAX_NUMERIC_SCALE = 15
+_NUMERIC_GROUPS = 5  # base-10000 digits needed below 2**63, or for any 17 significant digits
+_EXACT_LIMIT = float(2 ** 53)
+_NUMERIC_NEG = 0x4000
+
+_PG_EPOCH = np.datetime64("2000-01-01T00:00:00", "us")
+
+# Per-row byte lengths (-1 for NULL) and the field bytes, one zero-padded row each
+Field = Tuple[np.ndarray, np.ndarray]
+
+def binary_supported(column_types: Dict[str, str], columns: List[str]) -> bool:
+    """Check whether every column has a type encode_binary can write."""
+    supported = set(FIXED_TYPES) | TEXT_TYPES | TIMESTAMP_TYPES | {"numeric", "boolean", "date"}
+    return all(column_types.get(col) in supported for col in columns)
+
+def _fixed(values: np.ndarray, valid: np.ndarray, wire_type: str) -> Field:
+    width = np.dtype(wire_type).itemsize
+    lengths = np.where(valid, width, -1)
+    return lengths, np.ascontiguousarray(values.astype(wire_type)).view(np.uint8).reshape(len(values), width)
+
+def _integers(series: pd.Series, valid: np.ndarray, wire_type: str) -> Field:
+    values = pd.to_numeric(series[valid]).to_numpy()
+    if values.dtype.kind == "f" and not np.array_equal(values, np.trunc(values)):
+        raise ValueError(f"Column {series.name} has fractional values for an integer column")
+    full = np.zeros(len(series), dtype=wire_type)
+    full[valid] = values
+    return _fixed(full, valid, wire_type)
+
+def _repr_numeric(value: float) -> Tuple[int, int, List[int]]:
+    """Weight, scale and base-10000 digits of a float's shortest round-trip decimal."""
+    _, digits, exponent = Decimal(repr(abs(float(value)))).as_tuple()
+    scale = max(-exponent, 0)
+    frac_groups = (scale + 3) // 4
+    mantissa = int("".join(map(str, digits))) * 10 ** (frac_groups * 4 - scale + max(exponent, 0))
+    groups = []
+    while mantissa:
+        groups.append(mantissa % 10_000)
+        mantissa //= 10_000
+    low = next(i for i, group in enumerate(groups) if group)
+    return len(groups) - 1 - frac_groups, scale, groups[low:][::-1]
+
+def _numeric(series: pd.Series, valid: np.ndarray) -> Field:
+    """Encode floats as PostgreSQL NUMERIC: base-10000 digits plus weight and scale.
+
+    Each value gets the shortest decimal scale that reproduces it exactly,
+    so 0.25 is stored as 0.25 rather than as its binary expansion, and
+    0.1 + 0.2 as 0.30000000000000004 like its repr.
+    """
+    values = pd.to_numeric(series[valid]).to_numpy(dtype=np.float64)
+    if not np.isfinite(values).all():
+        raise ValueError(f"Column {series.name} has infinite values for a numeric column")
+    magnitude = np.abs(values)
+    # Values of 2**63 or more are zeroed here, so the search below never
+    # matches them and they stay pending for _repr_numeric
+    in_range = np.where(magnitude < 2.0 ** 63, magnitude, 0.0)
+
+    scale = np.full(len(values), -1, dtype=np.int64)
+    pending = np.arange(len(values))
+    for s in range(MAX_NUMERIC_SCALE + 1):
+        if not pending.size:
+            break
+        scaled = in_range[pending] * 10.0 ** s
+        exact = (scaled < _EXACT_LIMIT) & (np.rint(scaled) / 10.0 ** s == magnitude[pending])
+        scale[pending[exact]] = s
+        pending = pending[~exact]
+    # Placeholder so the vectorized pass stays in range; replaced below
+    scale[pending] = 0
+
+    mantissa = np.rint(in_range * 10.0 ** scale).astype(np.int64)
+    # Pad the scale to whole base-10000 digits
+    frac_groups = (scale + 3) // 4
+    mantissa *= 10 ** (frac_groups * 4 - scale)
+
+    groups = (mantissa[:, None] // 10_000 ** np.arange(_NUMERIC_GROUPS, dtype=np.int64)) % 10_000
+    nonzero = groups != 0
+    any_digits = nonzero.any(axis=1)
+    high = np.where(any_digits, _NUMERIC_GROUPS - 1 - np.argmax(nonzero[:, ::-1], axis=1), 0)
+    low = np.argmax(nonzero, axis=1)
+    ndigits = np.where(any_digits, high - low + 1, 0)
+    weight = np.where(any_digits, high - frac_groups, 0)
+
+    # ndigits, weight, sign, dscale, then digits most significant first;
+    # digits past ndigits are dropped with the padding
+    words = np.zeros((len(series), 4 + _NUMERIC_GROUPS), dtype=">i2")
+    words[valid, 0] = ndigits
+    words[valid, 1] = weight
+    words[valid, 2] = np.where(values < 0, _NUMERIC_NEG, 0)
+    words[valid, 3] = scale
+    order = np.clip(high[:, None] - np.arange(_NUMERIC_GROUPS)[None, :], 0, _NUMERIC_GROUPS - 1)
+    words[valid, 4:] = np.take_along_axis(groups, order, axis=1)
+
+    lengths = np.full(len(series), -1, dtype=np.int64)
+    lengths[valid] = 8 + 2 * ndigits
+
+    # Few values need more than MAX_NUMERIC_SCALE digits or 2**63 and
+    # more; they are done one by one
+    for row, value in zip(np.flatnonzero(valid)[pending], values[pending]):
+        weight, dscale, digits = _repr_numeric(value)
+        words[row, :] = 0
+        words[row, :4] = (len(digits), weight, _NUMERIC_NEG if value < 0 else 0, dscale)
+        words[row, 4:4 + len(digits)] = digits
+        lengths[row] = 8 + 2 * len(digits)
+    return lengths, words.view(np.uint8).reshape(len(series), -1)
+
+def _text(series: pd.Series, valid: np.ndarray) -> Field:
+    values = pa.array(series, from_pandas=True)
+    if isinstance(values, pa.ChunkedArray):
+        values = values.combine_chunks()
+    if pa.types.is_dictionary(values.type):
+        values = values.dictionary_decode()
+    if not (pa.types.is_string(values.type) or pa.types.is_large_string(values.type)):
+        # Render other values the way text COPY would
+        values = pa.array(series.astype(str).where(valid, None), type=pa.string())
+    values = values.cast(pa.large_string())
+
+    offsets = np.frombuffer(values.buffers()[1], dtype=np.int64)[values.offset:values.offset + len(values) + 1]
+    lengths = np.where(valid, np.diff(offsets), -1)
+    width = int(lengths.max(initial=0))
+    data = values.buffers()[2]
+    if width == 0 or data is None:
+        return lengths, np.zeros((len(series), 0), dtype=np.uint8)
+    data = np.frombuffer(data, dtype=np.uint8)
+    # Gather each string into a padded row; bytes past its length are dropped
+    index = np.minimum(offsets[:-1, None] + np.arange(width)[None, :], len(data) - 1)
+    return lengths, data[index]
+
+def _timestamps(series: pd.Series, valid: np.ndarray, unit: str) -> Field:
+    values = pd.to_datetime(series[valid])
+    if values.dt.tz is not None:
+        values = values.dt.tz_convert("UTC").dt.tz_localize(None)
+    since_epoch = values.to_numpy().astype("M8[us]") - _PG_EPOCH
+    full = np.zeros(len(series), dtype=np.int64)
+    if unit == "D":
+        full[valid] = since_epoch.astype("m8[D]").astype(np.int64)
+        return _fixed(full, valid, ">i4")
+    full[valid] = since_epoch.astype(np.int64)
+    return _fixed(full, valid, ">i8")
+
+def encode_field(series: pd.Series, data_type: str) -> Field:
+    """Encode one column into binary COPY fields.
+
+    Args:
+        series: Column values; NA values become NULL
+        data_type: Target information_schema data type
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: Byte length of each field (-1 for
+        NULL) and a uint8 matrix holding each field's bytes in its row,
+        zero-padded to the widest field
+    """
+    valid = series.notna().to_numpy()
+    if data_type in FIXED_TYPES:
+        wire_type = FIXED_TYPES[data_type]
+        if np.dtype(wire_type).kind == "i":
+            return _integers(series, valid, wire_type)
+        full = pd.to_numeric(series).to_numpy(dtype=np.float64, na_value=0.0)
+        return _fixed(full, valid, wire_type)
+    if data_type == "numeric":
+        return _numeric(series, valid)
+    if data_type == "boolean":
+        full = np.zeros(len(series), dtype=np.uint8)
+        full[valid] = series[valid].astype(bool).to_numpy()
+        return _fixed(full, valid, "u1")
+    if data_type in TEXT_TYPES:
+        return _text(series, valid)
+    if data_type in TIMESTAMP_TYPES:
+        return _timestamps(series, valid, "us")
+    if data_type == "date":
+        return _timestamps(series, valid, "D")
+    raise ValueError(f"Binary COPY does not support {data_type} (column {series.name})")
+
+def _encode_tuples(fields: List[Field], num_rows: int) -> np.ndarray:
+    """Lay out encoded columns as binary COPY tuples.
+
+    The field count, each length word and each padded field are placed side
+    by side in one matrix; masking out the padding leaves the tuples in
+    row-major order.
+    """
+    blocks = [np.full(num_rows, len(fields), dtype=">i2").view(np.uint8).reshape(num_rows, 2)]
+    keep = [np.ones((num_rows, 2), dtype=bool)]
+    for lengths, padded in fields:
+        blocks.append(lengths.astype(">i4").view(np.uint8).reshape(num_rows, 4))
+        keep.append(np.ones((num_rows, 4), dtype=bool))
+        blocks.append(padded)
+        keep.append(np.arange(padded.shape[1])[None, :] < lengths[:, None])
+    return np.concatenate(blocks, axis=1)[np.concatenate(keep, axis=1)]
+
+def encode_binary(df: pd.DataFrame, column_types: Dict[str, str], chunk_rows: int = CHUNK_ROWS) -> io.BytesIO:
+    """Render a frame as a binary-format COPY payload, rewound for reading.
+
+    Columns are encoded with numpy a chunk of rows at a time, so numbers go
+    to the wire without being formatted as text and parsed back.
+
+    Args:
+        df: Frame whose columns are target column names
+        column_types: Target column types as returned by get_column_types
+        chunk_rows: Rows encoded at a time
+
+    Returns:
+        io.BytesIO: Header, tuples and trailer
+    """
+    buffer = io.BytesIO()
+    buffer.write(COPY_HEADER)
+    for start in range(0, len(df), chunk_rows):
+        chunk = df.iloc[start:start + chunk_rows]
+        fields = [encode_field(chunk[col], column_types[col]) for col in chunk.columns]
+        buffer.write(_encode_tuples(fields, len(chunk)).tobytes())
+    buffer.write(COPY_TRAILER)
+    buffer.seek(0)
+    return buffer
+
+def copy_binary(cur: psycopg2.extensions.cursor, table_name: str, columns: List[str], buffer: Any) -> None:
+    """COPY an encoded binary payload into a table.
+
+    Args:
+        cur: Open database cursor
+        table_name: Target table
+        columns: Target columns in payload order
+        buffer: Payload from encode_binary
+    """
+    cur.copy_expert(
+        f"COPY {table_name} ({', '.join(columns)}) FROM STDIN WITH (FORMAT binary)",
+        buffer
+    )
+
+def synthetic_survey_frame(rows: int, seed: int = 0) -> Tuple[pd.DataFrame, Dict[str, str]]:
+    """Build a staging_survey-like frame dominated by DECIMAL columns.
+
+    Args:
+        rows: Number of rows
+        seed: Random seed
+
+    Returns:
+        Tuple[pd.DataFrame, Dict[str, str]]: The frame and its column types
+    """
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame({
+        "hhid_2": pd.Series([f"HH{i:08d}" for i in range(rows)], dtype="string[pyarrow]"),
+        "survey_year": pd.array(rng.choice([2020, 2021, 2023], rows), dtype="Int16"),
+        "submission_date": pd.Timestamp("2021-01-01") + pd.to_timedelta(rng.integers(0, 10**8, rows), unit="s"),
+        "district": pd.Categorical(rng.choice(["Kanungu", "Rukungiri", "Mitooma", "Kasese"], rows)),
+        "hh_size": pd.array(rng.integers(1, 15, rows), dtype="Int8"),
+    })
+    column_types = {
+        "hhid_2": "character varying", "survey_year": "integer",
+        "submission_date": "timestamp without time zone", "district": "character varying",
+        "hh_size": "integer",
+    }
+    money = ["asp_actual_income", "cereals_week", "tubers_week", "medical_care_annual"]
+    yields = [f"sn_1_crop{i}_total_yield" for i in range(8)]
+    for col in money + yields:
+        values = np.round(rng.gamma(2.0, 5000.0, rows), 2)
+        values[rng.random(rows) < 0.1] = np.nan
+        df[col] = values
+        column_types[col] = "numeric"
+    return df, column_types
+
+def _timed(func) -> float:
+    started = time.perf_counter()
+    func()
+    return round(time.perf_counter() - started, 3)
+
+def benchmark(rows: int = 1_000_000, dsn: Optional[str] = None) -> Dict[str, Dict[str, float]]:
+    """Compare binary COPY with text COPY and execute_values.
+
+    Encoding is always timed; with a DSN each method also loads the frame
+    into a temporary table, so the server-side parsing cost is included.
+
+    Args:
+        rows: Synthetic rows
+        dsn: PostgreSQL connection string
+
+    Returns:
+        Dict[str, Dict[str, float]]: Seconds and payload bytes per method
+    """
+    df, column_types = synthetic_survey_frame(rows)
+    columns = list(df.columns)
+    results = {"text_copy": {}, "binary_copy": {}, "execute_values": {}}
+
+    payloads = {}
+    results["text_copy"]["encode_seconds"] = _timed(lambda: payloads.update(text_copy=encode_csv(df)))
+    results["binary_copy"]["encode_seconds"] = _timed(
+        lambda: payloads.update(binary_copy=encode_binary(df, column_types)))
+    results["text_copy"]["payload_bytes"] = len(payloads["text_copy"].getvalue().encode("utf-8"))
+    results["binary_copy"]["payload_bytes"] = len(payloads["binary_copy"].getvalue())
+
+    if dsn:
+        definition = ", ".join(
+            f"{col} {'DECIMAL' if data_type == 'numeric' else data_type}" for col, data_type in column_types.items()
+        )
+        records = list(df.astype(object).where(df.notna(), None).itertuples(index=False, name=None))
+        loaders = {
+            "text_copy": lambda cur: copy_buffer(cur, "copy_benchmark", columns, encode_csv(df)),
+            "binary_copy": lambda cur: copy_binary(cur, "copy_benchmark", columns, encode_binary(df, column_types)),
+            "execute_values": lambda cur: execute_values(
+                cur, f"INSERT INTO copy_benchmark ({', '.join(columns)}) VALUES %s", records, page_size=10_000),
+        }
+        with psycopg2.connect(dsn) as conn:
+            for method, load in loaders.items():
+                with conn.cursor() as cur:
+                    cur.execute(f"CREATE TEMP TABLE copy_benchmark ({definition})")
+                    results[method]["load_seconds"] = _timed(lambda: load(cur))
+                    cur.execute("SELECT count(*) FROM copy_benchmark")
+                    if cur.fetchone()[0] != rows:
+                        raise RuntimeError(f"{method} loaded the wrong number of rows")
+                    cur.execute("DROP TABLE copy_benchmark")
+                conn.rollback()
+
+    logger.info(f"COPY benchmark over {rows} rows: {results}")
+    return results
+
+def main() -> None:
+    """Command line entry point: python -m lib.binary_copy --rows 1000000 [--dsn <dsn>]"""
+    parser = argparse.ArgumentParser(description="Benchmark binary COPY against text loads")
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--dsn", help="e.g. 'dbname=rtv user=postgres password=pass host=localhost'")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    print(json.dumps(benchmark(args.rows, args.dsn), indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+import io
+import logging
+from typing import Any, Dict, List, Optional
+
+import pandas as pd
+import psycopg2
+import pyarrow.parquet as pq
+
+logger = logging.getLogger(__name__)
+
+# PostgreSQL types that reject "3.0"-style text and need integer rendering
+INTEGER_TYPES = {"smallint", "integer", "bigint"}
+
+def get_column_types(cur: psycopg2.extensions.cursor, table_name: str) -> Dict[str, str]:
+    """Get the PostgreSQL data type of every column in a table.
+
+    Args:
+        cur: Open database cursor
+        table_name: Name of the table to inspect
+
+    Returns:
+        Dict[str, str]: Column name to information_schema data type, in table order
+    """
+    cur.execute("""
+        SELECT column_name, data_type
+        FROM information_schema.columns
+        WHERE table_name = %s
+        ORDER BY ordinal_position
+    """, (table_name,))
+    return {row[0]: row[1] for row in cur.fetchall()}
+
+def prepare_copy_frame(df: pd.DataFrame,
+                       column_map: Dict[str, str],
+                       column_types: Dict[str, str],
+                       constants: Optional[Dict[str, Any]] = None) -> pd.DataFrame:
+    """Select, rename and coerce source columns into a target table layout.
+
+    Source columns missing from the frame or the target table are skipped so
+    survey rounds with fewer columns still load.
+
+    Args:
+        df: Source DataFrame
+        column_map: Source column name to target column name
+        column_types: Target column types as returned by get_column_types
+        constants: Target columns filled with a single value (e.g. _source_file)
+
+    Returns:
+        pd.DataFrame: Frame whose columns are target column names
+    """
+    present = {
+        src: dst for src, dst in column_map.items()
+        if src in df.columns and dst in column_types
+    }
+    frame = df[list(present)].rename(columns=present)
+
+    for col in frame.columns:
+        data_type = column_types[col]
+        if data_type in INTEGER_TYPES or data_type == "boolean":
+            # Nullable ints keep 3 as "3" and render missing values as empty
+            if pd.api.types.is_float_dtype(frame[col]) or pd.api.types.is_bool_dtype(frame[col]):
+                frame[col] = frame[col].astype("Int64")
+
+    for col, value in (constants or {}).items():
+        frame[col] = value
+
+    return frame
+
+def copy_dataframe(cur: psycopg2.extensions.cursor, table_name: str, df: pd.DataFrame) -> int:
+    """Load a DataFrame into a table with a single COPY FROM STDIN.
+
+    Args:
+        cur: Open database cursor
+        table_name: Target table
+        df: Frame whose columns are target column names
+
+    Returns:
+        int: Number of rows copied
+    """
+    if df.empty:
+        return 0
+
+    copy_buffer(cur, table_name, list(df.columns), encode_csv(df))
+    return len(df)
+
+def encode_csv(df: pd.DataFrame) -> io.StringIO:
+    """Render a frame as a CSV-format COPY payload, rewound for reading.
+
+    Args:
+        df: Frame whose columns are target column names
+
+    Returns:
+        io.StringIO: Rows without a header line
+    """
+    buffer = io.StringIO()
+    # Unquoted empty fields are NULL in CSV-format COPY
+    df.to_csv(buffer, index=False, header=False)
+    buffer.seek(0)
+    return buffer
+
+def copy_buffer(cur: psycopg2.extensions.cursor, table_name: str, columns: List[str], buffer: Any) -> None:
+    """COPY an encoded CSV payload into a table.
+
+    Args:
+        cur: Open database cursor
+        table_name: Target table
+        columns: Target columns in payload order
+        buffer: Payload from encode_csv
+    """
+    cur.copy_expert(
+        f"COPY {table_name} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)",
+        buffer
+    )
+
+def copy_parquet(cur: psycopg2.extensions.cursor,
+                 table_name: str,
+                 source: Any,
+                 column_map: Dict[str, str],
+                 constants: Optional[Dict[str, Any]] = None,
+                 batch_size: int = 100_000) -> int:
+    """Stream a parquet file into a table batch by batch using COPY.
+
+    Only the mapped columns are decoded and at most batch_size rows are held
+    in memory at a time.
+
+    Args:
+        cur: Open database cursor
+        table_name: Target table
+        source: Path or file-like object readable by pyarrow
+        column_map: Source column name to target column name
+        constants: Target columns filled with a single value
+        batch_size: Rows per COPY batch
+
+    Returns:
+        int: Number of rows copied
+    """
+    column_types = get_column_types(cur, table_name)
+    if not column_types:
+        raise ValueError(f"Table {table_name} does not exist")
+
+    parquet_file = pq.ParquetFile(source)
+    columns = [col for col in column_map if col in parquet_file.schema_arrow.names]
+
+    rows = 0
+    for batch in parquet_file.iter_batches(batch_size=batch_size, columns=columns):
+        frame = prepare_copy_frame(batch.to_pandas(), column_map, column_types, constants)
+        rows += copy_dataframe(cur, table_name, frame)
+
+    logger.info(f"Copied {rows} rows into {table_name}")
+    return rows
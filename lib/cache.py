@@ -0,0 +1,137 @@
+import hashlib
+import logging
+import os
+import threading
+from collections import OrderedDict
+from typing import Callable, List, Optional, Sequence, Union
+
+import pandas as pd
+import pyarrow as pa
+
+from lib.parquet_reader import Filter, read_parquet_selective
+from lib.storage import local_path
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_BYTES = 10 * 1024 ** 3
+
+class ObjectCache:
+    """Read-through local disk cache for data lake objects.
+
+    Files are keyed by object name plus ETag, so a changed object is fetched
+    again while an unchanged one costs a single HEAD request. Total size is
+    bounded and the least recently used files are evicted first; recency is
+    kept in file mtimes so it survives restarts.
+    """
+
+    def __init__(self, directory: str, max_bytes: int = DEFAULT_CACHE_BYTES):
+        """Open the cache, indexing files left by earlier runs.
+
+        Args:
+            directory: Local directory holding cached files
+            max_bytes: Size limit of the cache
+        """
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._files: "OrderedDict[str, int]" = OrderedDict()
+        os.makedirs(directory, exist_ok=True)
+
+        existing = []
+        for name in os.listdir(directory):
+            path = os.path.join(directory, name)
+            if name.endswith(".part"):
+                os.remove(path)  # interrupted download
+            elif os.path.isfile(path):
+                stat = os.stat(path)
+                existing.append((stat.st_mtime, path, stat.st_size))
+        for _, path, size in sorted(existing):
+            self._files[path] = size
+        self._size = sum(self._files.values())
+        logger.info(f"Opened object cache at {directory} with {len(self._files)} files")
+
+    @classmethod
+    def from_env(cls) -> Optional["ObjectCache"]:
+        """Build a cache from LAKE_CACHE_DIR and LAKE_CACHE_MAX_BYTES, if set."""
+        directory = os.getenv("LAKE_CACHE_DIR")
+        if not directory:
+            return None
+        return cls(directory, int(os.getenv("LAKE_CACHE_MAX_BYTES", DEFAULT_CACHE_BYTES)))
+
+    def _key_prefix(self, bucket: str, object_name: str) -> str:
+        """File name prefix shared by every version of an object."""
+        return hashlib.sha1(f"{bucket}/{object_name}".encode()).hexdigest()
+
+    def get_path(self, client, bucket: str, object_name: str) -> str:
+        """Get a local path for an object, downloading it on a miss.
+
+        Args:
+            client: MinIO client
+            bucket: Bucket name
+            object_name: Object name
+
+        Returns:
+            str: Path of the cached copy
+        """
+        path = local_path(client, bucket, object_name)
+        if path is not None:
+            return path  # already on local disk, nothing to cache
+
+        etag = client.stat_object(bucket, object_name).etag.strip('"')
+        prefix = self._key_prefix(bucket, object_name)
+        path = os.path.join(self.directory, f"{prefix}-{etag}")
+
+        with self._lock:
+            if path in self._files:
+                self._files.move_to_end(path)
+                os.utime(path)
+                return path
+
+        # Download outside the lock so other objects can be served meanwhile
+        partial = f"{path}.{threading.get_ident()}.part"
+        client.fget_object(bucket, object_name, partial)
+        size = os.path.getsize(partial)
+        os.replace(partial, path)
+
+        with self._lock:
+            # Older versions of the object can never be hit again
+            for stale in [p for p in self._files if os.path.basename(p).startswith(f"{prefix}-") and p != path]:
+                self._evict(stale)
+            if path not in self._files:
+                self._files[path] = size
+                self._size += size
+            self._files.move_to_end(path)
+            while self._size > self.max_bytes and len(self._files) > 1:
+                self._evict(next(iter(self._files)))
+
+        logger.info(f"Cached {object_name} ({size} bytes)")
+        return path
+
+    def _evict(self, path: str) -> None:
+        """Remove a cached file. Caller holds the lock."""
+        self._size -= self._files.pop(path)
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def read_parquet(self,
+                     client,
+                     bucket: str,
+                     object_name: str,
+                     columns: Union[List[str], Callable[[str], bool], None] = None,
+                     filters: Optional[Sequence[Filter]] = None) -> pd.DataFrame:
+        """Read a parquet object through the cache with a memory-mapped file.
+
+        Args:
+            client: MinIO client
+            bucket: Bucket name
+            object_name: Object name
+            columns: Columns to read, or a predicate over names; None reads all
+            filters: (column, op, value) conditions rows must meet
+
+        Returns:
+            pd.DataFrame: Matching rows of the selected columns
+        """
+        path = self.get_path(client, bucket, object_name)
+        return read_parquet_selective(pa.memory_map(path), columns=columns, filters=filters)
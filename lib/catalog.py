@@ -0,0 +1,449 @@
+import argparse
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Dict, Iterable, List, Optional, Sequence
+
+from lib.file_stats import BloomFilter, FileStats
+from lib.parquet_reader import Filter
+
+logger = logging.getLogger(__name__)
+
+@dataclass
+class CatalogEntry:
+    """One object recorded in the lake catalog."""
+    bucket: str
+    object_name: str
+    size: int
+    last_modified: datetime
+    etag: Optional[str] = None
+    content_hash: Optional[str] = None
+    survey_year: Optional[int] = None
+    metadata: Optional[Dict] = None
+    # Blob holding the contents when this entry is only a reference to it
+    target: Optional[str] = None
+
+    @property
+    def prefix(self) -> str:
+        """Directory part of the object name."""
+        return self.object_name.rsplit("/", 1)[0] if "/" in self.object_name else ""
+
+def survey_year_from(object_name: str, metadata: Optional[Dict] = None) -> Optional[int]:
+    """Find the survey year of an object from its metadata or name.
+
+    Args:
+        object_name: Object name, e.g. raw/survey_2021_... or .../survey_year=2021/...
+        metadata: User metadata stored with the object
+
+    Returns:
+        Optional[int]: Survey year if one can be found
+    """
+    for key, value in (metadata or {}).items():
+        if key.lower().endswith("survey_year") and str(value).isdigit():
+            return int(value)
+    match = re.search(r"survey_(?:year=)?(\d{4})", object_name)
+    return int(match.group(1)) if match else None
+
+class LakeCatalog:
+    """SQLite index of the objects stored in the data lake.
+
+    Lookups that would otherwise need a paginated bucket listing become
+    indexed queries: object names are the primary key, so prefix queries
+    are range scans, and latest-version queries walk a (bucket, prefix,
+    last_modified) index over each object's directory.
+    """
+
+    def __init__(self, path: str):
+        """Open (and create if needed) the catalog database.
+
+        Args:
+            path: Path to the SQLite file
+        """
+        self.path = path
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        self._init_catalog_table()
+        logger.info(f"Initialized LakeCatalog at {path}")
+
+    @classmethod
+    def from_env(cls) -> Optional["LakeCatalog"]:
+        """Open the catalog at LAKE_CATALOG_PATH, if set."""
+        path = os.getenv("LAKE_CATALOG_PATH")
+        return cls(path) if path else None
+
+    def _init_catalog_table(self) -> None:
+        """Create the catalog table and its indexes."""
+        with self._lock, self.conn:
+            self.conn.executescript("""
+                CREATE TABLE IF NOT EXISTS lake_objects (
+                    bucket TEXT NOT NULL,
+                    object_name TEXT NOT NULL,
+                    prefix TEXT NOT NULL,
+                    size INTEGER,
+                    etag TEXT,
+                    content_hash TEXT,
+                    survey_year INTEGER,
+                    metadata TEXT,
+                    last_modified TEXT,
+                    target TEXT,
+                    PRIMARY KEY (bucket, object_name)
+                );
+
+                CREATE INDEX IF NOT EXISTS idx_lake_objects_prefix
+                ON lake_objects(bucket, prefix, last_modified);
+
+                CREATE INDEX IF NOT EXISTS idx_lake_objects_year
+                ON lake_objects(bucket, survey_year, last_modified);
+
+                CREATE INDEX IF NOT EXISTS idx_lake_objects_hash
+                ON lake_objects(content_hash);
+
+                CREATE TABLE IF NOT EXISTS lake_file_stats (
+                    bucket TEXT NOT NULL,
+                    object_name TEXT NOT NULL,
+                    etag TEXT,
+                    row_count INTEGER,
+                    column_stats TEXT,
+                    bloom_column TEXT,
+                    bloom BLOB,
+                    bloom_bits INTEGER,
+                    bloom_hashes INTEGER,
+                    PRIMARY KEY (bucket, object_name)
+                );
+            """)
+            columns = [row[1] for row in self.conn.execute("PRAGMA table_info(lake_objects)")]
+            if "target" not in columns:
+                # Catalogs created before references existed
+                self.conn.execute("ALTER TABLE lake_objects ADD COLUMN target TEXT")
+            self.conn.execute("""
+                CREATE INDEX IF NOT EXISTS idx_lake_objects_target
+                ON lake_objects(bucket, target)
+            """)
+
+    def record(self, entry: CatalogEntry) -> None:
+        """Insert or replace the catalog row for an object.
+
+        Args:
+            entry: Object to record
+        """
+        with self._lock, self.conn:
+            self.conn.execute("""
+                INSERT OR REPLACE INTO lake_objects
+                (bucket, object_name, prefix, size, etag, content_hash,
+                 survey_year, metadata, last_modified, target)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """, self._to_row(entry))
+
+    def remove(self, bucket: str, object_name: str) -> None:
+        """Drop an object from the catalog.
+
+        Args:
+            bucket: Bucket name
+            object_name: Object name
+        """
+        with self._lock, self.conn:
+            for table in ("lake_objects", "lake_file_stats"):
+                self.conn.execute(
+                    f"DELETE FROM {table} WHERE bucket = ? AND object_name = ?",
+                    (bucket, object_name)
+                )
+
+    def record_stats(self, bucket: str, object_name: str, stats: FileStats, etag: Optional[str] = None) -> None:
+        """Store the column stats and bloom filter of a parquet object.
+
+        Args:
+            bucket: Bucket name
+            object_name: Object name
+            stats: Stats of the object's contents
+            etag: ETag the stats were computed for
+        """
+        bloom = stats.bloom
+        with self._lock, self.conn:
+            self.conn.execute("""
+                INSERT OR REPLACE INTO lake_file_stats
+                (bucket, object_name, etag, row_count, column_stats,
+                 bloom_column, bloom, bloom_bits, bloom_hashes)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """, (
+                bucket,
+                object_name,
+                etag,
+                stats.row_count,
+                json.dumps(stats.column_stats),
+                stats.bloom_column,
+                bloom.to_bytes() if bloom else None,
+                bloom.num_bits if bloom else None,
+                bloom.num_hashes if bloom else None
+            ))
+
+    def get_stats(self, bucket: str, object_names: Sequence[str]) -> Dict[str, FileStats]:
+        """Look up the stats of several objects.
+
+        Args:
+            bucket: Bucket name
+            object_names: Objects to look up
+
+        Returns:
+            Dict[str, FileStats]: Stats of the objects that have any
+        """
+        stats = {}
+        with self._lock:
+            for start in range(0, len(object_names), 500):
+                batch = list(object_names[start:start + 500])
+                rows = self.conn.execute(f"""
+                    SELECT object_name, row_count, column_stats, bloom_column,
+                           bloom, bloom_bits, bloom_hashes
+                    FROM lake_file_stats
+                    WHERE bucket = ? AND object_name IN ({", ".join("?" * len(batch))})
+                """, [bucket] + batch).fetchall()
+                for name, row_count, column_stats, bloom_column, bloom, bits, hashes in rows:
+                    stats[name] = FileStats(
+                        row_count=row_count,
+                        column_stats=json.loads(column_stats) if column_stats else {},
+                        bloom_column=bloom_column,
+                        bloom=BloomFilter.from_bytes(bloom, bits, hashes) if bloom else None
+                    )
+        return stats
+
+    def prune(self, bucket: str, object_names: Sequence[str], filters: Sequence[Filter]) -> List[str]:
+        """Drop the objects whose stats show no row can match the filters.
+
+        Objects without recorded stats are always kept.
+
+        Args:
+            bucket: Bucket name
+            object_names: Candidate objects
+            filters: (column, op, value) conditions
+
+        Returns:
+            List[str]: Objects that may hold matching rows, in input order
+        """
+        if not filters:
+            return list(object_names)
+        stats = self.get_stats(bucket, object_names)
+        kept = [
+            name for name in object_names
+            if name not in stats or stats[name].may_match(filters)
+        ]
+        logger.debug(f"Pruned {len(object_names) - len(kept)}/{len(object_names)} files")
+        return kept
+
+    def get(self, bucket: str, object_name: str) -> Optional[CatalogEntry]:
+        """Look up a single object.
+
+        Args:
+            bucket: Bucket name
+            object_name: Object name
+
+        Returns:
+            Optional[CatalogEntry]: The entry, or None if not catalogued
+        """
+        rows = self._query(
+            "WHERE bucket = ? AND object_name = ?", (bucket, object_name)
+        )
+        return rows[0] if rows else None
+
+    def list(self, bucket: str, prefix: str = "") -> List[CatalogEntry]:
+        """List catalogued objects whose name starts with prefix.
+
+        Args:
+            bucket: Bucket name
+            prefix: Object name prefix
+
+        Returns:
+            List[CatalogEntry]: Matching entries ordered by object name
+        """
+        return self._query(
+            "WHERE bucket = ? AND object_name >= ? AND object_name < ? ORDER BY object_name",
+            (bucket, prefix, prefix + "\U0010ffff")
+        )
+
+    def latest(self, bucket: str, prefix: str = "") -> Optional[CatalogEntry]:
+        """Get the most recently modified object whose name starts with prefix.
+
+        Objects directly in the prefix's directory are read newest first
+        from the (bucket, prefix, last_modified) index, stopping at the first
+        name that matches. Objects in subdirectories under the prefix are a
+        range of that index and are sorted, so only they cost a sort.
+
+        Args:
+            bucket: Bucket name
+            prefix: Object name prefix
+
+        Returns:
+            Optional[CatalogEntry]: The latest entry, or None if there is none
+        """
+        directory = prefix.rsplit("/", 1)[0] if "/" in prefix else ""
+        end = prefix + "\U0010ffff"
+        rows = self._query("""
+            WHERE rowid IN (
+                SELECT rowid FROM (
+                    SELECT rowid FROM lake_objects INDEXED BY idx_lake_objects_prefix
+                    WHERE bucket = ? AND prefix = ? AND object_name >= ? AND object_name < ?
+                    ORDER BY last_modified DESC LIMIT 1
+                )
+                UNION ALL
+                SELECT rowid FROM (
+                    SELECT rowid FROM lake_objects
+                    WHERE bucket = ? AND prefix >= ? AND prefix < ?
+                    ORDER BY last_modified DESC LIMIT 1
+                )
+            )
+            ORDER BY last_modified DESC LIMIT 1
+        """, (bucket, directory, prefix, end, bucket, prefix, end))
+        return rows[0] if rows else None
+
+    def find_by_hash(self, content_hash: str) -> List[CatalogEntry]:
+        """Find objects with the given content hash.
+
+        Args:
+            content_hash: Hex SHA-256 of the object contents
+
+        Returns:
+            List[CatalogEntry]: Matching entries
+        """
+        return self._query("WHERE content_hash = ?", (content_hash,))
+
+    def references(self, bucket: str, target: str) -> List[CatalogEntry]:
+        """Find the reference entries pointing at a blob.
+
+        Args:
+            bucket: Bucket name
+            target: Object name of the blob
+
+        Returns:
+            List[CatalogEntry]: Entries whose contents live in target
+        """
+        return self._query("WHERE bucket = ? AND target = ?", (bucket, target))
+
+    def reconcile(self, bucket: str, entries: Iterable[CatalogEntry]) -> Dict[str, int]:
+        """Rebuild a bucket's catalog rows from a full listing.
+
+        Content hashes of objects whose ETag has not changed are kept, since
+        a listing cannot supply them without downloading every object.
+        References only exist in the catalog, so they are kept as long as
+        their blob is still in the bucket.
+
+        Args:
+            bucket: Bucket name
+            entries: Every object currently in the bucket
+
+        Returns:
+            Dict[str, int]: Counts of added, updated and removed entries
+        """
+        existing = {entry.object_name: entry for entry in self.list(bucket)}
+        references = [entry for entry in existing.values() if entry.target]
+        for entry in references:
+            del existing[entry.object_name]
+        stats = {"added": 0, "updated": 0, "removed": 0}
+        rows = []
+        listed = set()
+        for entry in entries:
+            listed.add(entry.object_name)
+            old = existing.pop(entry.object_name, None)
+            if old is None:
+                stats["added"] += 1
+            else:
+                if old.etag == entry.etag:
+                    entry.content_hash = entry.content_hash or old.content_hash
+                    entry.metadata = entry.metadata or old.metadata
+                if (old.etag, old.size) != (entry.etag, entry.size):
+                    stats["updated"] += 1
+            if entry.survey_year is None:
+                entry.survey_year = survey_year_from(entry.object_name, entry.metadata)
+            rows.append(self._to_row(entry))
+        kept = [entry for entry in references if entry.target in listed]
+        rows.extend(self._to_row(entry) for entry in kept)
+        stats["removed"] = len(existing) + len(references) - len(kept)
+
+        with self._lock, self.conn:
+            self.conn.execute("DELETE FROM lake_objects WHERE bucket = ?", (bucket,))
+            self.conn.executemany("""
+                INSERT INTO lake_objects
+                (bucket, object_name, prefix, size, etag, content_hash,
+                 survey_year, metadata, last_modified, target)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """, rows)
+            # Stats of objects that are gone or were overwritten are stale
+            self.conn.execute("""
+                DELETE FROM lake_file_stats
+                WHERE bucket = ? AND NOT EXISTS (
+                    SELECT 1 FROM lake_objects o
+                    WHERE o.bucket = lake_file_stats.bucket
+                      AND o.object_name = lake_file_stats.object_name
+                      AND (lake_file_stats.etag IS NULL OR o.etag = lake_file_stats.etag)
+                )
+            """, (bucket,))
+
+        logger.info(f"Reconciled catalog for {bucket}: {stats}")
+        return stats
+
+    @staticmethod
+    def _to_row(entry: CatalogEntry) -> tuple:
+        """Convert an entry to a lake_objects row."""
+        return (
+            entry.bucket,
+            entry.object_name,
+            entry.prefix,
+            entry.size,
+            entry.etag,
+            entry.content_hash,
+            entry.survey_year,
+            json.dumps(entry.metadata) if entry.metadata else None,
+            # Stored in UTC so ordering by the ISO text is chronological
+            entry.last_modified.astimezone(timezone.utc).isoformat() if entry.last_modified else None,
+            entry.target
+        )
+
+    def _query(self, where: str, params: tuple) -> List[CatalogEntry]:
+        """Run a SELECT over lake_objects and build entries."""
+        with self._lock:
+            rows = self.conn.execute(f"""
+                SELECT bucket, object_name, size, last_modified, etag,
+                       content_hash, survey_year, metadata, target
+                FROM lake_objects
+                {where}
+            """, params).fetchall()
+        return [
+            CatalogEntry(
+                bucket=row[0],
+                object_name=row[1],
+                size=row[2],
+                last_modified=datetime.fromisoformat(row[3]) if row[3] else None,
+                etag=row[4],
+                content_hash=row[5],
+                survey_year=row[6],
+                metadata=json.loads(row[7]) if row[7] else None,
+                target=row[8]
+            )
+            for row in rows
+        ]
+
+def main() -> None:
+    """Command line entry point: python -m lib.catalog reconcile --bucket <bucket>"""
+    from lib.data_lake import DataLakeManager
+
+    parser = argparse.ArgumentParser(description="Manage the data lake catalog")
+    parser.add_argument("command", choices=["reconcile"])
+    parser.add_argument("--bucket", required=True)
+    parser.add_argument("--catalog", default=os.getenv("LAKE_CATALOG_PATH", "lake_catalog.db"))
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    lake = DataLakeManager(
+        os.getenv("MINIO_ENDPOINT", "localhost:9000"),
+        os.getenv("MINIO_ACCESS_KEY", "minioadmin"),
+        os.getenv("MINIO_SECRET_KEY", "minioadmin"),
+        args.bucket,
+        secure=os.getenv("MINIO_SECURE", "false").lower() == "true",
+        catalog_path=args.catalog
+    )
+    print(json.dumps(lake.reconcile_catalog(), indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,275 @@
+import hashlib
+import io
+import logging
+import os
+import re
+import uuid
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from lib.data_lake import DataLakeManager
+from lib.manifest import IngestionManifest
+
+logger = logging.getLogger(__name__)
+
+TARGET_FILE_BYTES = 256 * 1024 * 1024
+
+# Key sets rows are deduplicated on, first match wins: processed files carry
+# household_id/survey_round, raw survey exports hhid_2/survey_year
+DEDUPE_KEYS = [["household_id", "survey_round"], ["hhid_2", "survey_year"]]
+
+# Timestamp and compaction-run suffixes added to re-written objects
+_VERSION_SUFFIX = re.compile(r"(_?compacted_[0-9a-f]{32}|(_?compacted)?_\d{8}_\d{6})(-\d+)?$")
+
+@dataclass
+class LakeObject:
+    """An object considered for compaction."""
+    object_name: str
+    size: int
+    last_modified: datetime
+
+@dataclass
+class CompactionResult:
+    """Outcome of compacting one logical dataset."""
+    dataset: str
+    inputs: List[str]
+    outputs: List[str]
+    rows_in: int = 0
+    rows_out: int = 0
+    retired: List[str] = field(default_factory=list)
+
+def dataset_key(object_name: str, group_by_stem: bool) -> str:
+    """Name of the logical dataset an object belongs to.
+
+    Args:
+        object_name: Object name
+        group_by_stem: Group versions of one file (raw/survey_2021_<ts>.parquet)
+            rather than every file in a directory
+
+    Returns:
+        str: Directory, or directory plus version-less stem
+    """
+    directory, _, file_name = object_name.rpartition("/")
+    if not group_by_stem:
+        return directory
+    stem = _VERSION_SUFFIX.sub("", file_name[:-len(".parquet")])
+    return f"{directory}/{stem}"
+
+class Compactor:
+    """Merges small and duplicate parquet files into right-sized ones.
+
+    The small files of each logical dataset are read oldest first,
+    deduplicated so the newest version of a row wins, and written back as
+    files of about target_bytes. When the ingestion manifest has entries,
+    only files of the same source are merged, so re-ingesting a source
+    still replaces all of its rows. New files are written under names
+    unique to the run, then the manifest is switched over in a single PUT,
+    and only then are the inputs, and any objects the manifest marked
+    superseded, retired through DataLakeManager.delete_file. Readers going
+    through the manifest therefore see either the old or the new files,
+    never both. A dataset is held in memory while it is compacted.
+    """
+
+    def __init__(self,
+                 lake: DataLakeManager,
+                 target_bytes: int = TARGET_FILE_BYTES,
+                 dedupe_keys: Optional[List[List[str]]] = None):
+        """Initialize the compactor.
+
+        Args:
+            lake: Data lake to compact
+            target_bytes: Approximate size of the output files
+            dedupe_keys: Candidate key sets to deduplicate rows on
+        """
+        self.lake = lake
+        self.target_bytes = target_bytes
+        self.dedupe_keys = dedupe_keys or DEDUPE_KEYS
+
+    def plan(self, prefix: str, group_by_stem: bool = False) -> Dict[str, List[LakeObject]]:
+        """Find the datasets under a prefix that are worth compacting.
+
+        A dataset qualifies when it has at least two files and one of them
+        is smaller than half the target size.
+
+        Args:
+            prefix: Prefix to scan, e.g. "processed/"
+            group_by_stem: See dataset_key
+
+        Returns:
+            Dict[str, List[LakeObject]]: Dataset to its files, oldest first
+        """
+        datasets: Dict[str, List[LakeObject]] = {}
+        for obj in self.lake.client.list_objects(self.lake.bucket, prefix=prefix, recursive=True):
+            if not obj.object_name.endswith(".parquet"):
+                continue
+            datasets.setdefault(dataset_key(obj.object_name, group_by_stem), []).append(
+                LakeObject(obj.object_name, obj.size, obj.last_modified)
+            )
+
+        return {
+            dataset: sorted(objects, key=lambda obj: (obj.last_modified, obj.object_name))
+            for dataset, objects in datasets.items()
+            if len(objects) > 1 and any(obj.size < self.target_bytes / 2 for obj in objects)
+        }
+
+    def compact(self, prefix: str, group_by_stem: bool = False) -> List[CompactionResult]:
+        """Compact every qualifying dataset under a prefix.
+
+        Args:
+            prefix: Prefix to scan
+            group_by_stem: See dataset_key
+
+        Returns:
+            List[CompactionResult]: One result per compacted dataset
+        """
+        manifest = IngestionManifest(self.lake.client, self.lake.bucket)
+        results = []
+        for dataset, objects in self.plan(prefix, group_by_stem).items():
+            try:
+                results.append(self._compact_dataset(dataset, objects, manifest, group_by_stem))
+            except Exception as e:
+                logger.error(f"Failed to compact {dataset}: {e}")
+                raise
+        return results
+
+    def _compact_dataset(self,
+                         dataset: str,
+                         objects: List[LakeObject],
+                         manifest: IngestionManifest,
+                         group_by_stem: bool) -> CompactionResult:
+        """Merge, write, switch over and retire one dataset."""
+        groups, dead = self._split_sources(objects, manifest)
+        result = CompactionResult(dataset=dataset, inputs=[], outputs=[])
+
+        for group in groups:
+            # Files already near the target size are left where they are
+            small = [obj for obj in group if obj.size < self.target_bytes / 2]
+            if len(small) < 2:
+                continue
+            inputs = [obj.object_name for obj in small]
+            frames = [self.lake.read_parquet(name) for name in inputs]
+            df = pd.concat(frames, ignore_index=True)
+            rows_in = len(df)
+            keys = next((keys for keys in self.dedupe_keys if set(keys) <= set(df.columns)), None)
+            if keys:
+                df = df.drop_duplicates(subset=keys, keep="last")
+            else:
+                logger.warning(f"No dedupe keys in {dataset}, merging without deduplication")
+
+            bytes_per_row = sum(obj.size for obj in small) / max(rows_in, 1)
+            outputs = self._write(dataset, df, bytes_per_row, group_by_stem)
+            if manifest.entries:
+                manifest.replace_objects(inputs, outputs)
+            result.inputs += inputs
+            result.outputs += outputs
+            result.rows_in += rows_in
+            result.rows_out += len(df)
+
+        # Switch manifest readers over before anything disappears
+        if result.outputs and manifest.entries:
+            manifest.save()
+        written = set(result.outputs)
+        for object_name in result.inputs + dead:
+            if object_name not in written and self.lake.delete_file(object_name):
+                result.retired.append(object_name)
+        if result.retired and manifest.entries:
+            manifest.forget(result.retired)
+            manifest.save()
+
+        logger.info(
+            f"Compacted {dataset}: {len(objects)} files, {result.rows_in} rows -> "
+            f"{len(result.outputs)} files, {result.rows_out} rows"
+        )
+        return result
+
+    @staticmethod
+    def _split_sources(objects: List[LakeObject],
+                       manifest: IngestionManifest) -> Tuple[List[List[LakeObject]], List[str]]:
+        """Group the objects by the source they hold and find superseded ones.
+
+        Objects the manifest points at are grouped by the source files whose
+        rows they hold. Objects the manifest marked superseded are returned
+        for deletion rather than merged, so rows removed from a newer version
+        do not come back; any other object is left alone. A dataset the
+        manifest knows nothing about (raw/ versions) is one group.
+
+        Returns:
+            Tuple[List[List[LakeObject]], List[str]]: Groups that may be
+            merged, oldest first, and the superseded object names
+        """
+        sources = manifest.sources()
+        superseded = set(manifest.superseded)
+        if not any(obj.object_name in sources or obj.object_name in superseded for obj in objects):
+            return [objects], []
+        groups: Dict[Tuple[str, ...], List[LakeObject]] = {}
+        for obj in objects:
+            if obj.object_name in sources:
+                groups.setdefault(tuple(sorted(sources[obj.object_name])), []).append(obj)
+        dead = [obj.object_name for obj in objects if obj.object_name in superseded]
+        return list(groups.values()), dead
+
+    def _write(self, dataset: str, df: pd.DataFrame, bytes_per_row: float, group_by_stem: bool) -> List[str]:
+        """Write a dataset as parquet files of about target_bytes each."""
+        rows_per_file = max(1, int(self.target_bytes / max(bytes_per_row, 1)))
+        # Unique per run, so an output can never overwrite an input
+        run_id = uuid.uuid4().hex
+        base = f"{dataset}_compacted_{run_id}" if group_by_stem else f"{dataset}/compacted_{run_id}"
+
+        outputs = []
+        for part, start in enumerate(range(0, max(len(df), 1), rows_per_file)):
+            table = pa.Table.from_pandas(df.iloc[start:start + rows_per_file], preserve_index=False)
+            buffer = io.BytesIO()
+            pq.write_table(table, buffer, compression="snappy")
+            object_name = f"{base}-{part:05d}.parquet"
+            buffer.seek(0)
+            result = self.lake.client.put_object(
+                self.lake.bucket,
+                object_name,
+                buffer,
+                length=buffer.getbuffer().nbytes,
+                content_type="application/octet-stream"
+            )
+            self.lake._catalog_object(
+                object_name,
+                size=buffer.getbuffer().nbytes,
+                etag=getattr(result, "etag", None),
+                content_hash=hashlib.sha256(buffer.getbuffer()).hexdigest(),
+                parquet=buffer.getvalue()
+            )
+            outputs.append(object_name)
+        return outputs
+
+def compact_data_lake(minio_bucket: str,
+                      target_bytes: int = TARGET_FILE_BYTES) -> Dict[str, int]:
+    """Compact processed/ and the versioned files in raw/.
+
+    processed/ is compacted as one dataset per directory; raw/ only merges
+    versions of the same file so fixed-name exports are left alone.
+
+    Args:
+        minio_bucket: Bucket to compact
+        target_bytes: Approximate size of the output files
+
+    Returns:
+        Dict[str, int]: Statistics about the compaction
+    """
+    lake = DataLakeManager(
+        os.getenv("MINIO_ENDPOINT", "localhost:9000"),
+        os.getenv("MINIO_ACCESS_KEY", "minioadmin"),
+        os.getenv("MINIO_SECRET_KEY", "minioadmin"),
+        minio_bucket,
+        secure=os.getenv("MINIO_SECURE", "false").lower() == "true"
+    )
+    compactor = Compactor(lake, target_bytes=target_bytes)
+    results = compactor.compact("processed/") + compactor.compact("raw/", group_by_stem=True)
+    return {
+        "datasets_compacted": len(results),
+        "files_retired": sum(len(result.retired) for result in results),
+        "files_written": sum(len(result.outputs) for result in results),
+        "rows_removed": sum(result.rows_in - result.rows_out for result in results)
+    }
@@ -1,16 +1,99 @@
-from minio import Minio
-from datetime import datetime
+from datetime import datetime, timezone
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+import hashlib
+import io
 import os
 import json
-from typing import Dict, Optional
+import time
+import uuid
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple, Union
+from urllib.parse import quote, unquote
 import logging
 
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import certifi
+import urllib3
+
+from lib.cache import DEFAULT_CACHE_BYTES, ObjectCache
+from lib.catalog import CatalogEntry, LakeCatalog, survey_year_from
+from lib.file_stats import parquet_file_stats
+from lib.manifest import file_sha256
+from lib.parquet_reader import Filter, read_parquet_selective
+from lib.storage import ObjectStore, create_storage_client, open_object
+
 logger = logging.getLogger(__name__)
 
+# Partition value written for nulls, as in Hive
+NULL_PARTITION = "__HIVE_DEFAULT_PARTITION__"
+
+def _partition_path(partition_cols: List[str], values: tuple) -> str:
+    """Render partition values as a key=value/... path."""
+    return "/".join(
+        f"{col}={NULL_PARTITION if pd.isna(value) else quote(str(value), safe='')}"
+        for col, value in zip(partition_cols, values)
+    )
+
+def _parse_partition_path(object_name: str) -> Dict[str, Optional[str]]:
+    """Extract key=value partition values from an object name."""
+    values = {}
+    for part in object_name.split("/")[:-1]:
+        if "=" in part:
+            key, value = part.split("=", 1)
+            values[key] = None if value == NULL_PARTITION else unquote(value)
+    return values
+
+def _matches(values: Dict[str, Optional[str]], filters: Dict[str, Any]) -> bool:
+    """Check partition values against equality or membership filters."""
+    for col, wanted in filters.items():
+        if col not in values:
+            continue
+        accepted = wanted if isinstance(wanted, (list, tuple, set)) else [wanted]
+        if values[col] not in {None if w is None else str(w) for w in accepted}:
+            return False
+    return True
+
+@dataclass
+class TransferStats:
+    """Totals for a batch of uploads or downloads."""
+    objects: int = 0
+    bytes: int = 0
+    seconds: float = 0.0
+    failed: List[str] = field(default_factory=list)
+    
+    @property
+    def throughput_mb_s(self) -> float:
+        """Average throughput in MiB per second."""
+        return self.bytes / 1024 ** 2 / self.seconds if self.seconds else 0.0
+
+def _http_client(max_concurrency: int) -> urllib3.PoolManager:
+    """Shared connection pool sized for max_concurrency parallel requests.
+    
+    Mirrors the MinIO client's own defaults but keeps enough connections
+    alive that parallel parts and ranges reuse them instead of reconnecting.
+    """
+    return urllib3.PoolManager(
+        timeout=urllib3.Timeout(connect=30, read=300),
+        maxsize=max_concurrency,
+        cert_reqs="CERT_REQUIRED",
+        ca_certs=os.environ.get("SSL_CERT_FILE") or certifi.where(),
+        retries=urllib3.Retry(total=5, backoff_factor=0.2, status_forcelist=[500, 502, 503, 504])
+    )
+
+# Blobs of the content-addressed store live at blobs/sha256/<first two hex digits>/<digest>
+BLOB_PREFIX = "blobs/sha256"
+
 class DataLakeManager:
     """Manages interactions with the data lake (MinIO) including versioning and metadata."""
     
-    def __init__(self, endpoint: str, access_key: str, secret_key: str, bucket_name: str, secure: bool = True):
+    def __init__(self, endpoint: str, access_key: str, secret_key: str, bucket_name: str, secure: bool = True,
+                 catalog_path: Optional[str] = None, cache_dir: Optional[str] = None,
+                 cache_max_bytes: int = DEFAULT_CACHE_BYTES, max_concurrency: int = 8,
+                 part_size: int = 64 * 1024 * 1024, multipart_threshold: int = 128 * 1024 * 1024,
+                 client: Optional[ObjectStore] = None, backend: Optional[str] = None,
+                 content_addressed: Optional[bool] = None):
         """Initialize the data lake manager.
         
         Args:
@@ -19,9 +102,39 @@ class DataLakeManager:
             secret_key: MinIO secret key
             bucket_name: Name of the bucket to use
             secure: Whether to use HTTPS
+            catalog_path: SQLite file of the lake catalog; defaults to
+                LAKE_CATALOG_PATH, and without either lookups list the bucket
+            cache_dir: Local directory for the read-through object cache;
+                defaults to LAKE_CACHE_DIR, and without either reads go
+                straight to MinIO
+            cache_max_bytes: Size limit of the object cache
+            max_concurrency: Parallel transfers, multipart parts and ranged GETs
+            part_size: Part and range size for large objects
+            multipart_threshold: Objects at least this big use large-object mode
+            client: Client to use instead of connecting to endpoint, e.g. an
+                in-process fake
+            backend: Storage backend, "minio" or "local"; defaults to
+                STORAGE_BACKEND, see lib.storage.create_storage_client
+            content_addressed: Store raw files once per SHA-256 under
+                blobs/ with catalog references at their dated paths;
+                defaults to LAKE_CONTENT_ADDRESSED and needs the catalog
         """
-        self.client = Minio(endpoint, access_key, secret_key, secure=secure)
+        self.client = client or create_storage_client(
+            backend, endpoint, access_key, secret_key, secure,
+            http_client=_http_client(max_concurrency)
+        )
         self.bucket = bucket_name
+        self.max_concurrency = max_concurrency
+        self.part_size = part_size
+        self.multipart_threshold = multipart_threshold
+        catalog_path = catalog_path or os.getenv("LAKE_CATALOG_PATH")
+        self.catalog = LakeCatalog(catalog_path) if catalog_path else None
+        self.cache = ObjectCache(cache_dir, cache_max_bytes) if cache_dir else ObjectCache.from_env()
+        if content_addressed is None:
+            content_addressed = os.getenv("LAKE_CONTENT_ADDRESSED", "false").lower() == "true"
+        if content_addressed and self.catalog is None:
+            raise ValueError("Content-addressed storage needs a lake catalog to hold its references")
+        self.content_addressed = content_addressed
         self._ensure_bucket()
         logger.info(f"Initialized DataLakeManager for bucket: {bucket_name}")
     
@@ -59,17 +172,478 @@ class DataLakeManager:
             })
             
             # Store the file
-            self.client.fput_object(
+            if self.content_addressed:
+                self.store_blob(file_path, object_name, metadata=metadata)
+            else:
+                self.upload_file(file_path, object_name, metadata=metadata)
+            logger.info(f"Stored {file_name} as {object_name}")
+            return object_name
+            
+        except Exception as e:
+            logger.error(f"Failed to store {file_path}: {e}")
+            raise
+    
+    def store_blob(self,
+                   file_path: str,
+                   object_name: str,
+                   metadata: Optional[Dict] = None,
+                   content_hash: Optional[str] = None) -> str:
+        """Store a file once per content and reference it as object_name.
+        
+        The file goes to blobs/sha256/<hash> unless a blob with that hash is
+        already there, in which case nothing is uploaded. object_name becomes
+        a catalog entry pointing at the blob, which reads of object_name
+        through this manager resolve.
+        
+        Args:
+            file_path: Path to the file to store
+            object_name: Name the file is stored under, e.g. raw/<date>/<name>
+            metadata: Metadata of this reference (and of a new blob)
+            content_hash: SHA-256 of the file, if the caller already has it
+            
+        Returns:
+            str: Object name of the blob
+        """
+        content_hash = content_hash or file_sha256(file_path)
+        blob_name = f"{BLOB_PREFIX}/{content_hash[:2]}/{content_hash}"
+        blob = self.catalog.get(self.bucket, blob_name)
+        if blob is None:
+            self.upload_file(file_path, blob_name, metadata=metadata, content_hash=content_hash)
+            blob = self.catalog.get(self.bucket, blob_name)
+        else:
+            logger.info(f"{file_path} is already stored as {blob_name}, recording a reference only")
+        
+        self.catalog.record(CatalogEntry(
+            bucket=self.bucket,
+            object_name=object_name,
+            size=blob.size,
+            last_modified=datetime.now(timezone.utc),
+            etag=blob.etag,
+            content_hash=content_hash,
+            survey_year=survey_year_from(object_name, metadata),
+            metadata=metadata,
+            target=blob_name
+        ))
+        return blob_name
+    
+    def resolve(self, object_name: str) -> str:
+        """Get the object holding the contents of object_name.
+        
+        Args:
+            object_name: Object or reference name
+            
+        Returns:
+            str: The blob for a content-addressed reference, otherwise
+            object_name itself
+        """
+        if self.catalog is None:
+            return object_name
+        entry = self.catalog.get(self.bucket, object_name)
+        return entry.target if entry is not None and entry.target else object_name
+    
+    def upload_file(self,
+                    file_path: str,
+                    object_name: str,
+                    metadata: Optional[Dict] = None,
+                    content_hash: Optional[str] = None) -> int:
+        """Upload a file, using parallel multipart parts for large files.
+        
+        Args:
+            file_path: Path to the file to upload
+            object_name: Name of the object in the bucket
+            metadata: Metadata to store with the object
+            content_hash: SHA-256 of the file, if the caller already has it
+            
+        Returns:
+            int: Bytes uploaded
+        """
+        size = os.path.getsize(file_path)
+        if size >= self.multipart_threshold:
+            result = self.client.fput_object(
                 self.bucket,
                 object_name,
                 file_path,
-                metadata=metadata
+                metadata=metadata,
+                part_size=self.part_size,
+                num_parallel_uploads=self.max_concurrency
             )
-            logger.info(f"Stored {file_name} as {object_name}")
-            return object_name
+        else:
+            result = self.client.fput_object(self.bucket, object_name, file_path, metadata=metadata)
+        
+        self._catalog_object(
+            object_name,
+            size=size,
+            etag=result.etag,
+            content_hash=content_hash or (file_sha256(file_path) if self.catalog is not None else None),
+            metadata=metadata,
+            parquet=file_path if object_name.endswith(".parquet") else None
+        )
+        return size
+    
+    def download_file(self, object_name: str, file_path: str) -> int:
+        """Download an object, using parallel byte-range GETs for large objects.
+        
+        Every range is requested with If-Match on the ETag seen up front, so
+        an object replaced mid-download fails instead of mixing versions.
+        
+        Args:
+            object_name: Name of the object in the bucket
+            file_path: Local path to write to
+            
+        Returns:
+            int: Bytes downloaded
+        """
+        object_name = self.resolve(object_name)
+        stat = self.client.stat_object(self.bucket, object_name)
+        if stat.size < self.multipart_threshold:
+            self.client.fget_object(self.bucket, object_name, file_path)
+            return stat.size
+        
+        partial = f"{file_path}.part"
+        ranges = [
+            (offset, min(self.part_size, stat.size - offset))
+            for offset in range(0, stat.size, self.part_size)
+        ]
+        
+        def fetch(offset: int, length: int) -> None:
+            response = self.client.get_object(
+                self.bucket, object_name, offset=offset, length=length,
+                request_headers={"If-Match": stat.etag}
+            )
+            try:
+                position = offset
+                for chunk in response.stream(1024 * 1024):
+                    position += os.pwrite(fd, chunk, position)
+            finally:
+                response.close()
+                response.release_conn()
+        
+        fd = os.open(partial, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+        try:
+            os.ftruncate(fd, stat.size)
+            with ThreadPoolExecutor(max_workers=self.max_concurrency) as pool:
+                for future in [pool.submit(fetch, offset, length) for offset, length in ranges]:
+                    future.result()
+        except Exception:
+            os.close(fd)
+            os.remove(partial)
+            raise
+        os.close(fd)
+        os.replace(partial, file_path)
+        return stat.size
+    
+    def upload_many(self, files: List[Tuple[str, str]], metadata: Optional[Dict] = None) -> TransferStats:
+        """Upload several files concurrently.
+        
+        Args:
+            files: (local path, object name) pairs
+            metadata: Metadata stored with every object
+            
+        Returns:
+            TransferStats: Bytes, timing and failed object names
+        """
+        return self._transfer_many(
+            [(object_name, lambda src=src, dst=object_name: self.upload_file(src, dst, metadata=dict(metadata or {})))
+             for src, object_name in files],
+            "Uploaded"
+        )
+    
+    def download_many(self, objects: List[Tuple[str, str]]) -> TransferStats:
+        """Download several objects concurrently.
+        
+        Args:
+            objects: (object name, local path) pairs
+            
+        Returns:
+            TransferStats: Bytes, timing and failed object names
+        """
+        return self._transfer_many(
+            [(object_name, lambda src=object_name, dst=dst: self.download_file(src, dst))
+             for object_name, dst in objects],
+            "Downloaded"
+        )
+    
+    def _transfer_many(self, transfers: List[Tuple[str, Any]], verb: str) -> TransferStats:
+        """Run transfer callables in a thread pool and total the results."""
+        stats = TransferStats()
+        start = time.monotonic()
+        with ThreadPoolExecutor(max_workers=self.max_concurrency) as pool:
+            futures = [(name, pool.submit(transfer)) for name, transfer in transfers]
+            for name, future in futures:
+                try:
+                    stats.bytes += future.result()
+                    stats.objects += 1
+                except Exception as e:
+                    logger.error(f"Failed to transfer {name}: {e}")
+                    stats.failed.append(name)
+        stats.seconds = time.monotonic() - start
+        
+        logger.info(
+            f"{verb} {stats.objects} objects, {stats.bytes} bytes in {stats.seconds:.2f}s "
+            f"({stats.throughput_mb_s:.1f} MiB/s), {len(stats.failed)} failed"
+        )
+        return stats
+    
+    def store_partitioned_data(self,
+                               df: pd.DataFrame,
+                               dataset: str,
+                               partition_cols: Optional[List[str]] = None,
+                               compression: str = "snappy",
+                               row_group_size: int = 100_000,
+                               overwrite: bool = False) -> List[str]:
+        """Store a DataFrame as a Hive-partitioned parquet dataset.
+        
+        Each partition is written to <dataset>/<col>=<value>/.../part-*.parquet
+        with the partition columns dropped from the file, so readers can skip
+        whole partitions from the object name alone.
+        
+        Args:
+            df: Data to store
+            dataset: Prefix of the dataset in the bucket, e.g. "raw/survey"
+            partition_cols: Columns to partition by, outermost first
+            compression: Parquet codec (snappy, zstd, gzip, brotli, lz4 or none)
+            row_group_size: Maximum rows per row group
+            overwrite: Replace the existing files of every partition written
+            
+        Returns:
+            List[str]: Object names written
+        """
+        partition_cols = partition_cols or ["survey_year", "district"]
+        missing = [col for col in partition_cols if col not in df.columns]
+        if missing:
+            raise ValueError(f"Partition columns not in data: {missing}")
+        
+        written = []
+        replaced = []
+        try:
+            for values, part in df.groupby(partition_cols, dropna=False, observed=True, sort=True):
+                prefix = f"{dataset}/{_partition_path(partition_cols, values)}/"
+                if overwrite:
+                    replaced.extend(self.list_files(prefix))
+                
+                table = pa.Table.from_pandas(part.drop(columns=partition_cols), preserve_index=False)
+                buffer = io.BytesIO()
+                pq.write_table(table, buffer, compression=compression, row_group_size=row_group_size)
+                object_name = f"{prefix}part-{datetime.now().strftime('%Y%m%d%H%M%S')}-{uuid.uuid4().hex[:8]}.parquet"
+                buffer.seek(0)
+                result = self.client.put_object(
+                    self.bucket,
+                    object_name,
+                    buffer,
+                    length=buffer.getbuffer().nbytes,
+                    content_type="application/octet-stream"
+                )
+                self._catalog_object(
+                    object_name,
+                    size=buffer.getbuffer().nbytes,
+                    etag=getattr(result, "etag", None),
+                    content_hash=hashlib.sha256(buffer.getbuffer()).hexdigest(),
+                    parquet=buffer.getvalue()
+                )
+                written.append(object_name)
+            
+            # Old files go only after every new one is in place
+            for object_name in replaced:
+                self.delete_file(object_name)
+                
+            logger.info(f"Stored {len(df)} rows in {len(written)} partitions under {dataset}")
+            return written
             
         except Exception as e:
-            logger.error(f"Failed to store {file_path}: {e}")
+            logger.error(f"Failed to store partitioned data under {dataset}: {e}")
+            raise
+    
+    def read_partitioned_data(self,
+                              dataset: str,
+                              filters: Optional[Dict[str, Any]] = None,
+                              columns: Optional[List[str]] = None,
+                              row_filters: Optional[Sequence[Filter]] = None) -> pd.DataFrame:
+        """Read a Hive-partitioned dataset, downloading only matching partitions.
+        
+        Args:
+            dataset: Prefix of the dataset in the bucket
+            filters: Partition column to a value or list of accepted values,
+                e.g. {"survey_year": 2021, "district": ["Kanungu", "Mitooma"]}
+            columns: Data columns to read; partition columns are always added
+            row_filters: (column, op, value) conditions on data columns; files
+                whose catalog stats rule them out are skipped
+            
+        Returns:
+            pd.DataFrame: Rows of the matching partitions
+        """
+        filters = filters or {}
+        frames = []
+        try:
+            partition_cols = []
+            object_names = self._list_partition_files(f"{dataset}/", filters)
+            if self.catalog is not None and row_filters:
+                object_names = self.catalog.prune(self.bucket, object_names, row_filters)
+            for object_name in object_names:
+                values = _parse_partition_path(object_name[len(dataset) + 1:])
+                frame = self.read_parquet(object_name, columns=columns, filters=row_filters)
+                for col, value in values.items():
+                    frame[col] = value
+                    if col not in partition_cols:
+                        partition_cols.append(col)
+                frames.append(frame)
+            
+            if not frames:
+                return pd.DataFrame(columns=(columns or []) + list(filters))
+            
+            df = pd.concat(frames, ignore_index=True)
+            # Partition values come back as text; restore numeric ones like survey_year
+            for col in partition_cols:
+                numeric = pd.to_numeric(df[col], errors="coerce")
+                if numeric.notna().sum() == df[col].notna().sum():
+                    df[col] = numeric.astype("Int64") if (numeric.dropna() % 1 == 0).all() else numeric
+            return df
+            
+        except Exception as e:
+            logger.error(f"Failed to read partitioned data under {dataset}: {e}")
+            raise
+    
+    def read_parquet(self,
+                     object_name: str,
+                     columns: Union[List[str], Callable[[str], bool], None] = None,
+                     filters: Optional[Sequence[Filter]] = None) -> pd.DataFrame:
+        """Read the needed columns and row groups of a parquet object.
+        
+        Goes through the local cache when one is configured; otherwise only
+        the footer and the selected column chunks are fetched with ranged GETs,
+        or memory mapped in place on the local backend.
+        
+        Args:
+            object_name: Name of the object in the bucket
+            columns: Columns to read, or a predicate over names; None reads all
+            filters: (column, op, value) conditions, e.g.
+                [("survey_round", "==", "year_two")]
+            
+        Returns:
+            pd.DataFrame: Matching rows of the selected columns
+        """
+        object_name = self.resolve(object_name)
+        if self.cache is not None:
+            return self.cache.read_parquet(self.client, self.bucket, object_name,
+                                           columns=columns, filters=filters)
+        
+        source = open_object(self.client, self.bucket, object_name)
+        return read_parquet_selective(source, columns=columns, filters=filters)
+    
+    def find_files(self, prefix: str, filters: Optional[Sequence[Filter]] = None) -> List[str]:
+        """List the parquet objects under prefix that may hold matching rows.
+        
+        Files are pruned on the column stats and bloom filters recorded in
+        the catalog; without a catalog every file is returned.
+        
+        Args:
+            prefix: Object name prefix
+            filters: (column, op, value) conditions, e.g. [("hhid_2", "==", "H123")]
+            
+        Returns:
+            List[str]: Candidate object names
+        """
+        object_names = [name for name in self.list_files(prefix) if name.endswith(".parquet")]
+        if self.catalog is None or not filters:
+            return object_names
+        return self.catalog.prune(self.bucket, object_names, filters)
+    
+    def read_files(self,
+                   prefix: str,
+                   filters: Optional[Sequence[Filter]] = None,
+                   columns: Optional[List[str]] = None) -> pd.DataFrame:
+        """Read the matching rows of every parquet object under prefix.
+        
+        A household lookup, e.g. filters=[("hhid_2", "==", "H123")], only
+        opens the files whose bloom filter may contain the household.
+        
+        Args:
+            prefix: Object name prefix
+            filters: (column, op, value) conditions rows must meet
+            columns: Columns to read; None reads all
+            
+        Returns:
+            pd.DataFrame: Matching rows
+        """
+        frames = [
+            self.read_parquet(object_name, columns=columns, filters=filters)
+            for object_name in self.find_files(prefix, filters)
+        ]
+        if not frames:
+            return pd.DataFrame(columns=columns)
+        return pd.concat(frames, ignore_index=True)
+    
+    def _list_partition_files(self, prefix: str, filters: Dict[str, Any]) -> List[str]:
+        """List the files under prefix, descending only into matching partitions."""
+        files = []
+        for obj in self.client.list_objects(self.bucket, prefix=prefix, recursive=False):
+            name = obj.object_name[len(prefix):].rstrip("/")
+            if obj.is_dir:
+                if "=" in name and not _matches(_parse_partition_path(name + "/"), filters):
+                    continue
+                files.extend(self._list_partition_files(obj.object_name, filters))
+            elif name.endswith(".parquet"):
+                files.append(obj.object_name)
+        return files
+    
+    def _catalog_object(self,
+                        object_name: str,
+                        size: int,
+                        etag: Optional[str] = None,
+                        content_hash: Optional[str] = None,
+                        metadata: Optional[Dict] = None,
+                        parquet: Any = None) -> None:
+        """Record a newly written object in the catalog, if there is one.
+        
+        When parquet (a path or the file's bytes) is given, the file's column
+        stats and household-key bloom filter are recorded too.
+        """
+        if self.catalog is None:
+            return
+        if parquet is not None:
+            try:
+                self.catalog.record_stats(self.bucket, object_name, parquet_file_stats(parquet), etag=etag)
+            except Exception as e:
+                logger.warning(f"Could not collect stats for {object_name}: {e}")
+        self.catalog.record(CatalogEntry(
+            bucket=self.bucket,
+            object_name=object_name,
+            size=size,
+            last_modified=datetime.now(timezone.utc),
+            etag=etag,
+            content_hash=content_hash,
+            survey_year=survey_year_from(object_name, metadata),
+            metadata=metadata
+        ))
+    
+    def reconcile_catalog(self) -> Dict[str, int]:
+        """Rebuild the catalog from a full listing of the bucket.
+        
+        Use after objects were written or removed behind the catalog's back.
+        
+        Returns:
+            Dict[str, int]: Counts of added, updated and removed entries
+        """
+        if self.catalog is None:
+            raise ValueError("No lake catalog configured")
+        try:
+            objects = self.client.list_objects(self.bucket, recursive=True, include_user_meta=True)
+            entries = (
+                CatalogEntry(
+                    bucket=self.bucket,
+                    object_name=obj.object_name,
+                    size=obj.size,
+                    last_modified=obj.last_modified,
+                    etag=obj.etag,
+                    metadata={
+                        key.lower().removeprefix("x-amz-meta-"): value
+                        for key, value in (obj.metadata or {}).items()
+                    } or None
+                )
+                for obj in objects
+            )
+            return self.catalog.reconcile(self.bucket, entries)
+        except Exception as e:
+            logger.error(f"Failed to reconcile catalog for {self.bucket}: {e}")
             raise
     
     def get_latest_version(self, prefix: str) -> Optional[str]:
@@ -82,6 +656,10 @@ class DataLakeManager:
             Optional[str]: The object name of the latest version, or None if not found
         """
         try:
+            if self.catalog is not None:
+                latest = self.catalog.latest(self.bucket, prefix)
+                return latest.object_name if latest else None
+            
             objects = list(self.client.list_objects(self.bucket, prefix=prefix, recursive=True))
             if not objects:
                 return None
@@ -101,6 +679,10 @@ class DataLakeManager:
             Dict: The metadata dictionary
         """
         try:
+            if self.catalog is not None:
+                entry = self.catalog.get(self.bucket, object_name)
+                if entry is not None and entry.target:
+                    return entry.metadata or {}
             stat = self.client.stat_object(self.bucket, object_name)
             return stat.metadata
         except Exception as e:
@@ -118,6 +700,9 @@ class DataLakeManager:
             list: List of object names
         """
         try:
+            if self.catalog is not None and recursive:
+                return [entry.object_name for entry in self.catalog.list(self.bucket, prefix)]
+            
             objects = self.client.list_objects(self.bucket, prefix=prefix, recursive=recursive)
             return [obj.object_name for obj in objects]
         except Exception as e:
@@ -127,6 +712,10 @@ class DataLakeManager:
     def delete_file(self, object_name: str) -> bool:
         """Delete a file from the bucket.
         
+        Deleting a content-addressed reference only drops the reference;
+        the blob goes with its last reference. A blob that is still
+        referenced is never deleted directly.
+        
         Args:
             object_name: Name of the object to delete
             
@@ -134,7 +723,21 @@ class DataLakeManager:
             bool: True if successful, False otherwise
         """
         try:
+            target = self.resolve(object_name)
+            if target != object_name:
+                self.catalog.remove(self.bucket, object_name)
+                logger.info(f"Deleted reference {object_name}")
+                if not self.catalog.references(self.bucket, target):
+                    return self.delete_file(target)
+                return True
+
+            if self.catalog is not None and self.catalog.references(self.bucket, object_name):
+                logger.warning(f"Not deleting {object_name}: it is still referenced")
+                return False
+
             self.client.remove_object(self.bucket, object_name)
+            if self.catalog is not None:
+                self.catalog.remove(self.bucket, object_name)
             logger.info(f"Deleted {object_name}")
             return True
         except Exception as e:
@@ -0,0 +1,225 @@
+import logging
+import math
+from dataclasses import dataclass, field
+from decimal import Decimal
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from lib.parquet_reader import Filter
+
+logger = logging.getLogger(__name__)
+
+# Household keys that get a bloom filter, first one present in a file wins
+BLOOM_COLUMNS = ["hhid_2", "household_id"]
+
+# Second 16-byte SipHash key for double hashing; pandas' default gives the first
+_SECOND_HASH_KEY = "rtv-bloom-filter"
+
+def _json_value(value: Any) -> Any:
+    """Make a parquet statistics value JSON serializable."""
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    if isinstance(value, bytes):
+        return value.decode("utf-8", errors="replace")
+    if hasattr(value, "isoformat"):
+        return value.isoformat()
+    return str(value)
+
+def parquet_column_stats(metadata: pq.FileMetaData) -> Dict[str, Dict[str, Any]]:
+    """Aggregate row group statistics into per-column min, max and null count.
+
+    Args:
+        metadata: Parquet footer metadata
+
+    Returns:
+        Dict[str, Dict[str, Any]]: Stats per top-level column; min/max are
+        None when any row group lacks them
+    """
+    stats: Dict[str, Dict[str, Any]] = {}
+    for index in range(metadata.num_row_groups):
+        row_group = metadata.row_group(index)
+        for i in range(row_group.num_columns):
+            column = row_group.column(i)
+            name = column.path_in_schema
+            current = stats.setdefault(name, {"min": None, "max": None, "null_count": 0, "_complete": True})
+            chunk = column.statistics
+            if chunk is None:
+                current["_complete"] = False
+                continue
+            current["null_count"] += chunk.null_count or 0
+            if not chunk.has_min_max:
+                if chunk.num_values:
+                    current["_complete"] = False
+                continue
+            try:
+                current["min"] = chunk.min if current["min"] is None else min(current["min"], chunk.min)
+                current["max"] = chunk.max if current["max"] is None else max(current["max"], chunk.max)
+            except TypeError:
+                current["_complete"] = False
+
+    result = {}
+    for name, current in stats.items():
+        complete = current.pop("_complete")
+        result[name] = {
+            "min": _json_value(current["min"]) if complete else None,
+            "max": _json_value(current["max"]) if complete else None,
+            "null_count": current["null_count"],
+        }
+    return result
+
+def _bloom_key(value: Any) -> str:
+    """Render a key the same way whether it was read as int, float or text.
+
+    Whole floats and decimals drop their fraction, so a household_id read
+    as 17.0 from a column with nulls matches a lookup for 17 or "17".
+    """
+    if isinstance(value, (float, np.floating, Decimal)) and math.isfinite(value) and value == int(value):
+        return str(int(value))
+    return str(value)
+
+class BloomFilter:
+    """Bloom filter over key values, sized for a 1% false positive rate.
+
+    Keys are compared as normalized strings (see _bloom_key), so household_id
+    17, 17.0 and "17" are the same key. Hashing is vectorized with pandas' stable SipHash, and the k bit
+    positions come from double hashing.
+    """
+
+    def __init__(self, num_bits: int, num_hashes: int, bits: Optional[np.ndarray] = None):
+        """Create an empty filter, or wrap existing bits.
+
+        Args:
+            num_bits: Size of the bit array
+            num_hashes: Bit positions set per key
+            bits: Unpacked bit array of length num_bits
+        """
+        self.num_bits = num_bits
+        self.num_hashes = num_hashes
+        self.bits = bits if bits is not None else np.zeros(num_bits, dtype=bool)
+
+    @classmethod
+    def for_capacity(cls, expected_items: int, false_positive_rate: float = 0.01) -> "BloomFilter":
+        """Size a filter for an expected number of distinct keys."""
+        n = max(expected_items, 1)
+        num_bits = max(64, int(math.ceil(-n * math.log(false_positive_rate) / math.log(2) ** 2)))
+        num_hashes = max(1, round(num_bits / n * math.log(2)))
+        return cls(num_bits, num_hashes)
+
+    @classmethod
+    def from_values(cls, values: Iterable[Any], false_positive_rate: float = 0.01) -> "BloomFilter":
+        """Build a filter holding every non-null value."""
+        keys = pd.Series(values, dtype=object).dropna().map(_bloom_key).unique()
+        bloom = cls.for_capacity(len(keys), false_positive_rate)
+        bloom.add(keys)
+        return bloom
+
+    def _positions(self, keys: Iterable[Any]) -> np.ndarray:
+        """Bit positions of each key, shape (len(keys), num_hashes)."""
+        keys = np.asarray([_bloom_key(key) for key in keys], dtype=object)
+        h1 = pd.util.hash_array(keys)
+        h2 = pd.util.hash_array(keys, hash_key=_SECOND_HASH_KEY) | np.uint64(1)
+        steps = np.arange(self.num_hashes, dtype=np.uint64)
+        return ((h1[:, None] + steps[None, :] * h2[:, None]) % np.uint64(self.num_bits)).astype(np.int64)
+
+    def add(self, keys: Iterable[Any]) -> None:
+        """Add keys to the filter."""
+        positions = self._positions(keys)
+        if positions.size:
+            self.bits[positions.ravel()] = True
+
+    def might_contain(self, key: Any) -> bool:
+        """Check a key; False means the key is certainly absent."""
+        return bool(self.bits[self._positions([key])[0]].all())
+
+    def to_bytes(self) -> bytes:
+        return np.packbits(self.bits).tobytes()
+
+    @classmethod
+    def from_bytes(cls, data: bytes, num_bits: int, num_hashes: int) -> "BloomFilter":
+        bits = np.unpackbits(np.frombuffer(data, dtype=np.uint8))[:num_bits].astype(bool)
+        return cls(num_bits, num_hashes, bits)
+
+@dataclass
+class FileStats:
+    """Column statistics and household-key bloom filter of one parquet file."""
+    row_count: int
+    column_stats: Dict[str, Dict[str, Any]] = field(default_factory=dict)
+    bloom_column: Optional[str] = None
+    bloom: Optional[BloomFilter] = None
+
+    def may_match(self, filters: Sequence[Filter]) -> bool:
+        """Check whether any row of the file can meet every filter.
+
+        Equality and "in" filters on the bloom column are checked against
+        the bloom filter; every filter is checked against min/max.
+        """
+        for column, op, value in filters:
+            if self.bloom is not None and column == self.bloom_column:
+                if op == "==" and not self.bloom.might_contain(value):
+                    return False
+                if op == "in" and not any(self.bloom.might_contain(v) for v in value):
+                    return False
+        return stats_may_match(self.column_stats, filters)
+
+def stats_may_match(column_stats: Dict[str, Dict[str, Any]], filters: Sequence[Filter]) -> bool:
+    """Use per-column min/max to rule out files no row can match.
+
+    Args:
+        column_stats: Stats as built by parquet_column_stats
+        filters: (column, op, value) conditions
+
+    Returns:
+        bool: False only if no row can meet every filter
+    """
+    for column, op, value in filters:
+        stats = column_stats.get(column)
+        if not stats or stats["min"] is None or stats["max"] is None:
+            continue
+        low, high = stats["min"], stats["max"]
+        try:
+            if op == "==" and not low <= value <= high:
+                return False
+            if op == "in" and not any(low <= v <= high for v in value):
+                return False
+            if op == "<" and not low < value:
+                return False
+            if op == "<=" and not low <= value:
+                return False
+            if op == ">" and not high > value:
+                return False
+            if op == ">=" and not high >= value:
+                return False
+        except TypeError:
+            continue  # stats of a different type than the filter value
+    return True
+
+def parquet_file_stats(source: Any, bloom_columns: List[str] = BLOOM_COLUMNS) -> FileStats:
+    """Compute the stats of a parquet file.
+
+    Only the footer and the bloom key column are read.
+
+    Args:
+        source: Parquet file path, buffer or file-like object
+        bloom_columns: Candidate key columns for the bloom filter
+
+    Returns:
+        FileStats: Stats of the file
+    """
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        source = pa.BufferReader(source)
+    parquet_file = pq.ParquetFile(source)
+    names = parquet_file.schema_arrow.names
+    stats = FileStats(
+        row_count=parquet_file.metadata.num_rows,
+        column_stats=parquet_column_stats(parquet_file.metadata)
+    )
+    bloom_column = next((column for column in bloom_columns if column in names), None)
+    if bloom_column:
+        keys = parquet_file.read(columns=[bloom_column]).column(0).to_pandas()
+        stats.bloom_column = bloom_column
+        stats.bloom = BloomFilter.from_values(keys)
+    return stats
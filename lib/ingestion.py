@@ -1,16 +1,39 @@
-import os
 from datetime import datetime
 from typing import Dict, List, Optional, Tuple
 import logging
+import numpy as np
 import pandas as pd
-from minio import Minio
 import psycopg2
 from psycopg2.extras import Json, execute_values
 import hashlib
+import io
+import json
+import numbers
 from dataclasses import dataclass
 
+from lib.bulk_load import copy_dataframe, get_column_types
+from lib.schema import DataType, SchemaManager
+from lib.snapshots import SnapshotTable
+from lib.storage import ObjectStore, put_dataframe
+from lib.survey_columns import FACT_TABLES, FactTable, project_fact_table, read_survey_csv
+
 logger = logging.getLogger(__name__)
 
+class _HashingReader(io.RawIOBase):
+    """Binary reader that feeds every byte it passes on into a digest."""
+
+    def __init__(self, raw, digest):
+        self.raw = raw
+        self.digest = digest
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        count = self.raw.readinto(buffer)
+        self.digest.update(memoryview(buffer)[:count])
+        return count
+
 @dataclass
 class DataLineage:
     """Represents data lineage information."""
@@ -21,23 +44,211 @@ class DataLineage:
     metadata: Dict
     parent_lineage: Optional[str] = None
 
+def _render_numbers(series: pd.Series) -> pd.Series:
+    """Render numbers like PostgreSQL's trim_scale(numeric)::text."""
+    values = pd.to_numeric(series, errors="coerce").astype("float64")
+    rendered = pd.Series("", index=series.index, dtype="object")
+    whole = values.notna() & (values == np.floor(values)) & (values.abs() < 1e15)
+    rendered[whole] = values[whole].astype("int64").astype(str)
+    fraction = values.notna() & ~whole
+    # repr is already the shortest round-trip form; only exponents need rewriting
+    text = values[fraction].astype(str)
+    exponent = text.str.contains("e", regex=False)
+    text[exponent] = [
+        np.format_float_positional(value, trim="-") for value in values[fraction][exponent]
+    ]
+    rendered[fraction] = text
+    return rendered
+
+def _render_value(value) -> str:
+    """Render a single object-dtype value for hashing."""
+    if value is None or value is pd.NA or (isinstance(value, float) and np.isnan(value)):
+        return ""
+    if isinstance(value, (numbers.Number, np.number)):
+        number = float(value)
+        if number.is_integer() and abs(number) < 1e15:
+            return str(int(number))
+        return np.format_float_positional(number, trim="-")
+    return str(value)
+
+def _normalize_for_hash(frame: pd.DataFrame) -> pd.DataFrame:
+    """Render every column as canonical text so equal values hash equally.
+    
+    Values read from PostgreSQL arrive as Decimal/int objects while CSV data
+    arrives as float64; both render to the same text. The rendering depends
+    only on each value, never on the rest of the frame, so two frames can be
+    normalized independently and still be compared.
+    """
+    normalized = {}
+    for col in frame.columns:
+        series = frame[col]
+        if isinstance(series.dtype, pd.CategoricalDtype):
+            series = series.astype(series.cat.categories.dtype)
+        if pd.api.types.is_datetime64_any_dtype(series):
+            normalized[col] = series.dt.strftime("%Y-%m-%dT%H:%M:%S.%f").fillna("")
+        elif pd.api.types.is_numeric_dtype(series) or pd.api.types.is_bool_dtype(series):
+            normalized[col] = _render_numbers(series)
+        else:
+            inferred = pd.api.types.infer_dtype(series, skipna=True)
+            if inferred in ("string", "empty"):
+                normalized[col] = series.astype("object").where(series.notna(), "")
+            elif inferred in ("decimal", "integer", "floating", "mixed-integer-float"):
+                normalized[col] = _render_numbers(series)
+            else:
+                normalized[col] = series.astype("object").map(_render_value)
+    return pd.DataFrame(normalized, index=frame.index)
+
+def hash_rows(frame: pd.DataFrame, columns: List[str]) -> np.ndarray:
+    """Compute a 64-bit hash per row over the given columns.
+    
+    Args:
+        frame: Input DataFrame
+        columns: Columns to include in the hash, in a fixed order
+        
+    Returns:
+        np.ndarray: uint64 hash per row
+    """
+    if not columns:
+        return np.zeros(len(frame), dtype="uint64")
+    normalized = _normalize_for_hash(frame[columns])
+    return pd.util.hash_pandas_object(normalized, index=False).to_numpy()
+
+def classify_changes(new: pd.DataFrame,
+                     existing: pd.DataFrame,
+                     key_columns: List[str],
+                     compare_columns: List[str]) -> Tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame]:
+    """Classify rows as inserts, updates or deletes with a hash join.
+    
+    Each side is reduced to a (key hash, content hash) pair per row and the
+    two sides are joined once on the key hash, so the cost is a single merge
+    instead of a scan of existing per candidate row.
+    
+    Args:
+        new: Incoming records
+        existing: Records currently stored
+        key_columns: Columns that uniquely identify a record
+        compare_columns: Columns whose changes count as an update
+        
+    Returns:
+        Tuple of (inserts, updates, deletes) DataFrames
+    """
+    new_hashes = pd.DataFrame({
+        "_key_hash": hash_rows(new, key_columns),
+        "_row_hash": hash_rows(new, compare_columns),
+        "_pos": np.arange(len(new))
+    }).drop_duplicates("_key_hash", keep="last")
+    existing_hashes = pd.DataFrame({
+        "_key_hash": hash_rows(existing, key_columns),
+        "_row_hash": hash_rows(existing, compare_columns),
+        "_pos": np.arange(len(existing))
+    }).drop_duplicates("_key_hash", keep="last")
+    
+    merged = new_hashes.merge(
+        existing_hashes,
+        on="_key_hash",
+        how="outer",
+        suffixes=("_new", "_old"),
+        indicator=True
+    )
+    
+    inserted = merged["_merge"] == "left_only"
+    deleted = merged["_merge"] == "right_only"
+    changed = (merged["_merge"] == "both") & (merged["_row_hash_new"] != merged["_row_hash_old"])
+    
+    def rows(frame: pd.DataFrame, positions: pd.Series) -> pd.DataFrame:
+        return frame.iloc[np.sort(positions.astype("int64").to_numpy())]
+    
+    inserts = rows(new, merged.loc[inserted, "_pos_new"])
+    updates = rows(new, merged.loc[changed, "_pos_new"]) if compare_columns else pd.DataFrame()
+    deletes = rows(existing, merged.loc[deleted, "_pos_old"])
+    
+    return inserts, updates, deletes
+
+def row_hash_sql(table: FactTable) -> str:
+    """Build the SQL expression behind a fact table's persisted row_hash.
+    
+    Every cast used here is immutable so the expression can back a STORED
+    generated column. compute_row_hashes renders values the same way, which
+    lets the client hash a batch and compare it with what is stored.
+    
+    Args:
+        table: Fact table definition
+        
+    Returns:
+        str: md5 expression over the table's content columns
+    """
+    parts = []
+    for col, data_type in table.content_columns.items():
+        if data_type == DataType.DECIMAL:
+            rendered = f"trim_scale({col})::text"
+        elif data_type == DataType.TIMESTAMP:
+            rendered = f"trim_scale(extract(epoch FROM {col})::numeric)::text"
+        else:
+            rendered = f"{col}::text"
+        parts.append(f"coalesce({rendered}, '')")
+    separator = " || '|' || "
+    return f"md5({separator.join(parts)})"
+
+def compute_row_hashes(df: pd.DataFrame, table: FactTable) -> pd.Series:
+    """Compute row_hash for fact-shaped rows exactly as row_hash_sql does.
+    
+    Args:
+        df: Rows shaped like the fact table (see project_fact_table)
+        table: Fact table definition
+        
+    Returns:
+        pd.Series: 32-character md5 hex digest per row
+    """
+    rendered = []
+    for col, data_type in table.content_columns.items():
+        series = df[col]
+        if data_type in (DataType.DECIMAL, DataType.INTEGER):
+            rendered.append(_render_numbers(series))
+        elif data_type == DataType.TIMESTAMP:
+            timestamps = pd.to_datetime(series, errors="coerce")
+            seconds = (timestamps - pd.Timestamp(0)) / pd.Timedelta(seconds=1)
+            rendered.append(_render_numbers(seconds))
+        elif data_type == DataType.BOOLEAN:
+            flags = series.map(
+                lambda v: None if pd.isna(v)
+                else "true" if str(v).strip().lower() in ("1", "1.0", "true", "t", "yes", "y", "on")
+                else "false"
+            )
+            rendered.append(flags.fillna(""))
+        else:
+            rendered.append(series.astype("object").where(series.notna(), "").astype(str))
+    
+    joined = rendered[0].str.cat(rendered[1:], sep="|") if len(rendered) > 1 else rendered[0]
+    return pd.Series(
+        [hashlib.md5(row.encode()).hexdigest() for row in joined],
+        index=df.index
+    )
+
 class SurveyDataIngester:
     """Handles enhanced data ingestion with CDC and lineage tracking."""
     
     def __init__(self, 
                  db_conn: psycopg2.extensions.connection,
-                 minio_client: Minio,
-                 bucket_name: str = "survey-data"):
+                 minio_client: ObjectStore,
+                 bucket_name: str = "survey-data",
+                 schema_manager: Optional[SchemaManager] = None,
+                 table: Optional[SnapshotTable] = None):
         """Initialize the data ingester.
         
         Args:
             db_conn: PostgreSQL connection
             minio_client: MinIO client
             bucket_name: Name of the MinIO bucket
+            schema_manager: Schema registry used to type columns outside the
+                core survey columns
+            table: Snapshot table in the same bucket that ingested files
+                are committed to
         """
         self.conn = db_conn
         self.minio = minio_client
         self.bucket = bucket_name
+        self.schema_manager = schema_manager
+        self.table = table
         self._init_lineage_tables()
         logger.info("Initialized SurveyDataIngester")
     
@@ -68,18 +279,56 @@ class SurveyDataIngester:
                 CREATE INDEX IF NOT EXISTS idx_lineage_hash 
                 ON data_lineage(hash_value);
                 
+                CREATE INDEX IF NOT EXISTS idx_lineage_content_hash 
+                ON data_lineage((metadata->>'content_hash'));
+                
                 CREATE INDEX IF NOT EXISTS idx_change_log_lineage 
                 ON change_log(lineage_id);
             """)
             self.conn.commit()
     
-    def _compute_data_hash(self, df: pd.DataFrame) -> str:
-        """Compute a hash of the data for change detection."""
-        # Sort columns to ensure consistent hashing
-        df = df.sort_index(axis=1)
-        # Convert to string and hash
-        data_str = df.to_string()
-        return hashlib.sha256(data_str.encode()).hexdigest()
+    def _compute_data_hash(self,
+                           file_path: str,
+                           survey_year: int,
+                           chunksize: int = 100_000,
+                           content_digest=None) -> Tuple[str, int]:
+        """Compute a content fingerprint of a CSV file for change detection.
+        
+        The file is read in chunks as raw text, each column is hashed with
+        hash_pandas_object into its own running SHA-256, and the per-column
+        digests are combined in sorted column order. The result does not
+        depend on column order and the whole frame is never materialized.
+        
+        Args:
+            file_path: Path to the CSV file
+            survey_year: Year used when the file has no survey_year column
+            chunksize: Rows per chunk
+            content_digest: hashlib object fed the file's raw bytes on the
+                same pass, if the caller also needs the file hash
+            
+        Returns:
+            Tuple[str, int]: (hex digest, record count)
+        """
+        column_digests = {}
+        record_count = 0
+        with open(file_path, "rb") as f:
+            source = io.BufferedReader(_HashingReader(f, content_digest)) if content_digest else f
+            for chunk in pd.read_csv(source, dtype=str, keep_default_na=False, chunksize=chunksize):
+                if 'survey_year' not in chunk.columns:
+                    chunk['survey_year'] = str(survey_year)
+                for col in chunk.columns:
+                    cell_hashes = pd.util.hash_pandas_object(chunk[col], index=False).to_numpy()
+                    column_digests.setdefault(col, hashlib.sha256()).update(cell_hashes.tobytes())
+                record_count += len(chunk)
+            # The parser may stop short of trailing bytes the file hash still covers
+            while content_digest and source.read(1024 * 1024):
+                pass
+        
+        fingerprint = hashlib.sha256()
+        for col in sorted(column_digests):
+            fingerprint.update(col.encode())
+            fingerprint.update(column_digests[col].digest())
+        return fingerprint.hexdigest(), record_count
     
     def _detect_changes(self, 
                        table_name: str,
@@ -96,67 +345,142 @@ class SurveyDataIngester:
             Tuple of (inserts, updates, deletes) DataFrames
         """
         try:
-            # Get existing data
+            if table_name in FACT_TABLES:
+                df = project_fact_table(df, table_name)
+            if df.empty:
+                return df, pd.DataFrame(), pd.DataFrame()
+            
             with self.conn.cursor() as cur:
+                table_columns = get_column_types(cur, table_name)
+            
+            if table_name in FACT_TABLES and 'row_hash' in table_columns:
+                return self._detect_changes_server_side(FACT_TABLES[table_name], df)
+            
+            # Tables without a persisted row_hash are compared in pandas;
+            # only columns present on both sides can be compared
+            with self.conn.cursor() as cur:
+                compare_columns = [
+                    col for col in df.columns
+                    if col in table_columns and col not in key_columns + ['updated_at']
+                ]
+                select_columns = key_columns + compare_columns + (
+                    ['updated_at'] if 'updated_at' in table_columns else []
+                )
                 cur.execute(f"""
-                    SELECT {', '.join(key_columns + ['updated_at'])}
+                    SELECT {', '.join(select_columns)}
                     FROM {table_name}
                     WHERE survey_year = %s
-                """, (df['survey_year'].iloc[0],))
-                existing = pd.DataFrame(cur.fetchall(), columns=key_columns + ['updated_at'])
+                """, (int(df['survey_year'].iloc[0]),))
+                existing = pd.DataFrame(cur.fetchall(), columns=select_columns)
             
             if existing.empty:
                 return df, pd.DataFrame(), pd.DataFrame()
             
-            # Find new records
-            new_keys = set(map(tuple, df[key_columns].values))
-            existing_keys = set(map(tuple, existing[key_columns].values))
-            
-            inserts = df[df[key_columns].apply(tuple, axis=1).isin(new_keys - existing_keys)]
-            deletes = existing[existing[key_columns].apply(tuple, axis=1).isin(existing_keys - new_keys)]
-            
-            # Find updates
-            common_keys = new_keys.intersection(existing_keys)
-            if common_keys:
-                updates = df[df[key_columns].apply(tuple, axis=1).isin(common_keys)]
-                # Filter out unchanged records
-                updates = updates[updates.apply(
-                    lambda row: any(row[col] != existing.loc[
-                        existing[key_columns].apply(tuple, axis=1) == tuple(row[key_columns])
-                    ][col].iloc[0] for col in df.columns if col not in key_columns + ['updated_at']),
-                    axis=1
-                )]
-            else:
-                updates = pd.DataFrame()
-            
-            return inserts, updates, deletes
+            return classify_changes(df, existing, key_columns, compare_columns)
             
         except Exception as e:
             logger.error(f"Failed to detect changes: {e}")
             raise
     
+    def _detect_changes_server_side(self,
+                                    table: FactTable,
+                                    df: pd.DataFrame) -> Tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame]:
+        """Detect changes by joining (key, row_hash) pairs inside PostgreSQL.
+        
+        Only keys and hashes are sent to the server and only the keys of
+        changed rows come back.
+        
+        Args:
+            table: Fact table definition
+            df: New data shaped like the fact table
+            
+        Returns:
+            Tuple of (inserts, updates, deletes) DataFrames
+        """
+        keys = table.key_columns
+        batch = df[keys].copy()
+        batch['row_hash'] = compute_row_hashes(df, table)
+        
+        with self.conn.cursor() as cur:
+            cur.execute("DROP TABLE IF EXISTS cdc_batch")
+            cur.execute(f"""
+                CREATE TEMP TABLE cdc_batch AS
+                SELECT {', '.join(keys)}, row_hash
+                FROM {table.name}
+                WITH NO DATA
+            """)
+            copy_dataframe(cur, "cdc_batch", batch)
+            
+            cur.execute(f"""
+                SELECT
+                    CASE
+                        WHEN f.row_hash IS NULL THEN 'INSERT'
+                        WHEN b.row_hash IS NULL THEN 'DELETE'
+                        ELSE 'UPDATE'
+                    END AS operation,
+                    {', '.join(keys)}
+                FROM cdc_batch b
+                FULL OUTER JOIN (
+                    SELECT {', '.join(keys)}, row_hash
+                    FROM {table.name}
+                    WHERE survey_year = %s
+                ) f USING ({', '.join(keys)})
+                WHERE b.row_hash IS DISTINCT FROM f.row_hash
+            """, (int(df['survey_year'].iloc[0]),))
+            changes = pd.DataFrame(cur.fetchall(), columns=['operation'] + keys)
+            cur.execute("DROP TABLE cdc_batch")
+        
+        def changed(operation: str) -> pd.DataFrame:
+            wanted = hash_rows(changes[changes['operation'] == operation], keys)
+            return df[np.isin(hash_rows(df, keys), wanted)]
+        
+        deletes = changes.loc[changes['operation'] == 'DELETE', keys].reset_index(drop=True)
+        return changed('INSERT'), changed('UPDATE'), deletes
+    
     def ingest_survey_data(self,
                           file_path: str,
                           survey_year: int,
-                          metadata: Optional[Dict] = None) -> DataLineage:
+                          metadata: Optional[Dict] = None,
+                          content_hash: Optional[str] = None) -> DataLineage:
         """Ingest survey data with change detection and lineage tracking.
         
+        A byte-identical re-delivery is recognised from the file's SHA-256
+        alone, the same hash the content-addressed lake stores blobs under,
+        before the file is parsed at all. Without a hash from the caller it
+        is computed on the fingerprint pass, so the file is read once
+        before parsing either way.
+        
         Args:
             file_path: Path to the survey data file
             survey_year: Year of the survey
             metadata: Additional metadata
+            content_hash: SHA-256 of the file, e.g. from the lake catalog;
+                computed if not given
             
         Returns:
             DataLineage: Lineage information for the ingestion
         """
         try:
-            # Read and validate data
-            df = pd.read_csv(file_path)
-            if 'survey_year' not in df.columns:
-                df['survey_year'] = survey_year
+            fingerprint = None
+            if content_hash is None:
+                digest = hashlib.sha256()
+                fingerprint = self._compute_data_hash(file_path, survey_year, content_digest=digest)
+                content_hash = digest.hexdigest()
+            with self.conn.cursor() as cur:
+                cur.execute("""
+                    SELECT lineage_id
+                    FROM data_lineage
+                    WHERE metadata->>'content_hash' = %s
+                    ORDER BY ingestion_time DESC
+                    LIMIT 1
+                """, (content_hash,))
+                existing = cur.fetchone()
+                if existing:
+                    logger.info(f"File already ingested (lineage_id: {existing[0]})")
+                    return None
             
-            # Compute data hash
-            hash_value = self._compute_data_hash(df)
+            # Fingerprint the file before parsing it in full
+            hash_value, record_count = fingerprint or self._compute_data_hash(file_path, survey_year)
             
             # Check if we've seen this data before
             with self.conn.cursor() as cur:
@@ -169,16 +493,27 @@ class SurveyDataIngester:
                 """, (hash_value,))
                 existing = cur.fetchone()
                 
-                if existing and existing[1] == len(df):
+                if existing and existing[1] == record_count:
                     logger.info(f"Data already ingested (lineage_id: {existing[0]})")
                     return None
             
+            # Read and validate data
+            registry = self.schema_manager.get_column_types(survey_year) if self.schema_manager else None
+            df = read_survey_csv(file_path, registry=registry)
+            if 'survey_year' not in df.columns:
+                df['survey_year'] = survey_year
+            
             # Store in MinIO
             parquet_file = f"raw/survey_{survey_year}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.parquet"
-            temp_path = f"/tmp/{os.path.basename(parquet_file)}"
-            df.to_parquet(temp_path)
-            self.minio.fput_object(self.bucket, parquet_file, temp_path)
-            os.remove(temp_path)
+            put_dataframe(self.minio, self.bucket, parquet_file, df)
+            
+            snapshot_metadata = {}
+            if self.table is not None:
+                snapshot = self.table.commit(
+                    added=[parquet_file],
+                    summary={"source_file": file_path, "survey_year": survey_year}
+                )
+                snapshot_metadata = {"snapshot_version": snapshot.version}
             
             # Record lineage
             lineage = DataLineage(
@@ -189,6 +524,8 @@ class SurveyDataIngester:
                 metadata={
                     "survey_year": survey_year,
                     "file_type": "survey",
+                    "content_hash": content_hash,
+                    **snapshot_metadata,
                     **(metadata or {})
                 }
             )
@@ -238,7 +575,7 @@ class SurveyDataIngester:
                                 datetime.now(),
                                 Json({
                                     "columns": list(change_df.columns),
-                                    "sample": change_df.head().to_dict()
+                                    "sample": json.loads(change_df.head().to_json(date_format="iso"))
                                 })
                             ))
                 
@@ -0,0 +1,217 @@
+import hashlib
+import io
+import json
+import logging
+import os
+from dataclasses import asdict, dataclass
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from minio.error import S3Error
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_OBJECT = "manifests/ingestion_manifest.json"
+
+def file_sha256(file_path: str, block_size: int = 1024 * 1024) -> str:
+    """Hash a file's bytes without reading it into memory at once.
+
+    Args:
+        file_path: Path to the file
+        block_size: Bytes read per iteration
+
+    Returns:
+        str: Hex SHA-256 digest of the file contents
+    """
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+@dataclass
+class ManifestEntry:
+    """What was ingested for one source file."""
+    path: str
+    size: int
+    mtime_ns: int
+    sha256: str
+    object_name: Optional[str] = None
+    ingested_at: Optional[str] = None
+    # Set once compaction has split the file's data across several objects
+    parts: Optional[List[str]] = None
+
+class IngestionManifest:
+    """Persistent record of ingested source files, stored as JSON in MinIO.
+
+    Entries are keyed by source path, so checking whether a file changed is a
+    dict lookup plus a stat call. The content hash is only computed when size
+    or mtime differ, which catches files that were touched but not modified.
+    """
+
+    def __init__(self, client, bucket: str, object_name: str = MANIFEST_OBJECT):
+        """Load the manifest, starting empty if none has been written yet.
+
+        Args:
+            client: MinIO client (or anything with get_object/put_object)
+            bucket: Bucket holding the manifest
+            object_name: Object name of the manifest
+        """
+        self.client = client
+        self.bucket = bucket
+        self.object_name = object_name
+        self.entries: Dict[str, ManifestEntry] = {}
+        # Objects no entry points at any more, kept until they are deleted
+        self.superseded: List[str] = []
+        self._load()
+
+    def _load(self) -> None:
+        """Read the manifest object if it exists."""
+        try:
+            response = self.client.get_object(self.bucket, self.object_name)
+            try:
+                document = json.loads(response.read())
+            finally:
+                response.close()
+                response.release_conn()
+        except S3Error as e:
+            if e.code != "NoSuchKey":
+                logger.error(f"Failed to load ingestion manifest: {e}")
+                raise
+            logger.info(f"No ingestion manifest at {self.object_name}, starting empty")
+            return
+
+        self.entries = {
+            path: ManifestEntry(**entry) for path, entry in document.get("files", {}).items()
+        }
+        self.superseded = document.get("superseded", [])
+
+    def save(self) -> None:
+        """Write the manifest back to MinIO."""
+        data = json.dumps({
+            "updated_at": datetime.now().isoformat(),
+            "files": {path: asdict(entry) for path, entry in self.entries.items()},
+            "superseded": self.superseded
+        }, indent=2).encode()
+        self.client.put_object(
+            self.bucket,
+            self.object_name,
+            io.BytesIO(data),
+            length=len(data),
+            content_type="application/json"
+        )
+        logger.info(f"Saved ingestion manifest with {len(self.entries)} files")
+
+    def check(self, file_path: str) -> Optional[ManifestEntry]:
+        """Compare a file against the manifest.
+
+        Args:
+            file_path: Path to the source file
+
+        Returns:
+            Optional[ManifestEntry]: None if the file is unchanged, otherwise
+            a fresh entry to pass to record() once it has been ingested
+        """
+        path = str(file_path)
+        stat = os.stat(path)
+        entry = self.entries.get(path)
+        if entry and entry.size == stat.st_size and entry.mtime_ns == stat.st_mtime_ns:
+            return None
+
+        content_hash = file_sha256(path)
+        if entry and entry.sha256 == content_hash:
+            # Touched but not modified; remember the new mtime to skip the hash next time
+            entry.size, entry.mtime_ns = stat.st_size, stat.st_mtime_ns
+            return None
+
+        return ManifestEntry(
+            path=path,
+            size=stat.st_size,
+            mtime_ns=stat.st_mtime_ns,
+            sha256=content_hash
+        )
+
+    def record(self, entry: ManifestEntry, object_name: str) -> None:
+        """Mark a file as ingested into object_name.
+
+        Args:
+            entry: Entry returned by check()
+            object_name: Object the processed data was written to
+        """
+        previous = self.entries.get(entry.path)
+        entry.object_name = object_name
+        entry.ingested_at = datetime.now().isoformat()
+        entry.parts = None
+        self.entries[entry.path] = entry
+        if previous is not None and previous is not entry and previous.object_name:
+            self._supersede(previous.parts or [previous.object_name])
+
+    def replace_objects(self, old: List[str], new: List[str]) -> int:
+        """Point entries at compacted objects instead of the ones they replace.
+
+        The old objects are marked superseded.
+
+        Args:
+            old: Objects being retired
+            new: Objects now holding their rows
+
+        Returns:
+            int: Number of entries updated
+        """
+        retired = set(old)
+        updated = 0
+        for entry in self.entries.values():
+            if retired.intersection(entry.parts or [entry.object_name]):
+                entry.object_name = new[0]
+                entry.parts = list(new) if len(new) > 1 else None
+                updated += 1
+        self._supersede(old)
+        return updated
+
+    def sources(self) -> Dict[str, List[str]]:
+        """Get the source paths of every object an entry points at.
+
+        Returns:
+            Dict[str, List[str]]: Object name to the sources whose rows it holds
+        """
+        sources: Dict[str, List[str]] = {}
+        for entry in self.entries.values():
+            if entry.object_name:
+                for name in entry.parts or [entry.object_name]:
+                    sources.setdefault(name, []).append(entry.path)
+        return sources
+
+    def forget(self, object_names: List[str]) -> None:
+        """Drop deleted objects from the superseded list."""
+        deleted = set(object_names)
+        self.superseded = [name for name in self.superseded if name not in deleted]
+
+    def _supersede(self, object_names: List[str]) -> None:
+        """Mark objects superseded unless an entry still points at them."""
+        referenced = self.sources()
+        for name in object_names:
+            if name not in referenced and name not in self.superseded:
+                self.superseded.append(name)
+
+    def objects(self, since: Optional[datetime] = None) -> List[str]:
+        """Get the current object of every ingested file.
+
+        Args:
+            since: Only return objects ingested after this time
+
+        Returns:
+            List[str]: Object names, oldest ingestion first
+        """
+        entries = sorted(
+            (entry for entry in self.entries.values() if entry.object_name),
+            key=lambda entry: entry.ingested_at
+        )
+        if since is not None:
+            entries = [
+                entry for entry in entries
+                if datetime.fromisoformat(entry.ingested_at) > since
+            ]
+        # Entries compacted together share objects; list each once
+        return list(dict.fromkeys(
+            name for entry in entries for name in (entry.parts or [entry.object_name])
+        ))
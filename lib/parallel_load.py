@@ -0,0 +1,237 @@
+import io
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional
+
+import pyarrow.parquet as pq
+from psycopg2.pool import ThreadedConnectionPool
+
+from lib.binary_copy import binary_supported, copy_binary, encode_binary
+from lib.bulk_load import copy_buffer, encode_csv, get_column_types, prepare_copy_frame
+
+logger = logging.getLogger(__name__)
+
+_DONE = object()
+
+@dataclass
+class LoadTask:
+    """One parquet source to load."""
+    name: str
+    # Opens the source for reading, e.g. lambda: open_object(client, bucket, name)
+    open: Callable[[], Any]
+    column_map: Dict[str, str]
+    constants: Optional[Dict[str, Any]] = None
+
+@dataclass
+class LoadStats:
+    """Outcome of a pipelined load.
+
+    Stage times are summed over files; with the stages overlapped the wall
+    time approaches the slowest stage rather than their total.
+    """
+    rows: Dict[str, int] = field(default_factory=dict)
+    failed: Dict[str, str] = field(default_factory=dict)
+    seconds: float = 0.0
+    read_seconds: float = 0.0
+    encode_seconds: float = 0.0
+    copy_seconds: float = 0.0
+
+    @property
+    def total_rows(self) -> int:
+        return sum(self.rows.values())
+
+def create_pool(max_connections: int, **connect_kwargs) -> ThreadedConnectionPool:
+    """Create a thread-safe PostgreSQL connection pool.
+
+    Args:
+        max_connections: Upper bound on open connections
+        **connect_kwargs: psycopg2.connect arguments
+
+    Returns:
+        ThreadedConnectionPool: The pool
+    """
+    return ThreadedConnectionPool(1, max_connections, **connect_kwargs)
+
+class PipelinedLoader:
+    """Loads parquet files into a table with reading, encoding and COPY overlapped.
+
+    Each file runs as three stages joined by bounded queues: a reader that
+    streams record batches (row group by row group, so a lake object is
+    fetched as it is decoded), an encoder that turns them into COPY
+    payloads, and a writer that COPYs them on its own pooled connection.
+    Several files are loaded at once, one connection each, and each file is
+    its own transaction, so a failed file is rolled back without affecting
+    the others. The queues bound memory to a few batches per file.
+    """
+
+    def __init__(self,
+                 pool: Any,
+                 table_name: str,
+                 max_files: int = 3,
+                 queue_size: int = 4,
+                 batch_size: int = 100_000,
+                 copy_format: str = "csv"):
+        """Initialize the loader.
+
+        Args:
+            pool: Connection pool with getconn/putconn, e.g. from create_pool
+            table_name: Target table
+            max_files: Files loaded concurrently; at most the pool size
+            queue_size: Batches buffered between two stages
+            batch_size: Rows per record batch and COPY
+            copy_format: "csv" or "binary"; binary skips formatting numbers
+                as text and falls back to csv for unsupported column types
+        """
+        if copy_format not in ("csv", "binary"):
+            raise ValueError(f"Unknown COPY format: {copy_format}")
+        self.pool = pool
+        self.table_name = table_name
+        self.max_files = max_files
+        self.queue_size = queue_size
+        self.batch_size = batch_size
+        self.copy_format = copy_format
+        self._lock = threading.Lock()
+
+    def load(self, tasks: List[LoadTask]) -> LoadStats:
+        """Load every task, returning per-file rows and failures.
+
+        Args:
+            tasks: Files to load
+
+        Returns:
+            LoadStats: Rows per loaded file, errors per failed file and
+            stage timings
+        """
+        stats = LoadStats()
+        start = time.perf_counter()
+
+        conn = self.pool.getconn()
+        try:
+            with conn.cursor() as cur:
+                column_types = get_column_types(cur, self.table_name)
+            conn.rollback()
+        finally:
+            self.pool.putconn(conn)
+        if not column_types:
+            raise ValueError(f"Table {self.table_name} does not exist")
+
+        with ThreadPoolExecutor(max_workers=self.max_files) as executor:
+            futures = {
+                task.name: executor.submit(self._load_file, task, column_types, stats)
+                for task in tasks
+            }
+            for name, future in futures.items():
+                try:
+                    stats.rows[name] = future.result()
+                except Exception as e:
+                    logger.error(f"Failed to load {name}: {e}")
+                    stats.failed[name] = str(e)
+
+        stats.seconds = time.perf_counter() - start
+        logger.info(
+            f"Loaded {stats.total_rows} rows from {len(stats.rows)} files into {self.table_name} "
+            f"in {stats.seconds:.1f}s (read {stats.read_seconds:.1f}s, encode "
+            f"{stats.encode_seconds:.1f}s, copy {stats.copy_seconds:.1f}s)"
+        )
+        return stats
+
+    def _add_time(self, stats: LoadStats, stage: str, seconds: float) -> None:
+        with self._lock:
+            setattr(stats, stage, getattr(stats, stage) + seconds)
+
+    def _load_file(self, task: LoadTask, column_types: Dict[str, str], stats: LoadStats) -> int:
+        """Run the three stages for one file and commit it."""
+        batches = queue.Queue(maxsize=self.queue_size)
+        payloads = queue.Queue(maxsize=self.queue_size)
+        failed = threading.Event()
+        errors = []
+
+        def put(q: queue.Queue, item: Any) -> bool:
+            """Put unless the file has failed, so no stage blocks forever."""
+            while not failed.is_set():
+                try:
+                    q.put(item, timeout=0.5)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+
+        def get(q: queue.Queue) -> Any:
+            while True:
+                try:
+                    return q.get(timeout=0.5)
+                except queue.Empty:
+                    if failed.is_set():
+                        return _DONE
+
+        def read() -> None:
+            try:
+                started = time.perf_counter()
+                parquet_file = pq.ParquetFile(task.open())
+                columns = [col for col in task.column_map if col in parquet_file.schema_arrow.names]
+                batch_iter = parquet_file.iter_batches(batch_size=self.batch_size, columns=columns)
+                while True:
+                    batch = next(batch_iter, None)
+                    self._add_time(stats, "read_seconds", time.perf_counter() - started)
+                    if batch is None or not put(batches, batch):
+                        break
+                    started = time.perf_counter()
+            except Exception as e:
+                errors.append(e)
+                failed.set()
+            finally:
+                put(batches, _DONE)
+
+        def encode() -> None:
+            try:
+                while (batch := get(batches)) is not _DONE:
+                    started = time.perf_counter()
+                    frame = prepare_copy_frame(batch.to_pandas(), task.column_map, column_types, task.constants)
+                    columns = list(frame.columns)
+                    if self.copy_format == "binary" and binary_supported(column_types, columns):
+                        payload = (columns, len(frame), encode_binary(frame, column_types))
+                    else:
+                        payload = (columns, len(frame), encode_csv(frame))
+                    self._add_time(stats, "encode_seconds", time.perf_counter() - started)
+                    if len(frame) and not put(payloads, payload):
+                        break
+            except Exception as e:
+                errors.append(e)
+                failed.set()
+            finally:
+                put(payloads, _DONE)
+
+        threads = [threading.Thread(target=read, daemon=True), threading.Thread(target=encode, daemon=True)]
+        for thread in threads:
+            thread.start()
+
+        rows = 0
+        conn = self.pool.getconn()
+        try:
+            with conn.cursor() as cur:
+                while (payload := get(payloads)) is not _DONE:
+                    columns, count, buffer = payload
+                    started = time.perf_counter()
+                    if isinstance(buffer, io.BytesIO):
+                        copy_binary(cur, self.table_name, columns, buffer)
+                    else:
+                        copy_buffer(cur, self.table_name, columns, buffer)
+                    self._add_time(stats, "copy_seconds", time.perf_counter() - started)
+                    rows += count
+            if errors:
+                raise errors[0]
+            conn.commit()
+            logger.info(f"Copied {rows} rows from {task.name} into {self.table_name}")
+            return rows
+        except Exception:
+            failed.set()
+            conn.rollback()
+            raise
+        finally:
+            for thread in threads:
+                thread.join()
+            self.pool.putconn(conn)
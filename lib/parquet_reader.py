@@ -0,0 +1,182 @@
+import io
+import logging
+import operator
+from typing import Any, Callable, List, Optional, Sequence, Tuple, Union
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+logger = logging.getLogger(__name__)
+
+# (column, operator, value), e.g. ("survey_round", "==", "year_two")
+Filter = Tuple[str, str, Any]
+
+_COMPARISONS = {
+    "==": operator.eq,
+    "!=": operator.ne,
+    "<": operator.lt,
+    "<=": operator.le,
+    ">": operator.gt,
+    ">=": operator.ge,
+}
+
+class RangedObjectFile(io.RawIOBase):
+    """Seekable read-only file over a lake object, backed by ranged GETs.
+
+    Each read() becomes one GET for exactly the requested byte range, so a
+    parquet reader on top only transfers the footer and the column chunks
+    it decodes. Every range is pinned to the ETag seen when the file was
+    opened.
+    """
+
+    def __init__(self, client, bucket: str, object_name: str):
+        """Open an object for ranged reads.
+
+        Args:
+            client: MinIO client
+            bucket: Bucket name
+            object_name: Object name
+        """
+        stat = client.stat_object(bucket, object_name)
+        self.client = client
+        self.bucket = bucket
+        self.object_name = object_name
+        self.size = stat.size
+        self.etag = stat.etag
+        self.requests = 0
+        self.bytes_fetched = 0
+        self._position = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self._position
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        if whence == io.SEEK_CUR:
+            offset += self._position
+        elif whence == io.SEEK_END:
+            offset += self.size
+        self._position = max(0, offset)
+        return self._position
+
+    def read(self, size: int = -1) -> bytes:
+        if self._position >= self.size or size == 0:
+            return b""
+        length = self.size - self._position if size is None or size < 0 else min(size, self.size - self._position)
+        response = self.client.get_object(
+            self.bucket, self.object_name, offset=self._position, length=length,
+            request_headers={"If-Match": self.etag}
+        )
+        try:
+            data = response.read()
+        finally:
+            response.close()
+            response.release_conn()
+        self.requests += 1
+        self.bytes_fetched += len(data)
+        self._position += len(data)
+        return data
+
+    def readinto(self, buffer) -> int:
+        data = self.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+def _row_group_may_match(metadata: pq.FileMetaData, index: int, filters: Sequence[Filter]) -> bool:
+    """Use row group min/max statistics to rule out groups no row can match."""
+    row_group = metadata.row_group(index)
+    positions = {row_group.column(i).path_in_schema: i for i in range(row_group.num_columns)}
+    for column, op, value in filters:
+        if column not in positions:
+            continue
+        stats = row_group.column(positions[column]).statistics
+        if stats is None or not stats.has_min_max:
+            continue
+        try:
+            if op == "==" and not stats.min <= value <= stats.max:
+                return False
+            if op == "in" and not any(stats.min <= v <= stats.max for v in value):
+                return False
+            if op == "<" and not stats.min < value:
+                return False
+            if op == "<=" and not stats.min <= value:
+                return False
+            if op == ">" and not stats.max > value:
+                return False
+            if op == ">=" and not stats.max >= value:
+                return False
+        except TypeError:
+            continue  # statistics of a different type than the filter value
+    return True
+
+def _filter_expression(filters: Sequence[Filter]) -> pc.Expression:
+    """Combine filters into one pyarrow expression."""
+    expression = None
+    for column, op, value in filters:
+        if op == "in":
+            term = pc.field(column).isin(list(value))
+        elif op in _COMPARISONS:
+            term = _COMPARISONS[op](pc.field(column), value)
+        else:
+            raise ValueError(f"Unsupported filter operator: {op}")
+        expression = term if expression is None else expression & term
+    return expression
+
+def read_parquet_selective(source: Any,
+                           columns: Union[List[str], Callable[[str], bool], None] = None,
+                           filters: Optional[Sequence[Filter]] = None) -> pd.DataFrame:
+    """Read only the columns and row groups a caller needs from a parquet file.
+
+    Row groups whose statistics rule out every filter are skipped before
+    any of their data is read, and the remaining rows are filtered after
+    decoding. With a RangedObjectFile source this means only the footer and
+    the needed column chunks leave the object store.
+
+    Args:
+        source: Parquet file path or file-like object, e.g. RangedObjectFile
+            or a pyarrow memory map
+        columns: Columns to return, or a predicate over column names; None
+            returns every column
+        filters: (column, op, value) conditions, all of which must hold; op
+            is one of ==, !=, <, <=, >, >=, in
+
+    Returns:
+        pd.DataFrame: Matching rows of the selected columns
+    """
+    filters = list(filters or [])
+    parquet_file = pq.ParquetFile(source)
+    names = parquet_file.schema_arrow.names
+
+    if columns is None:
+        selected = list(names)
+    elif callable(columns):
+        selected = [name for name in names if columns(name)]
+    else:
+        selected = [name for name in columns if name in names]
+    filter_columns = [column for column, _, _ in filters if column not in selected]
+    missing = [column for column in filter_columns if column not in names]
+    if missing:
+        raise ValueError(f"Filter columns not in file: {missing}")
+
+    row_groups = [
+        i for i in range(parquet_file.num_row_groups)
+        if _row_group_may_match(parquet_file.metadata, i, filters)
+    ]
+    if not row_groups:
+        return parquet_file.schema_arrow.empty_table().select(selected).to_pandas()
+
+    table = parquet_file.read_row_groups(row_groups, columns=selected + filter_columns)
+    if filters:
+        table = table.filter(_filter_expression(filters))
+    logger.debug(
+        f"Read {len(selected)}/{len(names)} columns and "
+        f"{len(row_groups)}/{parquet_file.num_row_groups} row groups"
+    )
+    return table.select(selected).to_pandas()
@@ -0,0 +1,304 @@
+import logging
+from typing import Any, Dict, Iterable, List, Sequence, Tuple
+
+import psycopg2
+
+logger = logging.getLogger(__name__)
+
+# Fact tables list-partitioned by survey year
+PARTITIONED_TABLES = ["fact_survey", "fact_expenditure", "fact_crop_yield"]
+
+def year_predicate(values: Iterable[Any], column: str = "survey_year", alias: str = "") -> Tuple[str, tuple]:
+    """Build a partition-key condition the planner can prune on.
+
+    Pruning needs the bare key compared with constants: "survey_year = 2021"
+    or "survey_year IN (2020, 2021)" scan only those partitions, while casts
+    or functions on the key (survey_year::text = '2021') scan them all.
+    Parameters are rendered client-side by psycopg2, so they reach the
+    planner as constants.
+
+    Args:
+        values: Partition values to keep
+        column: Partition key column
+        alias: Table alias to qualify the column with
+
+    Returns:
+        Tuple[str, tuple]: SQL condition and its parameters
+    """
+    values = tuple(dict.fromkeys(values))
+    if not values:
+        raise ValueError("At least one partition value is required")
+    key = f"{alias}.{column}" if alias else column
+    if len(values) == 1:
+        return f"{key} = %s", values
+    return f"{key} IN ({', '.join(['%s'] * len(values))})", values
+
+class PartitionManager:
+    """Maintains the list partitions of the warehouse fact tables."""
+
+    def __init__(self, db_conn: psycopg2.extensions.connection):
+        """Initialize the partition manager.
+
+        Args:
+            db_conn: PostgreSQL connection
+        """
+        self.conn = db_conn
+
+    @staticmethod
+    def partition_name(parent: str, value: Any) -> str:
+        """Name of the partition holding one value, e.g. fact_survey_2021."""
+        return f"{parent}_{value}"
+
+    def is_partitioned(self, table: str) -> bool:
+        """Check whether a table exists and is partitioned."""
+        with self.conn.cursor() as cur:
+            cur.execute("""
+                SELECT 1
+                FROM pg_partitioned_table pt
+                JOIN pg_class c ON c.oid = pt.partrelid
+                WHERE c.relname = %s
+            """, (table,))
+            return cur.fetchone() is not None
+
+    def list_partitions(self, parent: str) -> Dict[str, str]:
+        """Get the partitions of a table with their bounds.
+
+        Returns:
+            Dict[str, str]: Partition name to bound, e.g. "FOR VALUES IN (2021)"
+        """
+        with self.conn.cursor() as cur:
+            cur.execute("""
+                SELECT c.relname, pg_get_expr(c.relpartbound, c.oid)
+                FROM pg_inherits i
+                JOIN pg_class c ON c.oid = i.inhrelid
+                JOIN pg_class p ON p.oid = i.inhparent
+                WHERE p.relname = %s
+                ORDER BY c.relname
+            """, (parent,))
+            return {row[0]: row[1] for row in cur.fetchall()}
+
+    def partition_for(self, parent: str, value: Any) -> str:
+        """Relation to scan for one value: its partition, or the parent if there is none.
+
+        Querying the partition directly touches only that year even when
+        the condition could not be pruned at plan time (generic plans, joins).
+        """
+        return self.partition_name(parent, value) if self.partition_exists(parent, value) else parent
+
+    def ensure_partitions(self, parent: str, values: Iterable[Any]) -> List[str]:
+        """Create any missing list partitions for the given values.
+
+        Args:
+            parent: Partitioned table
+            values: Partition values, e.g. survey years
+
+        Returns:
+            List[str]: Partitions created
+        """
+        created = []
+        try:
+            with self.conn.cursor() as cur:
+                for value in sorted(set(values)):
+                    if self.partition_exists(parent, value):
+                        continue
+                    partition = self.partition_name(parent, value)
+                    cur.execute(f"""
+                        CREATE TABLE IF NOT EXISTS {partition}
+                        PARTITION OF {parent} FOR VALUES IN (%s)
+                    """, (value,))
+                    created.append(partition)
+            self.conn.commit()
+            if created:
+                logger.info(f"Created partitions {created} of {parent}")
+            return created
+        except Exception as e:
+            self.conn.rollback()
+            logger.error(f"Failed to create partitions of {parent}: {e}")
+            raise
+
+    def ensure_partitions_from(self,
+                               parents: Sequence[str],
+                               source: str = "staging_survey",
+                               column: str = "survey_year") -> Dict[str, List[str]]:
+        """Create the partitions needed for every value present in a source table.
+
+        Args:
+            parents: Partitioned tables
+            source: Table whose values will be loaded
+            column: Partition key column, in both source and parents
+
+        Returns:
+            Dict[str, List[str]]: Partitions created per parent
+        """
+        with self.conn.cursor() as cur:
+            cur.execute(f"SELECT DISTINCT {column} FROM {source} WHERE {column} IS NOT NULL")
+            values = [row[0] for row in cur.fetchall()]
+        return {parent: self.ensure_partitions(parent, values) for parent in parents}
+
+    def convert_to_partitioned(self, table: str, column: str = "survey_year") -> bool:
+        """Rebuild a plain table as a table list-partitioned by a column.
+
+        Columns, defaults, generated columns, CHECK, primary key and foreign
+        keys are carried over, and one partition is created per value
+        present. Runs in one transaction; a table that is already
+        partitioned or does not exist is left alone.
+
+        Args:
+            table: Table to convert; its primary key must include column
+            column: Partition key column
+
+        Returns:
+            bool: Whether the table was converted
+        """
+        with self.conn.cursor() as cur:
+            cur.execute("SELECT to_regclass(%s) IS NOT NULL", (table,))
+            exists = cur.fetchone()[0]
+        if not exists or self.is_partitioned(table):
+            return False
+
+        old = f"{table}_unpartitioned"
+        try:
+            with self.conn.cursor() as cur:
+                cur.execute(f"LOCK TABLE {table} IN ACCESS EXCLUSIVE MODE")
+                cur.execute("""
+                    SELECT conname, contype, pg_get_constraintdef(oid)
+                    FROM pg_constraint
+                    WHERE conrelid = %s::regclass AND contype IN ('p', 'f')
+                    ORDER BY contype DESC
+                """, (table,))
+                constraints = cur.fetchall()
+                cur.execute("""
+                    SELECT attname
+                    FROM pg_attribute
+                    WHERE attrelid = %s::regclass AND attnum > 0
+                    AND NOT attisdropped AND attgenerated = ''
+                    ORDER BY attnum
+                """, (table,))
+                columns = [row[0] for row in cur.fetchall()]
+                cur.execute(f"SELECT DISTINCT {column} FROM {table} WHERE {column} IS NOT NULL")
+                values = sorted(row[0] for row in cur.fetchall())
+
+                cur.execute(f"ALTER TABLE {table} RENAME TO {old}")
+                for name, contype, _ in constraints:
+                    if contype == "p":
+                        # Frees the primary key's index name for the new table
+                        cur.execute(f"ALTER TABLE {old} RENAME CONSTRAINT {name} TO {old}_pkey")
+                cur.execute(f"""
+                    CREATE TABLE {table}
+                    (LIKE {old} INCLUDING DEFAULTS INCLUDING GENERATED INCLUDING CONSTRAINTS)
+                    PARTITION BY LIST ({column})
+                """)
+                for name, contype, definition in constraints:
+                    if contype == "p":
+                        cur.execute(f"ALTER TABLE {table} ADD CONSTRAINT {name} {definition}")
+                for value in values:
+                    cur.execute(f"""
+                        CREATE TABLE {self.partition_name(table, value)}
+                        PARTITION OF {table} FOR VALUES IN (%s)
+                    """, (value,))
+                cur.execute(f"""
+                    INSERT INTO {table} ({', '.join(columns)})
+                    SELECT {', '.join(columns)} FROM {old}
+                """)
+                # Foreign keys are validated once over the copied rows
+                for name, contype, definition in constraints:
+                    if contype == "f":
+                        cur.execute(f"ALTER TABLE {table} ADD CONSTRAINT {name} {definition}")
+                cur.execute(f"DROP TABLE {old}")
+            self.conn.commit()
+            logger.info(f"Partitioned {table} by {column} into {len(values)} partitions")
+            return True
+        except Exception as e:
+            self.conn.rollback()
+            logger.error(f"Failed to partition {table}: {e}")
+            raise
+
+    def partition_exists(self, parent: str, value: Any) -> bool:
+        """Check whether the parent has a partition attached under the standard name."""
+        with self.conn.cursor() as cur:
+            cur.execute("""
+                SELECT 1
+                FROM pg_inherits i
+                JOIN pg_class c ON c.oid = i.inhrelid
+                JOIN pg_class p ON p.oid = i.inhparent
+                WHERE p.relname = %s AND c.relname = %s
+            """, (parent, self.partition_name(parent, value)))
+            return cur.fetchone() is not None
+
+    def swap_partition(self,
+                       parent: str,
+                       value: Any,
+                       columns: List[str],
+                       select_sql: str,
+                       params: Sequence[Any] = (),
+                       key_columns: Sequence[str] = ("hhid_2", "survey_year"),
+                       partition_column: str = "survey_year") -> int:
+        """Rebuild one list partition off to the side and swap it in atomically.
+
+        The rows are written to an UNLOGGED copy of the parent (LIKE ...
+        INCLUDING GENERATED, so generated row_hash columns match), which is
+        made durable, indexed and constrained in bulk. The old partition is
+        then detached and dropped and the new table attached in one short
+        transaction, so readers see either the old or the new partition and
+        the load pays no per-row conflict checks or index maintenance.
+
+        Args:
+            parent: Partitioned table, e.g. fact_survey
+            value: Partition value, e.g. 2021
+            columns: Columns filled by select_sql
+            select_sql: Query returning the partition's rows, with no
+                duplicate keys and only rows of this value
+            params: Query parameters
+            key_columns: Primary key of the parent
+            partition_column: Column the parent is partitioned by
+
+        Returns:
+            int: Rows in the new partition
+        """
+        partition = self.partition_name(parent, value)
+        staging = f"{partition}_load"
+        try:
+            with self.conn.cursor() as cur:
+                cur.execute(f"DROP TABLE IF EXISTS {staging}")
+                cur.execute(f"""
+                    CREATE UNLOGGED TABLE {staging}
+                    (LIKE {parent} INCLUDING DEFAULTS INCLUDING GENERATED)
+                """)
+                cur.execute(f"INSERT INTO {staging} ({', '.join(columns)}) {select_sql}", params)
+                rows = cur.rowcount
+
+                # SET LOGGED rewrites the table, so the index is built afterwards
+                cur.execute(f"ALTER TABLE {staging} SET LOGGED")
+                cur.execute(f"""
+                    ALTER TABLE {staging}
+                    ADD CONSTRAINT {staging}_pkey PRIMARY KEY ({', '.join(key_columns)})
+                """)
+                # Proves the partition bound so ATTACH skips its validation scan
+                cur.execute(f"""
+                    ALTER TABLE {staging}
+                    ADD CONSTRAINT {staging}_bound
+                    CHECK ({partition_column} IS NOT NULL AND {partition_column} = %s)
+                """, (value,))
+                cur.execute(f"ANALYZE {staging}")
+            self.conn.commit()
+
+            replaced = self.partition_exists(parent, value)
+            with self.conn.cursor() as cur:
+                if replaced:
+                    cur.execute(f"ALTER TABLE {parent} DETACH PARTITION {partition}")
+                    cur.execute(f"DROP TABLE {partition}")
+                cur.execute(f"ALTER TABLE {staging} RENAME TO {partition}")
+                cur.execute(f"ALTER INDEX {staging}_pkey RENAME TO {partition}_pkey")
+                cur.execute(f"ALTER TABLE {parent} ATTACH PARTITION {partition} FOR VALUES IN (%s)", (value,))
+                cur.execute(f"ALTER TABLE {partition} DROP CONSTRAINT {staging}_bound")
+            self.conn.commit()
+
+            logger.info(f"{'Replaced' if replaced else 'Attached'} {partition} with {rows} rows")
+            return rows
+        except Exception as e:
+            self.conn.rollback()
+            with self.conn.cursor() as cur:
+                cur.execute(f"DROP TABLE IF EXISTS {staging}")
+            self.conn.commit()
+            logger.error(f"Failed to swap in {partition}: {e}")
+            raise
@@ -746,15 +746,17 @@ class SurveyDataQualityValidator:
             with self.conn.cursor() as cur:
                 # Check household-survey relationship
                 if table_name == "fact_survey":
+                    # Both join sides compare survey_year with the constant, so
+                    # each side is pruned to the one year's partition
                     cur.execute("""
                         SELECT COUNT(*)
                         FROM fact_survey s
                         LEFT JOIN fact_expenditure e
                         ON s.hhid_2 = e.hhid_2
-                        AND s.survey_year = e.survey_year
+                        AND e.survey_year = %s
                         WHERE s.survey_year = %s
                         AND e.hhid_2 IS NULL
-                    """, (survey_year,))
+                    """, (survey_year, survey_year))
                     missing_exp_count = cur.fetchone()[0]
                     
                     cur.execute("""
@@ -781,16 +783,17 @@ class SurveyDataQualityValidator:
                 
                 # Check expenditure-crop relationship
                 if table_name == "fact_expenditure":
+                    # Pruned to one partition per side, as above
                     cur.execute("""
                         SELECT COUNT(*)
                         FROM fact_expenditure e
                         LEFT JOIN fact_crop_yield c
                         ON e.hhid_2 = c.hhid_2
-                        AND e.survey_year = c.survey_year
+                        AND c.survey_year = %s
                         WHERE e.survey_year = %s
                         AND e.expenditure_type = 'Food'
                         AND c.hhid_2 IS NULL
-                    """, (survey_year,))
+                    """, (survey_year, survey_year))
                     missing_crop_count = cur.fetchone()[0]
                     
                     cur.execute("""
@@ -198,6 +198,30 @@ class SchemaManager:
             logger.error(f"Failed to get column definition for {column_name}: {e}")
             return None
     
+    def get_column_types(self, survey_year: int) -> Dict[str, DataType]:
+        """Get the current data type of every registered column for a year.
+        
+        Args:
+            survey_year: Year of the survey
+            
+        Returns:
+            Dict[str, DataType]: Column name to data type
+        """
+        try:
+            with self.conn.cursor() as cur:
+                cur.execute("""
+                    SELECT DISTINCT ON (column_name) column_name, data_type
+                    FROM schema_registry
+                    WHERE survey_year = %s
+                    AND deprecated_date IS NULL
+                    ORDER BY column_name, version DESC
+                """, (survey_year,))
+                return {row[0]: DataType(row[1]) for row in cur.fetchall()}
+                
+        except Exception as e:
+            logger.error(f"Failed to get column types for year {survey_year}: {e}")
+            return {}
+    
     def detect_schema_changes(self, 
                             current_year: int, 
                             previous_year: int) -> Dict[str, List[str]]:
@@ -0,0 +1,382 @@
+import io
+import json
+import logging
+import uuid
+from dataclasses import asdict, dataclass, field
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Sequence
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from minio.error import S3Error
+
+from lib.data_lake import DataLakeManager
+from lib.file_stats import parquet_column_stats, stats_may_match
+from lib.parquet_reader import Filter, RangedObjectFile
+
+logger = logging.getLogger(__name__)
+
+TABLES_PREFIX = "tables"
+
+# Claims older than this belong to a writer that died mid-commit
+CLAIM_TIMEOUT = timedelta(minutes=10)
+
+@dataclass
+class DataFile:
+    """A parquet file belonging to a table snapshot."""
+    object_name: str
+    row_count: int
+    size: int
+    added_version: int
+    # column -> {"min": ..., "max": ..., "null_count": ...}
+    column_stats: Dict[str, Dict[str, Any]] = field(default_factory=dict)
+
+@dataclass
+class Snapshot:
+    """One committed version of a table."""
+    version: int
+    committed_at: str
+    operation: str
+    files: List[DataFile]
+    parent_version: Optional[int] = None
+    commit_id: str = ""
+    summary: Dict[str, Any] = field(default_factory=dict)
+
+    @property
+    def timestamp(self) -> datetime:
+        return datetime.fromisoformat(self.committed_at)
+
+class SnapshotTable:
+    """Versioned table of parquet files in the data lake.
+
+    Every commit writes one immutable JSON snapshot, tables/<name>/_snapshots/
+    <version>.json, listing the table's data files with their row counts and
+    column stats. Writing that single object is the commit, so readers see
+    either the previous snapshot or the new one in full. current.json is a
+    hint pointing at the latest version; readers probe past it in case a
+    commit landed after the hint was written.
+
+    Object stores offer no put-if-absent here, so a commit first claims its
+    version with a uniquely named object under _claims/<version>/ and only
+    writes the snapshot if its claim is the only one. Of two concurrent
+    commits to one version at most one goes ahead; the other raises
+    RuntimeError so the caller can retry on the new snapshot. Claims are
+    removed once the commit ends either way, and claims older than
+    CLAIM_TIMEOUT are treated as abandoned, so a crashed writer cannot
+    block the table.
+    """
+
+    def __init__(self, lake: DataLakeManager, name: str):
+        """Open a table, which need not exist yet.
+
+        Args:
+            lake: Data lake holding the table
+            name: Table name, used as its directory under tables/
+        """
+        self.lake = lake
+        self.name = name
+        self.location = f"{TABLES_PREFIX}/{name}"
+        self._snapshots: Dict[int, Snapshot] = {}
+
+    def _snapshot_object(self, version: int) -> str:
+        return f"{self.location}/_snapshots/{version:08d}.json"
+
+    def _claim_prefix(self, version: int) -> str:
+        return f"{self.location}/_claims/{version:08d}/"
+
+    @property
+    def _hint_object(self) -> str:
+        return f"{self.location}/_snapshots/current.json"
+
+    def _get_json(self, object_name: str) -> Optional[Dict]:
+        """Read a JSON object, returning None if it does not exist."""
+        try:
+            response = self.lake.client.get_object(self.lake.bucket, object_name)
+        except S3Error as e:
+            if e.code == "NoSuchKey":
+                return None
+            raise
+        try:
+            return json.loads(response.read())
+        finally:
+            response.close()
+            response.release_conn()
+
+    def _put_json(self, object_name: str, document: Dict) -> None:
+        data = json.dumps(document, indent=2).encode()
+        self.lake.client.put_object(
+            self.lake.bucket,
+            object_name,
+            io.BytesIO(data),
+            length=len(data),
+            content_type="application/json"
+        )
+
+    def _exists(self, object_name: str) -> bool:
+        try:
+            self.lake.client.stat_object(self.lake.bucket, object_name)
+            return True
+        except S3Error as e:
+            if e.code in ("NoSuchKey", "NoSuchObject", "ResourceNotFound"):
+                return False
+            raise
+
+    def _load(self, version: int) -> Optional[Snapshot]:
+        """Load a snapshot; snapshots are immutable so they are memoized."""
+        if version not in self._snapshots:
+            document = self._get_json(self._snapshot_object(version))
+            if document is None:
+                return None
+            document["files"] = [DataFile(**f) for f in document["files"]]
+            self._snapshots[version] = Snapshot(**document)
+        return self._snapshots[version]
+
+    def current_version(self) -> Optional[int]:
+        """Get the latest committed version, or None for an empty table."""
+        hint = self._get_json(self._hint_object)
+        version = hint["version"] if hint else 0
+        while self._exists(self._snapshot_object(version + 1)):
+            version += 1
+        return version or None
+
+    def versions(self) -> List[int]:
+        """List the versions still available, oldest first."""
+        versions = []
+        for obj in self.lake.client.list_objects(self.lake.bucket, prefix=f"{self.location}/_snapshots/"):
+            stem = obj.object_name.rsplit("/", 1)[-1][:-len(".json")]
+            if stem.isdigit():
+                versions.append(int(stem))
+        return sorted(versions)
+
+    def snapshot(self, version: Optional[int] = None, as_of: Optional[datetime] = None) -> Optional[Snapshot]:
+        """Get a snapshot by version, by time, or the current one.
+
+        Args:
+            version: Snapshot version
+            as_of: Return the last snapshot committed at or before this time
+
+        Returns:
+            Optional[Snapshot]: The snapshot, or None if the table was empty
+        """
+        if version is not None:
+            snapshot = self._load(version)
+            if snapshot is None:
+                raise ValueError(f"Snapshot {version} of {self.name} does not exist or has expired")
+            return snapshot
+
+        current = self.current_version()
+        if current is None:
+            return None
+        if as_of is None:
+            return self._load(current)
+
+        for candidate in reversed(self.versions()):
+            snapshot = self._load(candidate)
+            if snapshot and snapshot.timestamp <= as_of:
+                return snapshot
+        return None
+
+    def files(self,
+              version: Optional[int] = None,
+              as_of: Optional[datetime] = None,
+              filters: Optional[Sequence[Filter]] = None) -> List[DataFile]:
+        """List a snapshot's data files, skipping those the stats rule out.
+
+        Args:
+            version: Snapshot version; defaults to the current one
+            as_of: Snapshot time, see snapshot()
+            filters: (column, op, value) conditions used for file pruning
+
+        Returns:
+            List[DataFile]: Data files that may hold matching rows
+        """
+        snapshot = self.snapshot(version, as_of)
+        if snapshot is None:
+            return []
+        return [f for f in snapshot.files if stats_may_match(f.column_stats, filters or [])]
+
+    def files_added_since(self, version: int) -> List[DataFile]:
+        """Data files in the current snapshot committed after a version.
+
+        Args:
+            version: Last snapshot the caller has processed
+
+        Returns:
+            List[DataFile]: Files an incremental reader still has to read
+        """
+        return [f for f in self.files() if f.added_version > version]
+
+    def read(self,
+             version: Optional[int] = None,
+             as_of: Optional[datetime] = None,
+             columns: Optional[List[str]] = None,
+             filters: Optional[Sequence[Filter]] = None) -> pd.DataFrame:
+        """Read a snapshot of the table.
+
+        Args:
+            version: Snapshot version; defaults to the current one
+            as_of: Snapshot time, see snapshot()
+            columns: Columns to read; None reads all
+            filters: (column, op, value) conditions rows must meet
+
+        Returns:
+            pd.DataFrame: Matching rows
+        """
+        frames = [
+            self.lake.read_parquet(f.object_name, columns=columns, filters=filters)
+            for f in self.files(version, as_of, filters)
+        ]
+        if not frames:
+            return pd.DataFrame(columns=columns)
+        return pd.concat(frames, ignore_index=True)
+
+    def describe_file(self, object_name: str, version: int = 0) -> DataFile:
+        """Build a DataFile from an existing object's parquet footer.
+
+        Only the footer is fetched, through ranged reads.
+        """
+        source = RangedObjectFile(self.lake.client, self.lake.bucket, object_name)
+        metadata = pq.ParquetFile(source).metadata
+        return DataFile(
+            object_name=object_name,
+            row_count=metadata.num_rows,
+            size=source.size,
+            added_version=version,
+            column_stats=parquet_column_stats(metadata)
+        )
+
+    def append(self, df: pd.DataFrame, summary: Optional[Dict] = None) -> Snapshot:
+        """Write a DataFrame as a new data file and commit it.
+
+        Args:
+            df: Rows to append
+            summary: Extra information stored with the snapshot
+
+        Returns:
+            Snapshot: The committed snapshot
+        """
+        object_name = f"{self.location}/data/{datetime.now().strftime('%Y%m%d_%H%M%S')}-{uuid.uuid4().hex[:8]}.parquet"
+        buffer = io.BytesIO()
+        pq.write_table(pa.Table.from_pandas(df, preserve_index=False), buffer, compression="snappy")
+        size = buffer.getbuffer().nbytes
+        buffer.seek(0)
+        self.lake.client.put_object(self.lake.bucket, object_name, buffer, length=size,
+                                    content_type="application/octet-stream")
+        self.lake._catalog_object(object_name, size=size, parquet=buffer.getvalue())
+        return self.commit(added=[object_name], operation="append", summary=summary)
+
+    def commit(self,
+               added: Sequence[str] = (),
+               removed: Sequence[str] = (),
+               operation: str = "append",
+               summary: Optional[Dict] = None) -> Snapshot:
+        """Commit a new snapshot from the current one plus and minus files.
+
+        Args:
+            added: Objects (already written) to add to the table
+            removed: Objects to drop from the table; they stay in the bucket
+                until expire() finds them unreferenced
+            operation: append, overwrite or delete
+            summary: Extra information stored with the snapshot
+
+        Returns:
+            Snapshot: The committed snapshot
+        """
+        parent = self.snapshot()
+        version = (parent.version if parent else 0) + 1
+        dropped = set(removed)
+        files = [f for f in (parent.files if parent else []) if f.object_name not in dropped]
+        files += [self.describe_file(name, version) for name in added]
+
+        snapshot = Snapshot(
+            version=version,
+            committed_at=datetime.now().isoformat(),
+            operation=operation,
+            files=files,
+            parent_version=parent.version if parent else None,
+            commit_id=uuid.uuid4().hex,
+            summary={
+                "added_files": len(added),
+                "removed_files": len(dropped),
+                "total_rows": sum(f.row_count for f in files),
+                **(summary or {})
+            }
+        )
+        object_name = self._snapshot_object(version)
+        if self._exists(object_name):
+            raise RuntimeError(f"Snapshot {version} of {self.name} was committed concurrently")
+
+        # A writer that lists only its own claim wins: any other writer
+        # claims before or after that listing and so sees two claims
+        claim = f"{self._claim_prefix(version)}{snapshot.commit_id}"
+        self._put_json(claim, {"commit_id": snapshot.commit_id})
+        try:
+            if self._other_claims(version, claim) or self._exists(object_name):
+                raise RuntimeError(f"Snapshot {version} of {self.name} was committed concurrently")
+            self._put_json(object_name, asdict(snapshot))
+            if self._get_json(object_name)["commit_id"] != snapshot.commit_id:
+                raise RuntimeError(f"Snapshot {version} of {self.name} was committed concurrently")
+        finally:
+            # Later writers of this version find the snapshot itself, if it was written
+            self.lake.client.remove_object(self.lake.bucket, claim)
+        self._snapshots[version] = snapshot
+        self._put_json(self._hint_object, {"version": version})
+
+        logger.info(f"Committed {self.name} snapshot {version}: {snapshot.summary}")
+        return snapshot
+
+    def _other_claims(self, version: int, claim: str) -> List[str]:
+        """List the live claims on a version besides our own, clearing abandoned ones."""
+        cutoff = datetime.now(timezone.utc) - CLAIM_TIMEOUT
+        live = []
+        for obj in self.lake.client.list_objects(self.lake.bucket, prefix=self._claim_prefix(version)):
+            if obj.object_name == claim:
+                continue
+            if obj.last_modified is not None and obj.last_modified < cutoff:
+                logger.warning(f"Removing abandoned claim {obj.object_name}")
+                self.lake.client.remove_object(self.lake.bucket, obj.object_name)
+                continue
+            live.append(obj.object_name)
+        return live
+
+    def expire(self, older_than: Optional[datetime] = None, retain_last: int = 1) -> Dict[str, int]:
+        """Drop old snapshots and the data files only they reference.
+
+        Args:
+            older_than: Expire snapshots committed before this time; None
+                expires everything outside the retained ones
+            retain_last: Number of most recent snapshots always kept (at least 1)
+
+        Returns:
+            Dict[str, int]: Counts of expired snapshots and deleted files
+        """
+        versions = self.versions()
+        retained = set(versions[-max(retain_last, 1):])
+        expired = [
+            v for v in versions
+            if v not in retained and (older_than is None or self._load(v).timestamp < older_than)
+        ]
+        if not expired:
+            return {"snapshots": 0, "files": 0}
+
+        live = {
+            f.object_name
+            for v in versions if v not in expired
+            for f in self._load(v).files
+        }
+        orphaned = {
+            f.object_name
+            for v in expired
+            for f in self._load(v).files
+        } - live
+
+        # Snapshots go first so no remaining snapshot ever points at a missing file
+        for v in expired:
+            self.lake.delete_file(self._snapshot_object(v))
+            self._snapshots.pop(v, None)
+        for object_name in orphaned:
+            self.lake.delete_file(object_name)
+
+        logger.info(f"Expired {len(expired)} snapshots and {len(orphaned)} files of {self.name}")
+        return {"snapshots": len(expired), "files": len(orphaned)}
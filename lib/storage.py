@@ -0,0 +1,373 @@
+import io
+import json
+import logging
+import os
+import shutil
+import tempfile
+from datetime import datetime, timezone
+from typing import Any, BinaryIO, Dict, Iterator, Optional, Protocol, Tuple
+
+import pandas as pd
+import pyarrow as pa
+import urllib3
+from minio import Minio
+from minio.datatypes import Object
+from minio.error import S3Error
+
+from lib.parquet_reader import RangedObjectFile
+
+logger = logging.getLogger(__name__)
+
+STORAGE_BACKENDS = ("minio", "local")
+
+# Serialized uploads larger than this spill from memory to an anonymous temp file
+DEFAULT_SPILL_BYTES = int(os.getenv("UPLOAD_SPILL_BYTES", 64 * 1024 * 1024))
+
+class ObjectStore(Protocol):
+    """The object store operations the pipeline relies on.
+
+    Minio clients satisfy it as they are; LocalObjectStore implements the
+    same calls over a directory tree.
+    """
+
+    def bucket_exists(self, bucket_name: str) -> bool: ...
+
+    def make_bucket(self, bucket_name: str, location: Optional[str] = None) -> None: ...
+
+    def put_object(self, bucket_name: str, object_name: str, data: BinaryIO, length: int, **kwargs) -> Any: ...
+
+    def fput_object(self, bucket_name: str, object_name: str, file_path: str, **kwargs) -> Any: ...
+
+    def get_object(self, bucket_name: str, object_name: str, offset: int = 0, length: int = 0, **kwargs) -> Any: ...
+
+    def fget_object(self, bucket_name: str, object_name: str, file_path: str, **kwargs) -> Any: ...
+
+    def stat_object(self, bucket_name: str, object_name: str, **kwargs) -> Any: ...
+
+    def list_objects(self, bucket_name: str, prefix: Optional[str] = None, recursive: bool = False,
+                     **kwargs) -> Iterator[Object]: ...
+
+    def remove_object(self, bucket_name: str, object_name: str, **kwargs) -> None: ...
+
+def _no_such_key(bucket_name: str, object_name: str) -> S3Error:
+    return S3Error("NoSuchKey", "Object does not exist", f"/{bucket_name}/{object_name}",
+                   None, None, None, bucket_name, object_name)
+
+class LocalObjectStore:
+    """Object store on the local filesystem with the MinIO client interface.
+
+    Objects live at <root>/<bucket>/<object name>, so they can be memory
+    mapped in place; user metadata is kept in sidecar files under
+    <root>/.meta. Writes go to a temporary file that is renamed into place,
+    so readers never see a partial object. The ETag is derived from mtime
+    and size, which is enough for change detection without hashing.
+    """
+
+    def __init__(self, root: str):
+        """Open (and create if needed) a store rooted at a directory.
+
+        Args:
+            root: Directory holding one subdirectory per bucket
+        """
+        self.root = os.path.abspath(root)
+        self._tmp = os.path.join(self.root, ".tmp")
+        os.makedirs(self._tmp, exist_ok=True)
+        logger.info(f"Using local object store at {self.root}")
+
+    def _path(self, bucket_name: str, object_name: str) -> str:
+        parts = object_name.split("/")
+        if any(part in ("", ".", "..") for part in parts):
+            raise ValueError(f"Invalid object name: {object_name}")
+        return os.path.join(self.root, bucket_name, *parts)
+
+    def _meta_path(self, bucket_name: str, object_name: str) -> str:
+        return os.path.join(self.root, ".meta", bucket_name, *object_name.split("/")) + ".json"
+
+    def local_path(self, bucket_name: str, object_name: str) -> str:
+        """Get the file holding an object, for zero-copy reads.
+
+        Args:
+            bucket_name: Bucket name
+            object_name: Object name
+
+        Returns:
+            str: Path of the object's file
+        """
+        path = self._path(bucket_name, object_name)
+        if not os.path.isfile(path):
+            raise _no_such_key(bucket_name, object_name)
+        return path
+
+    def bucket_exists(self, bucket_name: str) -> bool:
+        return os.path.isdir(os.path.join(self.root, bucket_name))
+
+    def make_bucket(self, bucket_name: str, location: Optional[str] = None, **kwargs) -> None:
+        os.makedirs(os.path.join(self.root, bucket_name), exist_ok=True)
+
+    def _commit(self, bucket_name: str, object_name: str, temp_path: str, metadata: Optional[Dict]) -> Object:
+        """Move a fully written temporary file into place."""
+        path = self._path(bucket_name, object_name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.replace(temp_path, path)
+
+        meta_path = self._meta_path(bucket_name, object_name)
+        if metadata:
+            os.makedirs(os.path.dirname(meta_path), exist_ok=True)
+            with open(meta_path, "w") as f:
+                json.dump({f"x-amz-meta-{key}".lower(): str(value) for key, value in metadata.items()}, f)
+        elif os.path.exists(meta_path):
+            os.remove(meta_path)
+        return self.stat_object(bucket_name, object_name)
+
+    def put_object(self,
+                   bucket_name: str,
+                   object_name: str,
+                   data: BinaryIO,
+                   length: int,
+                   content_type: str = "application/octet-stream",
+                   metadata: Optional[Dict] = None,
+                   part_size: int = 0,
+                   **kwargs) -> Object:
+        """Write an object from a stream; length -1 reads until EOF."""
+        block_size = part_size or 8 * 1024 * 1024
+        remaining = length
+        with tempfile.NamedTemporaryFile(dir=self._tmp, delete=False) as f:
+            try:
+                while remaining != 0:
+                    block = data.read(block_size if remaining < 0 else min(block_size, remaining))
+                    if not block:
+                        break
+                    f.write(block)
+                    remaining -= len(block) if remaining > 0 else 0
+                if remaining > 0:
+                    raise ValueError(f"Stream ended {remaining} bytes short of {length}")
+            except Exception:
+                f.close()
+                os.remove(f.name)
+                raise
+        return self._commit(bucket_name, object_name, f.name, metadata)
+
+    def fput_object(self,
+                    bucket_name: str,
+                    object_name: str,
+                    file_path: str,
+                    content_type: str = "application/octet-stream",
+                    metadata: Optional[Dict] = None,
+                    **kwargs) -> Object:
+        """Write an object from a local file."""
+        fd, temp_path = tempfile.mkstemp(dir=self._tmp)
+        os.close(fd)
+        shutil.copyfile(file_path, temp_path)
+        return self._commit(bucket_name, object_name, temp_path, metadata)
+
+    def _check_precondition(self, stat: Object, request_headers: Optional[Dict]) -> None:
+        expected = (request_headers or {}).get("If-Match")
+        if expected and expected.strip('"') != stat.etag:
+            raise S3Error("PreconditionFailed", "ETag does not match", f"/{stat.bucket_name}/{stat.object_name}",
+                          None, None, None, stat.bucket_name, stat.object_name)
+
+    def get_object(self,
+                   bucket_name: str,
+                   object_name: str,
+                   offset: int = 0,
+                   length: int = 0,
+                   request_headers: Optional[Dict] = None,
+                   **kwargs) -> urllib3.HTTPResponse:
+        """Read an object, or the byte range offset..offset+length."""
+        stat = self.stat_object(bucket_name, object_name)
+        self._check_precondition(stat, request_headers)
+        path = self._path(bucket_name, object_name)
+        if not offset and not length:
+            return urllib3.HTTPResponse(body=open(path, "rb"), status=200, preload_content=False)
+        with open(path, "rb") as f:
+            f.seek(offset)
+            data = f.read(length) if length else f.read()
+        return urllib3.HTTPResponse(body=io.BytesIO(data), status=206, preload_content=False)
+
+    def fget_object(self,
+                    bucket_name: str,
+                    object_name: str,
+                    file_path: str,
+                    request_headers: Optional[Dict] = None,
+                    **kwargs) -> Object:
+        """Copy an object to a local file."""
+        stat = self.stat_object(bucket_name, object_name)
+        self._check_precondition(stat, request_headers)
+        directory = os.path.dirname(os.path.abspath(file_path))
+        os.makedirs(directory, exist_ok=True)
+        shutil.copyfile(self._path(bucket_name, object_name), file_path)
+        return stat
+
+    def stat_object(self, bucket_name: str, object_name: str, **kwargs) -> Object:
+        path = self._path(bucket_name, object_name)
+        try:
+            stat = os.stat(path)
+        except (FileNotFoundError, NotADirectoryError):
+            raise _no_such_key(bucket_name, object_name) from None
+        metadata = None
+        meta_path = self._meta_path(bucket_name, object_name)
+        if os.path.exists(meta_path):
+            with open(meta_path) as f:
+                metadata = json.load(f)
+        return Object(
+            bucket_name,
+            object_name,
+            last_modified=datetime.fromtimestamp(stat.st_mtime, timezone.utc),
+            etag=f"{stat.st_mtime_ns:x}-{stat.st_size:x}",
+            size=stat.st_size,
+            metadata=metadata
+        )
+
+    def list_objects(self,
+                     bucket_name: str,
+                     prefix: Optional[str] = None,
+                     recursive: bool = False,
+                     **kwargs) -> Iterator[Object]:
+        """List objects in name order; without recursive, subdirectories are
+        returned once as names ending in "/"."""
+        prefix = prefix or ""
+        bucket_root = os.path.join(self.root, bucket_name)
+        base = prefix.rpartition("/")[0]
+        base_dir = os.path.join(bucket_root, *base.split("/")) if base else bucket_root
+        if not os.path.isdir(base_dir):
+            return
+
+        if recursive:
+            names = []
+            for directory, _, files in os.walk(base_dir):
+                relative = os.path.relpath(directory, bucket_root)
+                for file_name in files:
+                    name = file_name if relative == "." else f"{relative.replace(os.sep, '/')}/{file_name}"
+                    if name.startswith(prefix):
+                        names.append(name)
+            for name in sorted(names):
+                yield self.stat_object(bucket_name, name)
+            return
+
+        for entry in sorted(os.listdir(base_dir)):
+            name = f"{base}/{entry}" if base else entry
+            if not name.startswith(prefix):
+                continue
+            if os.path.isdir(os.path.join(base_dir, entry)):
+                yield Object(bucket_name, f"{name}/")
+            else:
+                yield self.stat_object(bucket_name, name)
+
+    def remove_object(self, bucket_name: str, object_name: str, **kwargs) -> None:
+        """Delete an object; like S3, deleting a missing object succeeds."""
+        bucket_root = os.path.join(self.root, bucket_name)
+        for path, stop in ((self._path(bucket_name, object_name), bucket_root),
+                           (self._meta_path(bucket_name, object_name), os.path.join(self.root, ".meta", bucket_name))):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                continue
+            # Drop emptied directories so listings match S3's implicit prefixes
+            directory = os.path.dirname(path)
+            while directory != stop and directory.startswith(stop):
+                try:
+                    os.rmdir(directory)
+                except OSError:
+                    break
+                directory = os.path.dirname(directory)
+
+def create_storage_client(backend: Optional[str] = None,
+                          endpoint: Optional[str] = None,
+                          access_key: Optional[str] = None,
+                          secret_key: Optional[str] = None,
+                          secure: Optional[bool] = None,
+                          root: Optional[str] = None,
+                          http_client: Optional[urllib3.PoolManager] = None) -> ObjectStore:
+    """Create the object store client selected by configuration.
+
+    Unset arguments fall back to STORAGE_BACKEND (minio or local),
+    MINIO_ENDPOINT, MINIO_ACCESS_KEY, MINIO_SECRET_KEY, MINIO_SECURE and
+    LOCAL_STORAGE_ROOT.
+
+    Args:
+        backend: "minio" for MinIO/S3, "local" for LocalObjectStore
+        endpoint: MinIO endpoint
+        access_key: MinIO access key
+        secret_key: MinIO secret key
+        secure: Whether to use HTTPS
+        root: Directory of the local store
+        http_client: Connection pool for the MinIO client
+
+    Returns:
+        ObjectStore: Client for the selected backend
+    """
+    backend = (backend or os.getenv("STORAGE_BACKEND", "minio")).lower()
+    if backend == "local":
+        return LocalObjectStore(root or os.getenv("LOCAL_STORAGE_ROOT", "data_lake"))
+    if backend not in STORAGE_BACKENDS:
+        raise ValueError(f"Unknown storage backend {backend!r}, expected one of {STORAGE_BACKENDS}")
+
+    if secure is None:
+        secure = os.getenv("MINIO_SECURE", "false").lower() == "true"
+    return Minio(
+        endpoint or os.getenv("MINIO_ENDPOINT", "localhost:9000"),
+        access_key=access_key or os.getenv("MINIO_ACCESS_KEY", "minioadmin"),
+        secret_key=secret_key or os.getenv("MINIO_SECRET_KEY", "minioadmin"),
+        secure=secure,
+        http_client=http_client
+    )
+
+def local_path(client: ObjectStore, bucket_name: str, object_name: str) -> Optional[str]:
+    """Path of an object if the client keeps it on the local filesystem."""
+    if isinstance(client, LocalObjectStore):
+        return client.local_path(bucket_name, object_name)
+    return None
+
+def open_object(client: ObjectStore, bucket_name: str, object_name: str) -> Any:
+    """Open an object for random access reads, e.g. by a parquet reader.
+
+    Local objects are memory mapped in place; remote ones are read with
+    ranged GETs.
+    """
+    path = local_path(client, bucket_name, object_name)
+    if path is not None:
+        return pa.memory_map(path)
+    return RangedObjectFile(client, bucket_name, object_name)
+
+def put_dataframe(client: ObjectStore,
+                  bucket_name: str,
+                  object_name: str,
+                  df: pd.DataFrame,
+                  spill_threshold: int = DEFAULT_SPILL_BYTES,
+                  part_size: int = 16 * 1024 * 1024,
+                  metadata: Optional[Dict] = None,
+                  **parquet_kwargs) -> Tuple[Any, int]:
+    """Upload a DataFrame as parquet without a named temporary file.
+
+    The parquet bytes are written to a SpooledTemporaryFile, which stays in
+    memory up to spill_threshold and only then rolls over to an anonymous,
+    per-call temp file. Concurrent uploads therefore never share a path, and
+    small files never touch the disk.
+
+    Args:
+        client: Object store client
+        bucket_name: Bucket name
+        object_name: Object name
+        df: Data to upload
+        spill_threshold: Bytes held in memory before spilling to disk
+        part_size: Multipart part size for large uploads
+        metadata: User metadata stored with the object
+        **parquet_kwargs: Passed to DataFrame.to_parquet, e.g. index=False
+
+    Returns:
+        Tuple[Any, int]: The client's put result and the object size
+    """
+    with tempfile.SpooledTemporaryFile(max_size=spill_threshold) as buffer:
+        df.to_parquet(buffer, **parquet_kwargs)
+        size = buffer.tell()
+        buffer.seek(0)
+        result = client.put_object(
+            bucket_name,
+            object_name,
+            buffer,
+            length=size,
+            part_size=part_size,
+            content_type="application/octet-stream",
+            metadata=metadata
+        )
+    return result, size
@@ -0,0 +1,355 @@
+import logging
+from dataclasses import dataclass
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+from lib.schema import DataType
+
+logger = logging.getLogger(__name__)
+
+# Survey codes for "don't know" / "refused", treated as missing
+MISSING_VALUE_CODES = [-98, -99]
+
+# Source column -> staging_survey column
+STAGING_COLUMN_MAP = {
+    "hhid_2": "hhid_2", "survey_year": "survey_year", "SubmissionDate": "submission_date",
+    "duration": "duration", "district": "district", "pre_district": "pre_district",
+    "pre_subcounty": "pre_subcounty", "pre_parish": "pre_parish", "pre_cluster": "pre_cluster",
+    "pre_village": "pre_village", "Quartile": "quartile", "pre_vid": "pre_vid",
+    "survey_type": "survey_type", "status": "status", "respondent_sex": "respondent_sex",
+    "hhh_sex": "hhh_sex", "hhh_age": "hhh_age", "hhh_educ_level": "hhh_educ_level",
+    "spouse_sex": "spouse_sex", "spouse_age": "spouse_age", "spouse_educ_level": "spouse_educ_level",
+    "no_wives": "no_wives", "tot_hhmembers": "tot_hhmembers", "hh_size": "hh_size",
+    "females_hh_count": "females_hh_count", "children_num_u5": "children_num_u5",
+    "Material_walls": "material_walls", "Material_roof": "material_roof",
+    "Fuel_source_cooking": "fuel_source_cooking",
+    "Every_Member_at_least_ONE_Pair_of_Shoes": "every_member_shoes",
+    "asp_actual_income": "asp_actual_income", "cereals_week": "cereals_week",
+    "tubers_week": "tubers_week", "medical_care_annual": "medical_care_annual"
+}
+
+# Columns read from every survey round
+CORE_COLUMNS = [
+    "hhid_2", "hhid_2_again", "survey_year", "SubmissionDate", "duration", "district",
+    "pre_district", "pre_subcounty", "pre_parish", "pre_cluster", "pre_village",
+    "Quartile", "pre_vid", "survey_type", "status", "respondent_sex", "hhh_sex",
+    "hhh_age", "hhh_educ_level", "spouse_sex", "spouse_age", "spouse_educ_level",
+    "no_wives", "tot_hhmembers", "hh_size", "females_hh_count", "children_num_u5",
+    "Material_walls", "Material_roof", "Fuel_source_cooking",
+    "Every_Member_at_least_ONE_Pair_of_Shoes", "asp_actual_income", "cereals_week",
+    "tubers_week", "medical_care_annual"
+]
+
+# Read-time dtypes for the core columns. Repeating labels become categoricals
+# and counts become the smallest nullable int that holds them (including the
+# -98/-99 codes); money stays float64 so row hashes match the warehouse.
+CORE_DTYPES = {
+    "hhid_2": "string[pyarrow]",
+    "hhid_2_again": "string[pyarrow]",
+    "survey_year": "Int16",
+    "duration": "Int32",
+    "district": "category",
+    "pre_district": "category",
+    "pre_subcounty": "category",
+    "pre_parish": "category",
+    "pre_cluster": "category",
+    "pre_village": "category",
+    "Quartile": "category",
+    "pre_vid": "Int32",
+    "survey_type": "Int8",
+    "status": "category",
+    "respondent_sex": "category",
+    "hhh_sex": "category",
+    "hhh_age": "Int16",
+    "hhh_educ_level": "category",
+    "spouse_sex": "category",
+    "spouse_age": "Int16",
+    "spouse_educ_level": "category",
+    "no_wives": "Int8",
+    "tot_hhmembers": "Int8",
+    "hh_size": "Int8",
+    "females_hh_count": "Int8",
+    "children_num_u5": "Int8",
+    "Material_walls": "category",
+    "Material_roof": "category",
+    "Fuel_source_cooking": "category",
+    "Every_Member_at_least_ONE_Pair_of_Shoes": "Int8",
+    "asp_actual_income": "float64",
+    "cereals_week": "float64",
+    "tubers_week": "float64",
+    "medical_care_annual": "float64"
+}
+
+DATE_COLUMNS = ["SubmissionDate"]
+
+# Dtypes for columns only known from the schema registry
+REGISTRY_DTYPES = {
+    DataType.VARCHAR: "category",
+    DataType.INTEGER: "Int32",
+    DataType.DECIMAL: "float64",
+    DataType.BOOLEAN: "Int8"
+}
+
+def survey_dtypes(columns: Iterable[str],
+                  registry: Optional[Dict[str, DataType]] = None) -> Tuple[Dict[str, str], List[str]]:
+    """Build the read-time dtype plan for a set of survey columns.
+
+    Args:
+        columns: Column names present in the file
+        registry: Column types from the schema registry, used for columns
+            the core plan does not cover
+
+    Returns:
+        Tuple[Dict[str, str], List[str]]: dtype per column and the columns
+        to parse as datetimes
+    """
+    dtypes = {}
+    parse_dates = []
+    for col in columns:
+        data_type = (registry or {}).get(col)
+        if col in DATE_COLUMNS or (col not in CORE_DTYPES and data_type == DataType.TIMESTAMP):
+            parse_dates.append(col)
+        elif col in CORE_DTYPES:
+            dtypes[col] = CORE_DTYPES[col]
+        elif data_type in REGISTRY_DTYPES:
+            dtypes[col] = REGISTRY_DTYPES[data_type]
+    return dtypes, parse_dates
+
+def apply_survey_dtypes(df: pd.DataFrame,
+                        registry: Optional[Dict[str, DataType]] = None) -> pd.DataFrame:
+    """Cast an already loaded frame to the dtype plan, column by column.
+
+    Columns whose values do not fit their planned dtype keep the inferred
+    one, so one bad value never fails the whole read.
+
+    Args:
+        df: Survey data
+        registry: Column types from the schema registry
+
+    Returns:
+        pd.DataFrame: The same frame with planned dtypes applied where possible
+    """
+    dtypes, parse_dates = survey_dtypes(df.columns, registry)
+    for col in parse_dates:
+        df[col] = pd.to_datetime(df[col], errors="coerce")
+    for col, dtype in dtypes.items():
+        try:
+            df[col] = df[col].astype(dtype)
+        except (TypeError, ValueError) as e:
+            logger.warning(f"Keeping inferred dtype for {col}: {e}")
+    return df
+
+def read_survey_csv(file_path: str,
+                    usecols: Optional[List[str]] = None,
+                    registry: Optional[Dict[str, DataType]] = None,
+                    chunksize: Optional[int] = None) -> Union[pd.DataFrame, Iterator[pd.DataFrame]]:
+    """Read a survey CSV with the central dtype plan.
+
+    Whole-file reads parse straight into the planned dtypes with the
+    multithreaded pyarrow CSV engine. If a value does not fit its planned
+    dtype the file is re-read untyped and cast column by column. Chunked
+    reads need the C engine and cast each chunk after parsing, since a bad
+    value would otherwise only surface part way through the file.
+
+    Args:
+        file_path: Path to the CSV file
+        usecols: Columns to read; None reads all
+        registry: Column types from the schema registry
+        chunksize: Rows per chunk; returns an iterator of frames when set
+
+    Returns:
+        Union[pd.DataFrame, Iterator[pd.DataFrame]]: Typed survey data
+    """
+    if chunksize:
+        return (
+            apply_survey_dtypes(chunk, registry)
+            for chunk in pd.read_csv(file_path, usecols=usecols, chunksize=chunksize)
+        )
+
+    header = pd.read_csv(file_path, nrows=0).columns
+    columns = [col for col in header if usecols is None or col in usecols]
+    dtypes, parse_dates = survey_dtypes(columns, registry)
+    try:
+        return pd.read_csv(
+            file_path,
+            usecols=usecols,
+            dtype=dtypes,
+            parse_dates=parse_dates,
+            engine="pyarrow"
+        )
+    except (TypeError, ValueError) as e:
+        # pyarrow.ArrowInvalid subclasses ValueError
+        logger.warning(f"Typed read of {file_path} failed, casting after read: {e}")
+        return apply_survey_dtypes(pd.read_csv(file_path, usecols=usecols), registry)
+
+@dataclass
+class FactTable:
+    """Key and content columns of a star-schema fact table."""
+    name: str
+    key_columns: List[str]
+    content_columns: Dict[str, DataType]
+
+# Content columns are the ones covered by row_hash; derived columns such as
+# total_expenditure are left out since they follow from the others
+FACT_TABLES = {
+    "fact_survey": FactTable(
+        name="fact_survey",
+        key_columns=["hhid_2", "survey_year"],
+        content_columns={
+            "submission_date": DataType.TIMESTAMP,
+            "duration": DataType.INTEGER,
+            "survey_type": DataType.INTEGER,
+            "status": DataType.VARCHAR,
+            "tot_hhmembers": DataType.INTEGER,
+            "hh_size": DataType.INTEGER,
+            "females_hh_count": DataType.INTEGER,
+            "children_num_u5": DataType.INTEGER,
+            "asp_actual_income": DataType.DECIMAL,
+            "material_walls": DataType.VARCHAR,
+            "material_roof": DataType.VARCHAR,
+            "fuel_source_cooking": DataType.VARCHAR,
+            "every_member_shoes": DataType.BOOLEAN
+        }
+    ),
+    "fact_expenditure": FactTable(
+        name="fact_expenditure",
+        key_columns=["hhid_2", "survey_year"],
+        content_columns={
+            "cereals_week": DataType.DECIMAL,
+            "tubers_week": DataType.DECIMAL,
+            "medical_care_annual": DataType.DECIMAL
+        }
+    ),
+    "fact_crop_yield": FactTable(
+        name="fact_crop_yield",
+        key_columns=["hhid_2", "survey_year", "crop_type"],
+        content_columns={
+            "planted_qty": DataType.DECIMAL,
+            "total_yield": DataType.DECIMAL,
+            "yield_sold": DataType.DECIMAL,
+            "yield_consumed": DataType.DECIMAL,
+            "market_price": DataType.DECIMAL
+        }
+    )
+}
+
+# Crop metric -> fact_crop_yield column
+CROP_FACT_COLUMNS = {
+    "planted": "planted_qty",
+    "total_yield": "total_yield",
+    "total_yield_sold": "yield_sold",
+    "total_yield_consume": "yield_consumed"
+}
+
+# Crop section columns are named sn_1_<crop>_<metric>; longest suffix first so
+# "_total_yield_sold" is not mistaken for "_total_yield"
+CROP_METRIC_SUFFIXES = [
+    ("total_yield_consumed", "total_yield_consume"),
+    ("total_yield_consume", "total_yield_consume"),
+    ("total_yield_sold", "total_yield_sold"),
+    ("market_price_fresh", "market_price_fresh"),
+    ("market_price", "market_price"),
+    ("total_yield", "total_yield"),
+    ("planted", "planted"),
+]
+
+def discover_crop_columns(columns: Iterable[str]) -> Dict[str, Dict[str, str]]:
+    """Group sn_1_<crop>_<metric> columns by crop.
+
+    Crops are discovered from the column names, so new crops added to the
+    survey are picked up without code changes. Only crops with a planted
+    column are returned since that is what marks a crop as grown.
+
+    Args:
+        columns: Column names, e.g. from a parquet schema or staging_survey
+
+    Returns:
+        Dict[str, Dict[str, str]]: Crop name to {metric: column name}
+    """
+    crops: Dict[str, Dict[str, str]] = {}
+    for col in columns:
+        name = col.lower()
+        if not name.startswith("sn_1_"):
+            continue
+        rest = name[len("sn_1_"):]
+        for suffix, metric in CROP_METRIC_SUFFIXES:
+            if rest.endswith(f"_{suffix}") and len(rest) > len(suffix) + 1:
+                crop = rest[:-(len(suffix) + 1)]
+                crops.setdefault(crop, {}).setdefault(metric, col)
+                break
+
+    return {
+        crop: metrics for crop, metrics in sorted(crops.items())
+        if "planted" in metrics
+    }
+
+def crop_source_columns(columns: Iterable[str]) -> List[str]:
+    """Get every crop metric column present in a list of columns.
+
+    Args:
+        columns: Column names to search
+
+    Returns:
+        List[str]: Crop metric columns in their original case
+    """
+    return [
+        col
+        for metrics in discover_crop_columns(columns).values()
+        for col in metrics.values()
+    ]
+
+def _unpivot_crops(df: pd.DataFrame) -> pd.DataFrame:
+    """Melt the wide crop section into one row per household, year and crop."""
+    frames = []
+    for crop, metrics in discover_crop_columns(df.columns).items():
+        part = pd.DataFrame({
+            "hhid_2": df["hhid_2"],
+            "survey_year": df["survey_year"],
+            "crop_type": crop
+        })
+        for metric, column in CROP_FACT_COLUMNS.items():
+            part[column] = df[metrics[metric]] if metric in metrics else np.nan
+        
+        # Fresh market price wins over the generic one, as in transform_data
+        price = pd.Series(np.nan, index=df.index)
+        for metric in ("market_price_fresh", "market_price"):
+            if metric in metrics:
+                price = price.fillna(df[metrics[metric]])
+        part["market_price"] = price
+        
+        content = list(FACT_TABLES["fact_crop_yield"].content_columns)
+        part[content] = part[content].replace(MISSING_VALUE_CODES, np.nan)
+        frames.append(part[part["planted_qty"].notna()])
+    
+    if not frames:
+        return pd.DataFrame(columns=FACT_TABLES["fact_crop_yield"].key_columns
+                            + list(FACT_TABLES["fact_crop_yield"].content_columns))
+    return pd.concat(frames, ignore_index=True)
+
+def project_fact_table(df: pd.DataFrame, table_name: str) -> pd.DataFrame:
+    """Reshape raw survey data into the key and content columns of a fact table.
+    
+    Args:
+        df: Survey data with source column names (as read from CSV)
+        table_name: One of FACT_TABLES
+        
+    Returns:
+        pd.DataFrame: Rows shaped like the fact table, with missing-value codes nulled
+    """
+    table = FACT_TABLES[table_name]
+    if table_name == "fact_crop_yield":
+        projected = _unpivot_crops(df)
+    else:
+        renamed = df.rename(columns={
+            src: dst for src, dst in STAGING_COLUMN_MAP.items()
+            if src in df.columns and src != dst
+        })
+        projected = pd.DataFrame(index=renamed.index)
+        for col in table.key_columns + list(table.content_columns):
+            projected[col] = renamed[col] if col in renamed.columns else np.nan
+    
+    content = list(table.content_columns)
+    projected[content] = projected[content].replace(MISSING_VALUE_CODES, np.nan)
+    return projected[projected[table.key_columns].notna().all(axis=1)]
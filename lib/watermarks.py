@@ -0,0 +1,219 @@
+import logging
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import psycopg2
+
+logger = logging.getLogger(__name__)
+
+# Advisory lock serialising staging loads against the watermark read
+STAGING_LOCK_KEY = 7_201_025
+
+@contextmanager
+def staging_lock(db_conn: psycopg2.extensions.connection) -> Iterator[None]:
+    """Hold the staging lock while a load batch is written.
+
+    A batch id is allocated before its rows are committed, possibly by
+    several transactions, so the lock is taken on the session and held
+    across them. Loads run one at a time, and a transform never sees a
+    batch that is only partly committed or a newer batch committed before
+    an older one. Work on db_conn itself must be committed inside the block.
+
+    Args:
+        db_conn: PostgreSQL connection held for the duration of the load
+    """
+    with db_conn.cursor() as cur:
+        cur.execute("SELECT pg_advisory_lock(%s)", (STAGING_LOCK_KEY,))
+    db_conn.commit()
+    try:
+        yield
+    finally:
+        if not db_conn.closed:
+            db_conn.rollback()
+            with db_conn.cursor() as cur:
+                cur.execute("SELECT pg_advisory_unlock(%s)", (STAGING_LOCK_KEY,))
+            db_conn.commit()
+
+class TransformWatermark:
+    """Tracks the last load batch a transform has processed.
+
+    Staging rows carry the id of the load batch that wrote them; a transform
+    handles the batches above its watermark and advances the watermark in
+    the same transaction as its writes, so a failed run is retried in full
+    and a finished one is never repeated.
+    """
+
+    def __init__(self, db_conn: psycopg2.extensions.connection, target: str):
+        """Initialize the watermark.
+
+        Args:
+            db_conn: PostgreSQL connection
+            target: Name of the transform, e.g. star_schema
+        """
+        self.conn = db_conn
+        self.target = target
+        self._init_watermark_table()
+
+    def _init_watermark_table(self) -> None:
+        """Create the watermark table and this target's row."""
+        with self.conn.cursor() as cur:
+            cur.execute("""
+                CREATE TABLE IF NOT EXISTS transform_watermarks (
+                    target VARCHAR(100) PRIMARY KEY,
+                    last_batch BIGINT,
+                    updated_at TIMESTAMP
+                )
+            """)
+            cur.execute("""
+                INSERT INTO transform_watermarks (target)
+                VALUES (%s)
+                ON CONFLICT (target) DO NOTHING
+            """, (self.target,))
+        self.conn.commit()
+
+    def get(self) -> Optional[int]:
+        """Get the last processed batch, or None if the transform never ran."""
+        with self.conn.cursor() as cur:
+            cur.execute("SELECT last_batch FROM transform_watermarks WHERE target = %s", (self.target,))
+            return cur.fetchone()[0]
+
+    def pending(self, table: str, column: str = "_load_batch") -> Optional[int]:
+        """Get the newest batch in a table if it is above the watermark.
+
+        Waits for a load holding staging_lock to finish first, so every
+        batch up to the one returned is fully committed. The lock is held
+        until the caller's transaction ends.
+
+        Args:
+            table: Staging table
+            column: Load batch column, indexed so this is one index probe
+
+        Returns:
+            Optional[int]: Upper bound of the batches to process, or None
+            when there is nothing new. A transform that never ran gets a
+            bound (0 for an empty or unbatched table) so its first run
+            covers every row.
+        """
+        with self.conn.cursor() as cur:
+            cur.execute("SELECT pg_advisory_xact_lock(%s)", (STAGING_LOCK_KEY,))
+            cur.execute(f"SELECT max({column}) FROM {table}")
+            newest = cur.fetchone()[0]
+        last = self.get()
+        if last is None:
+            return newest or 0
+        if newest is None or newest <= last:
+            return None
+        return newest
+
+    def advance(self, previous: Optional[int], batch: int) -> None:
+        """Move the watermark within the caller's transaction.
+
+        The caller commits, so the watermark is recorded atomically with the
+        rows it covers.
+
+        Args:
+            previous: Watermark the run started from
+            batch: Last batch the run processed
+
+        Raises:
+            RuntimeError: If another run moved the watermark meanwhile
+        """
+        with self.conn.cursor() as cur:
+            cur.execute("""
+                UPDATE transform_watermarks
+                SET last_batch = %s, updated_at = now()
+                WHERE target = %s AND last_batch IS NOT DISTINCT FROM %s
+            """, (batch, self.target, previous))
+            if cur.rowcount != 1:
+                raise RuntimeError(f"Watermark of {self.target} moved during the run")
+        logger.info(f"Advanced {self.target} watermark from {previous} to {batch}")
+
+class StagingLoadLog:
+    """Records which version of each raw file the staging table holds.
+
+    Each staged file is stored with the ETag it was loaded at and its load
+    batch. A load only stages files whose ETag changed and only allocates a
+    batch when there is one, so a run with unchanged inputs adds no rows
+    and leaves the transform nothing to do.
+    """
+
+    def __init__(self, db_conn: psycopg2.extensions.connection, sequence: str = "staging_load_batch_seq"):
+        """Initialize the load log.
+
+        Args:
+            db_conn: PostgreSQL connection
+            sequence: Sequence the load batch ids are drawn from
+        """
+        self.conn = db_conn
+        self.sequence = sequence
+        self._init_log_table()
+
+    def _init_log_table(self) -> None:
+        """Create the log table and the batch sequence."""
+        with self.conn.cursor() as cur:
+            cur.execute(f"""
+                CREATE TABLE IF NOT EXISTS staging_loads (
+                    source_file VARCHAR(200) PRIMARY KEY,
+                    etag VARCHAR(100),
+                    load_batch BIGINT,
+                    loaded_at TIMESTAMP
+                );
+                CREATE SEQUENCE IF NOT EXISTS {self.sequence};
+            """)
+        self.conn.commit()
+
+    def changed(self, etags: Dict[str, str]) -> List[str]:
+        """Get the files whose ETag differs from the one last staged.
+
+        Args:
+            etags: Current ETag per source file
+
+        Returns:
+            List[str]: Files never staged or changed since, in input order
+        """
+        with self.conn.cursor() as cur:
+            cur.execute(
+                "SELECT source_file, etag FROM staging_loads WHERE source_file = ANY(%s)",
+                (list(etags),)
+            )
+            staged = dict(cur.fetchall())
+        return [name for name, etag in etags.items() if staged.get(name) != etag]
+
+    def start_batch(self, etags: Dict[str, str]) -> Tuple[Optional[int], List[str]]:
+        """Allocate a load batch for the changed files, if there are any.
+
+        Call while holding staging_lock, so no other load stages the same
+        change.
+
+        Args:
+            etags: Current ETag per source file
+
+        Returns:
+            Tuple[Optional[int], List[str]]: The new batch id and the files
+            to stage, or (None, []) when nothing changed
+        """
+        files = self.changed(etags)
+        if not files:
+            return None, []
+        with self.conn.cursor() as cur:
+            cur.execute(f"SELECT nextval('{self.sequence}')")
+            batch = cur.fetchone()[0]
+        self.conn.commit()
+        return batch, files
+
+    def record(self, load_batch: int, etags: Dict[str, str]) -> None:
+        """Mark files as staged at their ETags by a batch.
+
+        Args:
+            load_batch: Batch that staged the files
+            etags: ETag per file that was loaded
+        """
+        with self.conn.cursor() as cur:
+            for name, etag in etags.items():
+                cur.execute("""
+                    INSERT INTO staging_loads (source_file, etag, load_batch, loaded_at)
+                    VALUES (%s, %s, %s, now())
+                    ON CONFLICT (source_file) DO UPDATE
+                    SET etag = EXCLUDED.etag, load_batch = EXCLUDED.load_batch, loaded_at = EXCLUDED.loaded_at
+                """, (name, etag, load_batch))
+        self.conn.commit()
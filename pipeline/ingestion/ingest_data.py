@@ -1,41 +1,190 @@
 import pandas as pd
 import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
 from pathlib import Path
 import logging
-from datetime import datetime
+from datetime import datetime, timezone
+import io
 import os
-from minio import Minio
+import queue
+import threading
 from minio.error import S3Error
 import json
-from typing import Dict, List, Optional
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from typing import Dict, List, Optional, Tuple
 import sys
 
+sys.path.append(str(Path(__file__).parent.parent.parent))
+from lib.catalog import CatalogEntry, LakeCatalog
+from lib.file_stats import BLOOM_COLUMNS, BloomFilter, FileStats, parquet_column_stats, parquet_file_stats
+from lib.manifest import IngestionManifest
+from lib.storage import ObjectStore, create_storage_client
+from lib.survey_columns import read_survey_csv, survey_dtypes
+
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+REQUIRED_COLUMNS = ['household_id', 'survey_date', 'village_id']
+
+class _UploadStream(io.RawIOBase):
+    """Bounded in-memory pipe between a parquet writer and a MinIO upload.
+    
+    The writer thread appends buffers and the uploader reads them back as a
+    file object. At most max_buffers writes are held at once, so memory stays
+    fixed however large the file is.
+    """
+    
+    def __init__(self, max_buffers: int = 8):
+        self._buffers = queue.Queue(maxsize=max_buffers)
+        self._pending = bytearray()
+        self._position = 0
+        self._eof = False
+        self._failed = threading.Event()
+        
+    def writable(self) -> bool:
+        return True
+        
+    def readable(self) -> bool:
+        return True
+        
+    def tell(self) -> int:
+        return self._position
+        
+    def write(self, data) -> int:
+        data = bytes(data)
+        while True:
+            if self._failed.is_set():
+                raise IOError("Upload stream was aborted")
+            try:
+                self._buffers.put(data, timeout=1)
+                break
+            except queue.Full:
+                continue
+        self._position += len(data)
+        return len(data)
+        
+    def finish(self) -> None:
+        """Signal the reader that no more data will be written."""
+        while True:
+            if self._failed.is_set():
+                raise IOError("Upload stream was aborted")
+            try:
+                self._buffers.put(None, timeout=1)
+                return
+            except queue.Full:
+                continue
+        
+    def abort(self) -> None:
+        """Make both sides fail so a partial object is never completed."""
+        self._failed.set()
+        
+    def read(self, size: int = -1) -> bytes:
+        while not self._eof and (size < 0 or len(self._pending) < size):
+            if self._failed.is_set():
+                raise IOError("Upload stream was aborted")
+            try:
+                data = self._buffers.get(timeout=1)
+            except queue.Empty:
+                continue
+            if self._failed.is_set():
+                raise IOError("Upload stream was aborted")
+            if data is None:
+                self._eof = True
+                break
+            self._pending += data
+        if size < 0:
+            size = len(self._pending)
+        chunk = bytes(self._pending[:size])
+        del self._pending[:size]
+        return chunk
+
+def _sparse_columns(chunk: pd.DataFrame) -> List[str]:
+    """Columns outside the dtype plan that are empty in the first chunk.
+
+    Pandas reads an empty column as float, so later chunks holding text
+    would not fit it; these are read as text instead.
+    """
+    planned, parse_dates = survey_dtypes(chunk.columns)
+    return [
+        col for col in chunk.columns
+        if col not in planned and col not in parse_dates
+        and 'date' not in col.lower() and chunk[col].isna().all()
+    ]
+
+def _writer_schema(schema: pa.Schema, columns: List[str]) -> pa.Schema:
+    """Widen the first chunk's schema so later chunks can be cast to it.
+
+    Integer columns outside the dtype plan become float64, since a later
+    chunk may hold fractions, and categoricals get int32 dictionary
+    indices, since a later chunk may have more categories.
+
+    Args:
+        schema: Arrow schema of the first processed chunk
+        columns: Source columns, to look up the dtype plan
+
+    Returns:
+        pa.Schema: Schema for the whole file
+    """
+    planned, _ = survey_dtypes(columns)
+    fields = []
+    for field in schema:
+        if pa.types.is_dictionary(field.type):
+            field = field.with_type(pa.dictionary(pa.int32(), field.type.value_type))
+        elif pa.types.is_integer(field.type) and field.name not in planned:
+            field = field.with_type(pa.float64())
+        fields.append(field)
+    return pa.schema(fields, metadata=schema.metadata)
+
+def _estimate_rows(file_path: Path, sample_bytes: int = 1024 * 1024) -> int:
+    """Estimate the rows of a CSV from the line length of its first megabyte."""
+    with open(file_path, 'rb') as f:
+        sample = f.read(sample_bytes)
+    if not sample:
+        return 1
+    return int(os.path.getsize(file_path) / len(sample) * max(sample.count(b'\n'), 1)) + 1
+
 class DataIngestion:
-    def __init__(self, source_path: str, minio_bucket: str):
+    def __init__(self,
+                 source_path: str,
+                 minio_bucket: str,
+                 chunk_size: Optional[int] = None,
+                 part_size: int = 16 * 1024 * 1024,
+                 max_workers: int = 1,
+                 upload_workers: Optional[int] = None,
+                 use_manifest: bool = True):
         """
         Initialize the data ingestion process.
         
         Args:
             source_path: Path to the source data files
             minio_bucket: Name of the MinIO bucket to store processed data
+            chunk_size: Rows per chunk for streaming CSV ingestion; None reads
+                each file in one go
+            part_size: Multipart upload part size used when streaming
+            max_workers: Processes used to parse and clean files; 1 keeps
+                the sequential path
+            upload_workers: Threads used to upload to MinIO; defaults to
+                max_workers
+            use_manifest: Skip files recorded as unchanged in the ingestion
+                manifest
         """
         self.source_path = Path(source_path)
         self.minio_bucket = minio_bucket
+        self.chunk_size = chunk_size
+        self.part_size = part_size
+        self.max_workers = max_workers
+        self.upload_workers = upload_workers or max_workers
         self.minio_client = self._setup_minio()
+        self.manifest = IngestionManifest(self.minio_client, minio_bucket) if use_manifest else None
+        self.catalog = LakeCatalog.from_env()
+        self._pending_entries = {}
         
-    def _setup_minio(self) -> Minio:
-        """Set up MinIO client connection."""
+    def _setup_minio(self) -> ObjectStore:
+        """Set up the object store client selected by STORAGE_BACKEND."""
         try:
-            client = Minio(
-                "localhost:9000",
-                access_key="minioadmin",
-                secret_key="minioadmin",
-                secure=False
-            )
+            client = create_storage_client()
             
             # Create bucket if it doesn't exist
             if not client.bucket_exists(self.minio_bucket):
@@ -47,7 +196,8 @@ class DataIngestion:
             logger.error(f"Failed to connect to MinIO: {e}")
             raise
             
-    def _validate_file(self, file_path: Path) -> bool:
+    @staticmethod
+    def _validate_file(file_path: Path) -> bool:
         """
         Validate the input file format and structure.
         
@@ -78,7 +228,8 @@ class DataIngestion:
             logger.error(f"Error validating file {file_path}: {e}")
             return False
             
-    def _read_file(self, file_path: Path) -> Optional[pd.DataFrame]:
+    @staticmethod
+    def _read_file(file_path: Path) -> Optional[pd.DataFrame]:
         """
         Read the input file into a pandas DataFrame.
         
@@ -90,7 +241,7 @@ class DataIngestion:
         """
         try:
             if file_path.suffix == '.csv':
-                df = pd.read_csv(file_path)
+                df = read_survey_csv(file_path)
             else:  # .xlsx
                 df = pd.read_excel(file_path)
                 
@@ -100,8 +251,7 @@ class DataIngestion:
                 return None
                 
             # Check required columns
-            required_columns = ['household_id', 'survey_date', 'village_id']
-            missing_columns = [col for col in required_columns if col not in df.columns]
+            missing_columns = [col for col in REQUIRED_COLUMNS if col not in df.columns]
             if missing_columns:
                 logger.warning(f"Missing required columns in {file_path}: {missing_columns}")
                 return None
@@ -111,20 +261,28 @@ class DataIngestion:
             logger.error(f"Error reading file {file_path}: {e}")
             return None
             
-    def _process_data(self, df: pd.DataFrame, file_path: Path) -> pd.DataFrame:
+    @staticmethod
+    def _process_data(df: pd.DataFrame,
+                      file_path: Path,
+                      copy: bool = True,
+                      ingestion_date: Optional[datetime] = None) -> pd.DataFrame:
         """
         Process the DataFrame with basic cleaning and validation.
         
         Args:
             df: Input DataFrame
             file_path: Path to the source file
+            copy: Whether to leave the input untouched; chunks read for
+                streaming are throwaway and are processed in place
+            ingestion_date: Timestamp to stamp on every row, so all chunks
+                of one file share it
             
         Returns:
             pd.DataFrame: Processed DataFrame
         """
         try:
             # Create a copy to avoid modifying the original
-            processed_df = df.copy()
+            processed_df = df.copy() if copy else df
             
             # Extract survey round from filename
             survey_round = file_path.stem.split('_')[0]
@@ -139,11 +297,18 @@ class DataIngestion:
             numeric_columns = processed_df.select_dtypes(include=[np.number]).columns
             processed_df[numeric_columns] = processed_df[numeric_columns].fillna(0)
             
-            categorical_columns = processed_df.select_dtypes(include=['object']).columns
+            categorical_columns = processed_df.select_dtypes(include=['object', 'string']).columns
             processed_df[categorical_columns] = processed_df[categorical_columns].fillna('Unknown')
             
+            for col in processed_df.select_dtypes(include=['category']).columns:
+                if not processed_df[col].hasnans:
+                    continue
+                if 'Unknown' not in processed_df[col].cat.categories:
+                    processed_df[col] = processed_df[col].cat.add_categories('Unknown')
+                processed_df[col] = processed_df[col].fillna('Unknown')
+            
             # Add metadata
-            processed_df['ingestion_date'] = datetime.now()
+            processed_df['ingestion_date'] = ingestion_date or datetime.now()
             processed_df['source_file'] = file_path.name
             
             return processed_df
@@ -151,6 +316,174 @@ class DataIngestion:
             logger.error(f"Error processing data from {file_path}: {e}")
             raise
             
+    def _needs_ingest(self, file_path: Path) -> bool:
+        """
+        Check a file against the ingestion manifest.
+        
+        Invalid files are reported as needing ingestion so they are counted
+        as failures by the normal path.
+        
+        Args:
+            file_path: Path to the source file
+            
+        Returns:
+            bool: False if the manifest shows the file is unchanged
+        """
+        if self.manifest is None or not self._validate_file(file_path):
+            return True
+        try:
+            entry = self.manifest.check(file_path)
+        except Exception as e:
+            logger.warning(f"Could not check {file_path} against the manifest: {e}")
+            return True
+        if entry is None:
+            logger.info(f"Skipping unchanged file: {file_path}")
+            return False
+        self._pending_entries[str(file_path)] = entry
+        return True
+        
+    def _record_upload(self, file_path: Path, object_name: str) -> None:
+        """Record a successful upload in the manifest."""
+        entry = self._pending_entries.pop(str(file_path), None)
+        if self.manifest is not None and entry is not None:
+            self.manifest.record(entry, object_name)
+            
+    def _catalog_upload(self, object_name: str, size: int, etag: Optional[str], stats: FileStats) -> None:
+        """Record an uploaded object and its file stats in the lake catalog, if configured."""
+        if self.catalog is None:
+            return
+        try:
+            self.catalog.record(CatalogEntry(
+                bucket=self.minio_bucket,
+                object_name=object_name,
+                size=size,
+                last_modified=datetime.now(timezone.utc),
+                etag=etag
+            ))
+            self.catalog.record_stats(self.minio_bucket, object_name, stats, etag=etag)
+        except Exception as e:
+            logger.warning(f"Could not catalog {object_name}: {e}")
+            
+    def _object_name(self, file_path: Path) -> str:
+        """Generate the processed object name for a source file."""
+        return f"processed/{file_path.stem}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.parquet"
+        
+    def _stream_to_minio(self, file_path: Path) -> Optional[int]:
+        """
+        Read a CSV in chunks and stream it to MinIO as parquet row groups.
+        
+        Each chunk gets the same processing as _process_data and is written
+        as one row group into an upload stream that feeds a multipart upload,
+        so memory is bounded by the chunk and part sizes, not the file size.
+        
+        Args:
+            file_path: Path to the CSV file
+            
+        Returns:
+            Optional[int]: Number of records uploaded, or None on failure
+        """
+        object_name = self._object_name(file_path)
+        stream = _UploadStream()
+        upload_errors = []
+        upload_results = []
+        
+        def upload():
+            try:
+                upload_results.append(self.minio_client.put_object(
+                    bucket_name=self.minio_bucket,
+                    object_name=object_name,
+                    data=stream,
+                    length=-1,
+                    part_size=self.part_size,
+                    content_type='application/octet-stream'
+                ))
+            except Exception as e:
+                upload_errors.append(e)
+                stream.abort()
+        
+        uploader = threading.Thread(target=upload, daemon=True)
+        uploader.start()
+        
+        writer = None
+        written = False
+        records = 0
+        text_columns = []
+        bloom_column = None
+        bloom = None
+        try:
+            ingestion_date = datetime.now()
+            for chunk in read_survey_csv(file_path, chunksize=self.chunk_size):
+                if writer is None:
+                    missing_columns = [col for col in REQUIRED_COLUMNS if col not in chunk.columns]
+                    if missing_columns:
+                        logger.warning(f"Missing required columns in {file_path}: {missing_columns}")
+                        stream.abort()
+                        return None
+                    text_columns = _sparse_columns(chunk)
+                for col in text_columns:
+                    chunk[col] = chunk[col].astype('string')
+                    
+                processed = self._process_data(chunk, file_path, copy=False, ingestion_date=ingestion_date)
+                if writer is None:
+                    schema = _writer_schema(pa.Schema.from_pandas(processed, preserve_index=False), chunk.columns)
+                    writer = pq.ParquetWriter(stream, schema)
+                    if self.catalog is not None:
+                        bloom_column = next((col for col in BLOOM_COLUMNS if col in processed.columns), None)
+                        if bloom_column:
+                            bloom = BloomFilter.for_capacity(_estimate_rows(file_path))
+                # Every chunk is cast to the file's schema so row groups line up
+                for field in writer.schema:
+                    is_number = pa.types.is_integer(field.type) or pa.types.is_floating(field.type)
+                    if is_number and not pd.api.types.is_numeric_dtype(processed[field.name]):
+                        numbers = pd.to_numeric(processed[field.name], errors='coerce')
+                        logger.warning(
+                            f"Dropped {int(numbers.isna().sum() - processed[field.name].isna().sum())} "
+                            f"non-numeric values of {field.name} in {file_path}"
+                        )
+                        processed[field.name] = numbers
+                table = pa.Table.from_pandas(processed, schema=writer.schema, preserve_index=False)
+                writer.write_table(table)
+                records += len(processed)
+                if bloom is not None:
+                    bloom.add(processed[bloom_column].dropna().unique())
+                
+            if writer is None:
+                logger.warning(f"Empty DataFrame from file: {file_path}")
+                stream.abort()
+                return None
+                
+            writer.close()
+            written = True
+            if upload_errors:
+                raise upload_errors[0]
+            stream.finish()
+            uploader.join()
+            if upload_errors:
+                raise upload_errors[0]
+                
+            if self.catalog is not None:
+                # Stats come from the footer just written and the keys added per chunk
+                self._catalog_upload(object_name, stream.tell(), getattr(upload_results[0], "etag", None), FileStats(
+                    row_count=records,
+                    column_stats=parquet_column_stats(writer.writer.metadata),
+                    bloom_column=bloom_column,
+                    bloom=bloom
+                ))
+            self._record_upload(file_path, object_name)
+            logger.info(f"Successfully streamed {records} records to {object_name}")
+            return records
+        except Exception as e:
+            stream.abort()
+            logger.error(f"Error streaming {file_path} to MinIO: {e}")
+            return None
+        finally:
+            if writer is not None and not written:
+                try:
+                    writer.close()
+                except IOError:
+                    pass  # stream already aborted
+            uploader.join()
+            
     def _upload_to_minio(self, df: pd.DataFrame, file_path: Path) -> bool:
         """
         Upload processed data to MinIO.
@@ -165,25 +498,122 @@ class DataIngestion:
         try:
             # Convert DataFrame to parquet format
             parquet_data = df.to_parquet(index=False)
+        except Exception as e:
+            logger.error(f"Error uploading to MinIO: {e}")
+            return False
             
+        return self._upload_parquet(parquet_data, file_path)
+        
+    def _upload_parquet(self, parquet_data: bytes, file_path: Path) -> bool:
+        """
+        Upload an already serialised parquet file to MinIO.
+        
+        Args:
+            parquet_data: Parquet file contents
+            file_path: Original source file path
+            
+        Returns:
+            bool: True if upload successful, False otherwise
+        """
+        try:
             # Generate object name
-            object_name = f"processed/{file_path.stem}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.parquet"
+            object_name = self._object_name(file_path)
             
             # Upload to MinIO
-            self.minio_client.put_object(
+            result = self.minio_client.put_object(
                 bucket_name=self.minio_bucket,
                 object_name=object_name,
-                data=parquet_data,
+                data=io.BytesIO(parquet_data),
                 length=len(parquet_data),
                 content_type='application/octet-stream'
             )
             
+            if self.catalog is not None:
+                self._catalog_upload(object_name, len(parquet_data), getattr(result, "etag", None),
+                                     parquet_file_stats(parquet_data))
+            self._record_upload(file_path, object_name)
             logger.info(f"Successfully uploaded {object_name} to MinIO")
             return True
         except Exception as e:
             logger.error(f"Error uploading to MinIO: {e}")
             return False
             
+    def _ingest_parallel(self, files: List[Path]) -> List[Optional[int]]:
+        """
+        Parse files in a process pool and upload them from a thread pool.
+        
+        Uploads start as soon as each file is parsed, so CPU-bound cleaning
+        and I/O-bound uploads overlap. Streaming CSVs already pipeline their
+        own parse and upload and go straight to the thread pool.
+        
+        Args:
+            files: Files to ingest
+            
+        Returns:
+            List[Optional[int]]: Records uploaded per file, in input order;
+            None for files that failed
+        """
+        results: List[Optional[int]] = [None] * len(files)
+        uploads = {}
+        
+        with ProcessPoolExecutor(max_workers=self.max_workers) as parsers, \
+                ThreadPoolExecutor(max_workers=self.upload_workers) as uploaders:
+            parses = {}
+            for index, file_path in enumerate(files):
+                if not self._validate_file(file_path):
+                    continue
+                if self.chunk_size and file_path.suffix == '.csv':
+                    uploads[index] = uploaders.submit(self._stream_to_minio, file_path)
+                else:
+                    parses[parsers.submit(_parse_file, file_path)] = index
+                    
+            for future in as_completed(parses):
+                index = parses[future]
+                parsed = future.result()
+                if parsed is None:
+                    continue
+                parquet_data, records = parsed
+                uploads[index] = uploaders.submit(self._upload_and_count, parquet_data, files[index], records)
+                
+            for index, future in uploads.items():
+                results[index] = future.result()
+                
+        return results
+        
+    def _upload_and_count(self, parquet_data: bytes, file_path: Path, records: int) -> Optional[int]:
+        """Upload parsed data, returning its record count or None on failure."""
+        return records if self._upload_parquet(parquet_data, file_path) else None
+        
+    def _ingest_file(self, file_path: Path) -> Optional[int]:
+        """
+        Validate, read, process and upload a single file.
+        
+        Args:
+            file_path: Path to the source file
+            
+        Returns:
+            Optional[int]: Number of records uploaded, or None on failure
+        """
+        if not self._validate_file(file_path):
+            return None
+            
+        # Stream large CSVs chunk by chunk with a fixed memory ceiling
+        if self.chunk_size and file_path.suffix == '.csv':
+            return self._stream_to_minio(file_path)
+            
+        # Read and process the file
+        df = self._read_file(file_path)
+        if df is None:
+            return None
+            
+        # Process the data
+        processed_df = self._process_data(df, file_path)
+        
+        # Upload to MinIO
+        if self._upload_to_minio(processed_df, file_path):
+            return len(processed_df)
+        return None
+        
     def ingest_survey_data(self) -> Dict[str, int]:
         """
         Main ingestion function to process all survey data files.
@@ -195,34 +625,35 @@ class DataIngestion:
             'total_files': 0,
             'processed_files': 0,
             'failed_files': 0,
+            'skipped_files': 0,
             'total_records': 0
         }
         
         try:
             # Process all files in the source directory
-            for file_path in self.source_path.glob('*'):
-                stats['total_files'] += 1
+            files = list(self.source_path.glob('*'))
+            stats['total_files'] = len(files)
+            
+            # Unchanged files were already ingested by an earlier run
+            changed = [file_path for file_path in files if self._needs_ingest(file_path)]
+            stats['skipped_files'] = len(files) - len(changed)
+            files = changed
+            
+            if self.max_workers > 1:
+                results = self._ingest_parallel(files)
+            else:
+                results = [self._ingest_file(file_path) for file_path in files]
                 
-                if not self._validate_file(file_path):
-                    stats['failed_files'] += 1
-                    continue
-                    
-                # Read and process the file
-                df = self._read_file(file_path)
-                if df is None:
+            for records in results:
+                if records is None:
                     stats['failed_files'] += 1
-                    continue
-                    
-                # Process the data
-                processed_df = self._process_data(df, file_path)
-                
-                # Upload to MinIO
-                if self._upload_to_minio(processed_df, file_path):
-                    stats['processed_files'] += 1
-                    stats['total_records'] += len(processed_df)
                 else:
-                    stats['failed_files'] += 1
+                    stats['processed_files'] += 1
+                    stats['total_records'] += records
                     
+            if self.manifest is not None:
+                self.manifest.save()
+                
             # Log final statistics
             logger.info(f"Ingestion completed. Statistics: {json.dumps(stats, indent=2)}")
             return stats
@@ -231,19 +662,42 @@ class DataIngestion:
             logger.error(f"Error during ingestion process: {e}")
             raise
 
-def ingest_survey_data(source_path: str, minio_bucket: str) -> Dict[str, int]:
+def _parse_file(file_path: Path) -> Optional[Tuple[bytes, int]]:
+    """
+    Read, process and serialise one file; runs in a worker process.
+    
+    Args:
+        file_path: Path to the source file
+        
+    Returns:
+        Optional[Tuple[bytes, int]]: Parquet file contents and record count,
+        or None if the file could not be read
+    """
+    df = DataIngestion._read_file(file_path)
+    if df is None:
+        return None
+    processed_df = DataIngestion._process_data(df, file_path, copy=False)
+    return processed_df.to_parquet(index=False), len(processed_df)
+
+def ingest_survey_data(source_path: str,
+                       minio_bucket: str,
+                       chunk_size: Optional[int] = None,
+                       max_workers: int = 1) -> Dict[str, int]:
     """
     Wrapper function for the data ingestion process.
     
     Args:
         source_path: Path to the source data files
         minio_bucket: Name of the MinIO bucket to store processed data
+        chunk_size: Rows per chunk for streaming CSV ingestion
+        max_workers: Parallel parse processes and upload threads
         
     Returns:
         Dict[str, int]: Statistics about the ingestion process
     """
     try:
-        ingestion = DataIngestion(source_path, minio_bucket)
+        ingestion = DataIngestion(source_path, minio_bucket, chunk_size=chunk_size,
+                                  max_workers=max_workers)
         return ingestion.ingest_survey_data()
     except Exception as e:
         logger.error(f"Failed to ingest survey data: {e}")
@@ -3,7 +3,6 @@ from datetime import datetime, timedelta
 from typing import Dict, List, Optional
 import logging
 import pandas as pd
-from minio import Minio
 from minio.error import S3Error
 import psycopg2
 from psycopg2.extras import execute_values
@@ -12,6 +11,7 @@ from airflow.operators.python import PythonOperator
 from airflow.utils.dates import days_ago
 
 from lib.data_lake import DataLakeManager
+from lib.storage import ObjectStore, create_storage_client
 from lib.schema import SchemaManager
 from lib.quality import DataQualityValidator, QualityCheckResult
 from lib.monitoring import PipelineMonitor, PipelineMetric, PipelineStatus
@@ -37,14 +37,9 @@ def get_db_connection() -> psycopg2.extensions.connection:
         password=os.getenv('POSTGRES_PASSWORD', 'postgres')
     )
 
-def get_minio_client() -> Minio:
-    """Get a MinIO client."""
-    return Minio(
-        endpoint=os.getenv('MINIO_ENDPOINT', 'localhost:9000'),
-        access_key=os.getenv('MINIO_ACCESS_KEY', 'minioadmin'),
-        secret_key=os.getenv('MINIO_SECRET_KEY', 'minioadmin'),
-        secure=os.getenv('MINIO_SECURE', 'false').lower() == 'true'
-    )
+def get_minio_client() -> ObjectStore:
+    """Get the object store client selected by STORAGE_BACKEND (MinIO by default)."""
+    return create_storage_client()
 
 def ingest_survey_data(**context) -> None:
     """Ingest survey data from CSV files into the data lake and database.
@@ -1,35 +1,61 @@
 import pandas as pd
-from minio import Minio
+import pyarrow as pa
+import pyarrow.parquet as pq
 import psycopg2
 import os
+import sys
+from pathlib import Path
 from airflow import DAG
 from airflow.operators.python import PythonOperator
 from datetime import datetime
 
-# MinIO client
-minio_client = Minio("minio:9000", access_key="minioadmin", secret_key="minioadmin", secure=False)
+# Add the project root to the Python path
+sys.path.append(str(Path(__file__).parent.parent.parent))
+
+from lib.bulk_load import get_column_types
+from lib.cache import ObjectCache
+from lib.ingestion import row_hash_sql
+from lib.parallel_load import LoadTask, PipelinedLoader, create_pool
+from lib.partitions import PARTITIONED_TABLES, PartitionManager
+from lib.storage import create_storage_client, local_path, open_object, put_dataframe
+from lib.survey_columns import (
+    CORE_COLUMNS, FACT_TABLES, STAGING_COLUMN_MAP, crop_source_columns, discover_crop_columns,
+    read_survey_csv
+)
+from lib.watermarks import StagingLoadLog, TransformWatermark, staging_lock
+
+# Object store client (MinIO, or the local filesystem with STORAGE_BACKEND=local)
+minio_client = create_storage_client(endpoint=os.getenv("MINIO_ENDPOINT", "minio:9000"))
+
+# Local read-through cache for lake objects (enabled by LAKE_CACHE_DIR)
+object_cache = ObjectCache.from_env()
+
+# "swap" rebuilds each fact_survey year as a new partition instead of
+# inserting with ON CONFLICT DO NOTHING
+FACT_LOAD_MODE = os.getenv("FACT_LOAD_MODE", "insert")
 
 # PostgreSQL connection
 def get_db_conn():
     return psycopg2.connect(dbname="rtv", user="postgres", password="pass", host="postgres", port="5432")
 
-# Core columns
-CORE_COLUMNS = [
-    "hhid_2", "hhid_2_again", "survey_year", "SubmissionDate", "duration", "district",
-    "pre_district", "pre_subcounty", "pre_parish", "pre_cluster", "pre_village",
-    "Quartile", "pre_vid", "survey_type", "status", "respondent_sex", "hhh_sex",
-    "hhh_age", "hhh_educ_level", "spouse_sex", "spouse_age", "spouse_educ_level",
-    "no_wives", "tot_hhmembers", "hh_size", "females_hh_count", "children_num_u5",
-    "Material_walls", "Material_roof", "Fuel_source_cooking",
-    "Every_Member_at_least_ONE_Pair_of_Shoes", "asp_actual_income", "cereals_week",
-    "tubers_week", "medical_care_annual"
-]
+def get_db_pool(max_connections):
+    return create_pool(max_connections, dbname="rtv", user="postgres", password="pass", host="postgres", port="5432")
+
+# Open a raw parquet object, preferring a local copy over ranged reads
+def open_raw(file):
+    name = f"raw/{file}"
+    path = local_path(minio_client, "data-lake", name)
+    if not path and object_cache:
+        path = object_cache.get_path(minio_client, "data-lake", name)
+    if path:
+        return pa.memory_map(path)
+    return open_object(minio_client, "data-lake", name)
 
 # Dynamic crop columns
 def get_crop_columns(file_path):
     try:
         df = pd.read_csv(file_path, nrows=1)
-        return [col for col in df.columns if col.startswith("sn_1_") and any(s in col.lower() for s in ["planted", "total_yield", "yield_sold", "yield_consumed", "market_price"])]
+        return crop_source_columns(df.columns)
     except:
         return []
 
@@ -47,7 +73,7 @@ def ingest_data():
         # Get available columns
         crop_cols = get_crop_columns(file_path)
         cols_to_read = [col for col in CORE_COLUMNS + crop_cols if col in pd.read_csv(file_path, nrows=1).columns]
-        df = pd.read_csv(file_path, usecols=cols_to_read)
+        df = read_survey_csv(file_path, usecols=cols_to_read)
         
         # Validate hhid_2
         if "hhid_2" in df.columns and "hhid_2_again" in df.columns:
@@ -66,10 +92,7 @@ def ingest_data():
         
         # Save to MinIO
         parquet_file = csv_file.replace(".csv", ".parquet")
-        temp_path = f"/tmp/{parquet_file}"
-        df.to_parquet(temp_path)
-        minio_client.fput_object("data-lake", f"raw/{parquet_file}", temp_path)
-        os.remove(temp_path)
+        put_dataframe(minio_client, "data-lake", f"raw/{parquet_file}", df)
 
 # Load to staging
 def load_to_staging():
@@ -113,57 +136,112 @@ def load_to_staging():
             cereals_week DECIMAL,
             tubers_week DECIMAL,
             medical_care_annual DECIMAL,
-            _source_file VARCHAR(100)
+            _source_file VARCHAR(100),
+            _load_batch BIGINT
         );
+        ALTER TABLE staging_survey ADD COLUMN IF NOT EXISTS _load_batch BIGINT;
+        CREATE INDEX IF NOT EXISTS idx_staging_survey_load_batch ON staging_survey (_load_batch);
     """)
+    conn.commit()
+    load_log = StagingLoadLog(conn)
     
-    # Load Parquet files
-    parquet_files = ["01_baseline.parquet", "02_year_one.parquet", "03_year_two.parquet"]
-    for file in parquet_files:
+    # Every row of this run is tagged with one batch id; transform_data
+    # processes batches above its watermark. The staging lock is held until
+    # all of the batch is committed, so batches become visible whole and in order
+    with staging_lock(conn):
+        # Only raw files whose ETag changed since they were staged are loaded;
+        # with none, no batch is allocated and the transform finds nothing new
+        etags = {}
+        for file in ["01_baseline.parquet", "02_year_one.parquet", "03_year_two.parquet"]:
+            try:
+                etags[file] = minio_client.stat_object("data-lake", f"raw/{file}").etag
+            except Exception as e:
+                print(f"Error loading {file}: {e}")
+        load_batch, parquet_files = load_log.start_batch(etags)
+        if load_batch is None:
+            print("No raw files changed since they were staged, nothing to load")
+            cursor.close()
+            conn.close()
+            return
+        
+        # Carry the crop section into staging so transform_data can unpivot it;
+        # only the footers are read here
+        tasks = []
+        for file in parquet_files:
+            try:
+                column_map = dict(STAGING_COLUMN_MAP)
+                for col in crop_source_columns(pq.read_schema(open_raw(file)).names):
+                    cursor.execute(f"ALTER TABLE staging_survey ADD COLUMN IF NOT EXISTS {col.lower()} DECIMAL")
+                    column_map[col] = col.lower()
+                conn.commit()
+                tasks.append(LoadTask(name=file, open=lambda file=file: open_raw(file),
+                                      column_map=column_map,
+                                      constants={"_source_file": file, "_load_batch": load_batch}))
+            except Exception as e:
+                conn.rollback()
+                print(f"Error loading {file}: {e}")
+        
+        # Stream, encode and COPY the files concurrently, one transaction per file
+        pool = get_db_pool(len(tasks) + 1)
         try:
-            minio_client.stat_object("data-lake", f"raw/{file}")
-            with minio_client.get_object("data-lake", f"raw/{file}") as obj:
-                df = pd.read_parquet(obj)
-                for _, row in df.iterrows():
-                    cursor.execute("""
-                        INSERT INTO staging_survey (
-                            hhid_2, survey_year, submission_date, duration, district, pre_district,
-                            pre_subcounty, pre_parish, pre_cluster, pre_village, quartile, pre_vid,
-                            survey_type, status, respondent_sex, hhh_sex, hhh_age, hhh_educ_level,
-                            spouse_sex, spouse_age, spouse_educ_level, no_wives, tot_hhmembers,
-                            hh_size, females_hh_count, children_num_u5, material_walls, material_roof,
-                            fuel_source_cooking, every_member_shoes, asp_actual_income, cereals_week,
-                            tubers_week, medical_care_annual, _source_file
-                        )
-                        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s,
-                                %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-                    """, (
-                        row.get("hhid_2"), row.get("survey_year"), row.get("SubmissionDate"),
-                        row.get("duration"), row.get("district"), row.get("pre_district"),
-                        row.get("pre_subcounty"), row.get("pre_parish"), row.get("pre_cluster"),
-                        row.get("pre_village"), row.get("Quartile"), row.get("pre_vid"),
-                        row.get("survey_type"), row.get("status"), row.get("respondent_sex"),
-                        row.get("hhh_sex"), row.get("hhh_age"), row.get("hhh_educ_level"),
-                        row.get("spouse_sex"), row.get("spouse_age"), row.get("spouse_educ_level"),
-                        row.get("no_wives"), row.get("tot_hhmembers"), row.get("hh_size"),
-                        row.get("females_hh_count"), row.get("children_num_u5"),
-                        row.get("Material_walls"), row.get("Material_roof"),
-                        row.get("Fuel_source_cooking"), row.get("Every_Member_at_least_ONE_Pair_of_Shoes"),
-                        row.get("asp_actual_income"), row.get("cereals_week"),
-                        row.get("tubers_week"), row.get("medical_care_annual"), file
-                    ))
-        except Exception as e:
-            print(f"Error loading {file}: {e}")
+            stats = PipelinedLoader(pool, "staging_survey", max_files=len(tasks) or 1,
+                                    copy_format="binary").load(tasks)
+        finally:
+            pool.closeall()
+        for file, rows in stats.rows.items():
+            print(f"Loaded {rows} rows from {file}")
+        for file, error in stats.failed.items():
+            print(f"Error loading {file}: {error}")
+        # Failed files keep their old ETag, so the next run retries them
+        load_log.record(load_batch, {file: etags[file] for file in stats.rows})
     
-    conn.commit()
     cursor.close()
     conn.close()
 
+# Build a single-scan unpivot of the crop section into fact_crop_yield
+def crop_yield_unpivot_sql(crops, source="staging_survey"):
+    def col(metrics, name):
+        return f"s.{metrics[name]}" if name in metrics else "NULL::DECIMAL"
+    
+    rows = []
+    for crop, metrics in crops.items():
+        prices = [f"s.{metrics[m]}" for m in ("market_price_fresh", "market_price") if m in metrics]
+        market_price = f"COALESCE({', '.join(prices)})" if prices else "NULL::DECIMAL"
+        rows.append(
+            f"('{crop}', {col(metrics, 'planted')}, {col(metrics, 'total_yield')}, "
+            f"{col(metrics, 'total_yield_sold')}, {col(metrics, 'total_yield_consume')}, {market_price})"
+        )
+    values = ",\n            ".join(rows)
+    
+    # One scan of the source; LATERAL VALUES turns each row into one row per crop
+    return f"""
+        INSERT INTO fact_crop_yield (hhid_2, survey_year, crop_type, planted_qty, total_yield, yield_sold, yield_consumed, market_price)
+        SELECT s.hhid_2, s.survey_year, c.crop_type, c.planted_qty, c.total_yield,
+               c.yield_sold, c.yield_consumed, c.market_price
+        FROM {source} s
+        CROSS JOIN LATERAL (VALUES
+            {values}
+        ) AS c(crop_type, planted_qty, total_yield, yield_sold, yield_consumed, market_price)
+        WHERE s.hhid_2 IS NOT NULL AND s.survey_year IS NOT NULL AND c.planted_qty IS NOT NULL
+        ON CONFLICT (hhid_2, survey_year, crop_type) DO NOTHING;
+    """
+
 # Transform to star schema
 def transform_data():
     conn = get_db_conn()
     cursor = conn.cursor()
     
+    # Only load batches staged since the last successful run are processed;
+    # with none, the run ends after one index probe
+    watermark = TransformWatermark(conn, "star_schema")
+    previous = watermark.get()
+    batch = watermark.pending("staging_survey")
+    if batch is None:
+        print(f"No staging batches after {previous}, nothing to transform")
+        cursor.close()
+        conn.close()
+        return
+    
     # Create tables
     cursor.execute("""
         CREATE TABLE IF NOT EXISTS dim_household (
@@ -216,10 +294,6 @@ def transform_data():
             FOREIGN KEY (hhid_2) REFERENCES dim_household(hhid_2),
             FOREIGN KEY (survey_year) REFERENCES dim_time(survey_year)
         ) PARTITION BY LIST (survey_year);
-        CREATE TABLE fact_survey_2020 PARTITION OF fact_survey FOR VALUES IN (2020);
-        CREATE TABLE fact_survey_2021 PARTITION OF fact_survey FOR VALUES IN (2021);
-        CREATE TABLE fact_survey_2022 PARTITION OF fact_survey FOR VALUES IN (2022);
-        CREATE TABLE fact_survey_2023 PARTITION OF fact_survey FOR VALUES IN (2023);
         CREATE TABLE IF NOT EXISTS fact_expenditure (
             hhid_2 VARCHAR(50),
             survey_year INT,
@@ -230,7 +304,7 @@ def transform_data():
             PRIMARY KEY (hhid_2, survey_year),
             FOREIGN KEY (hhid_2) REFERENCES dim_household(hhid_2),
             FOREIGN KEY (survey_year) REFERENCES dim_time(survey_year)
-        );
+        ) PARTITION BY LIST (survey_year);
         CREATE TABLE IF NOT EXISTS fact_crop_yield (
             hhid_2 VARCHAR(50),
             survey_year INT,
@@ -243,13 +317,45 @@ def transform_data():
             PRIMARY KEY (hhid_2, survey_year, crop_type),
             FOREIGN KEY (hhid_2) REFERENCES dim_household(hhid_2),
             FOREIGN KEY (survey_year) REFERENCES dim_time(survey_year)
-        );
+        ) PARTITION BY LIST (survey_year);
     """)
+    conn.commit()
+    
+    # Fact tables created before they were partitioned are rebuilt once
+    partitions = PartitionManager(conn)
+    for table in PARTITIONED_TABLES:
+        partitions.convert_to_partitioned(table)
+    
+    # Persisted content hash per fact row, used for server-side CDC
+    for table in FACT_TABLES.values():
+        cursor.execute(f"""
+            ALTER TABLE {table.name} ADD COLUMN IF NOT EXISTS row_hash CHAR(32)
+            GENERATED ALWAYS AS ({row_hash_sql(table)}) STORED;
+        """)
+    
+    # Rows of the batches this run covers; the first run also takes rows
+    # staged before load batches existed
+    cursor.execute("DROP TABLE IF EXISTS staging_batch")
+    if previous is None:
+        cursor.execute("""
+            CREATE TEMP TABLE staging_batch AS
+            SELECT * FROM staging_survey WHERE _load_batch IS NULL OR _load_batch <= %s
+        """, (batch,))
+    else:
+        cursor.execute("""
+            CREATE TEMP TABLE staging_batch AS
+            SELECT * FROM staging_survey WHERE _load_batch > %s AND _load_batch <= %s
+        """, (previous, batch))
+    cursor.execute("ANALYZE staging_batch")
+    
+    # One partition per survey year in the batch
+    conn.commit()
+    partitions.ensure_partitions_from(PARTITIONED_TABLES, source="staging_batch")
     
     # Populate dim_time
     cursor.execute("""
         INSERT INTO dim_time (survey_year)
-        SELECT DISTINCT survey_year FROM staging_survey WHERE survey_year IS NOT NULL
+        SELECT DISTINCT survey_year FROM staging_batch WHERE survey_year IS NOT NULL
         ON CONFLICT (survey_year) DO NOTHING;
     """)
     
@@ -257,63 +363,77 @@ def transform_data():
     cursor.execute("""
         INSERT INTO dim_household (hhid_2, district, subcounty, parish, cluster, village, vid, quartile, hh_category, treat_status)
         SELECT DISTINCT hhid_2, pre_district, pre_subcounty, pre_parish, pre_cluster, pre_village, pre_vid, quartile, hh_category, treat_status
-        FROM staging_survey
+        FROM staging_batch
         WHERE hhid_2 IS NOT NULL
         ON CONFLICT (hhid_2) DO NOTHING;
     """)
     
-    # Populate dim_respondent
+    # Populate dim_respondent; respondent_id is SERIAL, so existing respondents
+    # are skipped explicitly and a retried run adds no duplicates
     cursor.execute("""
         INSERT INTO dim_respondent (hhid_2, survey_year, respondent_sex, hhh_sex, hhh_age, hhh_educ_level,
                                    spouse_sex, spouse_age, spouse_educ_level, no_wives)
-        SELECT hhid_2, survey_year, respondent_sex, hhh_sex, hhh_age, hhh_educ_level,
-               spouse_sex, spouse_age, spouse_educ_level, no_wives
-        FROM staging_survey
-        WHERE hhid_2 IS NOT NULL AND survey_year IS NOT NULL
-        ON CONFLICT DO NOTHING;
-    """)
-    
-    # Populate fact_survey
-    cursor.execute("""
-        INSERT INTO fact_survey (
-            hhid_2, survey_year, submission_date, duration, survey_type, status, tot_hhmembers,
-            hh_size, females_hh_count, children_num_u5, asp_actual_income, material_walls,
-            material_roof, fuel_source_cooking, every_member_shoes
+        SELECT DISTINCT ON (s.hhid_2, s.survey_year)
+               s.hhid_2, s.survey_year, s.respondent_sex, s.hhh_sex, s.hhh_age, s.hhh_educ_level,
+               s.spouse_sex, s.spouse_age, s.spouse_educ_level, s.no_wives
+        FROM staging_batch s
+        WHERE s.hhid_2 IS NOT NULL AND s.survey_year IS NOT NULL
+        AND NOT EXISTS (
+            SELECT 1 FROM dim_respondent r
+            WHERE r.hhid_2 = s.hhid_2 AND r.survey_year = s.survey_year
         )
-        SELECT hhid_2, survey_year, submission_date, duration, survey_type, status, tot_hhmembers,
-               hh_size, females_hh_count, children_num_u5, asp_actual_income, material_walls,
-               material_roof, fuel_source_cooking, every_member_shoes
-        FROM staging_survey
-        WHERE hhid_2 IS NOT NULL AND survey_year IS NOT NULL
-        ON CONFLICT (hhid_2, survey_year) DO NOTHING;
+        ORDER BY s.hhid_2, s.survey_year, s._load_batch DESC NULLS LAST;
     """)
     
+    # Populate fact_survey; swap mode rebuilds its partitions last, below
+    fact_survey_columns = [
+        "hhid_2", "survey_year", "submission_date", "duration", "survey_type", "status", "tot_hhmembers",
+        "hh_size", "females_hh_count", "children_num_u5", "asp_actual_income", "material_walls",
+        "material_roof", "fuel_source_cooking", "every_member_shoes"
+    ]
+    if FACT_LOAD_MODE != "swap":
+        cursor.execute(f"""
+            INSERT INTO fact_survey ({', '.join(fact_survey_columns)})
+            SELECT {', '.join(fact_survey_columns)}
+            FROM staging_batch
+            WHERE hhid_2 IS NOT NULL AND survey_year IS NOT NULL
+            ON CONFLICT (hhid_2, survey_year) DO NOTHING;
+        """)
+    
     # Populate fact_expenditure
     cursor.execute("""
         INSERT INTO fact_expenditure (hhid_2, survey_year, cereals_week, tubers_week, medical_care_annual, total_expenditure)
         SELECT hhid_2, survey_year, cereals_week, tubers_week, medical_care_annual,
                COALESCE(cereals_week, 0) + COALESCE(tubers_week, 0) + COALESCE(medical_care_annual, 0)
-        FROM staging_survey
+        FROM staging_batch
         WHERE hhid_2 IS NOT NULL AND survey_year IS NOT NULL
         ON CONFLICT (hhid_2, survey_year) DO NOTHING;
     """)
     
-    # Populate fact_crop_yield dynamically
-    crop_types = [
-        "beans", "gnuts", "soya_beans", "peas", "maize", "millet", "sorghum", "barley",
-        "rice", "irish_potatoes", "sweetpotatoes", "cassava", "yams", "garlic", "ginger", "tabbaco"
-    ]
-    for crop in crop_types:
-        cursor.execute(f"""
-            INSERT INTO fact_crop_yield (hhid_2, survey_year, crop_type, planted_qty, total_yield, yield_sold, yield_consumed, market_price)
-            SELECT hhid_2, survey_year, '{crop}' AS crop_type, sn_1_{crop}_planted, sn_1_{crop}_Total_Yield,
-                   sn_1_{crop}_Total_Yield_sold, sn_1_{crop}_Total_Yield_consume,
-                   COALESCE(sn_1_{crop}_Market_Price_fresh, sn_1_{crop}_Market_Price)
-            FROM staging_survey
-            WHERE hhid_2 IS NOT NULL AND survey_year IS NOT NULL AND sn_1_{crop}_planted IS NOT NULL
-            ON CONFLICT (hhid_2, survey_year, crop_type) DO NOTHING;
-        """)
+    # Populate fact_crop_yield for every crop found in staging in one pass
+    crops = discover_crop_columns(get_column_types(cursor, "staging_survey"))
+    if crops:
+        cursor.execute(crop_yield_unpivot_sql(crops, source="staging_batch"))
+    
+    if FACT_LOAD_MODE == "swap":
+        # Rebuild each year in the batch from all of its staged rows and swap it in.
+        # Each swap commits the writes above, which are all idempotent, so a run
+        # that fails from here on is retried in full without duplicating rows
+        cursor.execute("SELECT DISTINCT survey_year FROM staging_batch WHERE survey_year IS NOT NULL ORDER BY 1")
+        for (year,) in cursor.fetchall():
+            partitions.swap_partition(
+                "fact_survey", year, fact_survey_columns,
+                f"""
+                SELECT DISTINCT ON (hhid_2) {', '.join(fact_survey_columns)}
+                FROM staging_survey
+                WHERE hhid_2 IS NOT NULL AND survey_year = %s
+                ORDER BY hhid_2, _load_batch DESC NULLS LAST
+                """,
+                (year,)
+            )
     
+    # Moves only once every write above has succeeded
+    watermark.advance(previous, batch)
     conn.commit()
     cursor.close()
     conn.close()
@@ -356,7 +476,8 @@ with DAG(
     "rtv_pipeline",
     start_date=datetime(2025, 5, 30),
     schedule_interval=None,
-    catchup=False
+    catchup=False,
+    max_active_runs=1
 ) as dag:
     ingest_task = PythonOperator(task_id="ingest_data", python_callable=ingest_data)
     load_task = PythonOperator(task_id="load_to_staging", python_callable=load_to_staging)
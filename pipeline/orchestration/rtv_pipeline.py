@@ -16,6 +16,7 @@ sys.path.append(str(Path(__file__).parent.parent.parent))
 from pipeline.ingestion.ingest_data import ingest_survey_data
 from pipeline.transformation.transform_data import transform_survey_data
 from pipeline.transformation.quality_checks import run_quality_checks
+from lib.compaction import compact_data_lake
 
 # Default arguments
 default_args = {
@@ -57,7 +58,17 @@ ingest_data = PythonOperator(
     dag=dag,
 )
 
-# Task 3: Transform data
+# Task 3: Compact small and duplicate files in the data lake
+compact_lake = PythonOperator(
+    task_id='compact_data_lake',
+    python_callable=compact_data_lake,
+    op_kwargs={
+        'minio_bucket': 'rtv-data',
+    },
+    dag=dag,
+)
+
+# Task 4: Transform data
 transform_data = PythonOperator(
     task_id='transform_survey_data',
     python_callable=transform_survey_data,
@@ -68,7 +79,7 @@ transform_data = PythonOperator(
     dag=dag,
 )
 
-# Task 4: Run quality checks
+# Task 5: Run quality checks
 quality_checks = PythonOperator(
     task_id='run_quality_checks',
     python_callable=run_quality_checks,
@@ -78,7 +89,7 @@ quality_checks = PythonOperator(
     dag=dag,
 )
 
-# Task 5: Update materialized views
+# Task 6: Update materialized views
 update_views = PostgresOperator(
     task_id='update_views',
     postgres_conn_id='postgres_default',
@@ -88,7 +99,7 @@ update_views = PostgresOperator(
     dag=dag,
 )
 
-# Task 6: Log pipeline completion
+# Task 7: Log pipeline completion
 log_completion = PostgresOperator(
     task_id='log_pipeline_completion',
     postgres_conn_id='postgres_default',
@@ -113,7 +124,7 @@ log_completion = PostgresOperator(
 )
 
 # Define task dependencies
-create_tables >> ingest_data >> transform_data >> quality_checks >> update_views >> log_completion
+create_tables >> ingest_data >> compact_lake >> transform_data >> quality_checks >> update_views >> log_completion
 
 # Add documentation
 dag.doc_md = """
@@ -124,10 +135,11 @@ This DAG orchestrates the ETL process for RTV household survey data.
 ## Pipeline Steps
 1. Create/update database tables
 2. Ingest survey data from source files
-3. Transform and clean the data
-4. Run quality checks
-5. Update materialized views
-6. Log pipeline completion
+3. Compact small and duplicate files in the data lake
+4. Transform and clean the data
+5. Run quality checks
+6. Update materialized views
+7. Log pipeline completion
 
 ## Schedule
 - Runs daily at midnight
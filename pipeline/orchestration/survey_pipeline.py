@@ -6,8 +6,8 @@ from airflow.operators.python import PythonOperator
 from airflow.models import Variable
 from airflow.utils.task_group import TaskGroup
 import psycopg2
-from minio import Minio
 from lib.data_lake import DataLakeManager
+from lib.storage import ObjectStore, create_storage_client
 from lib.schema_migration import SchemaMigrationManager
 from lib.quality_checks import SurveyDataQualityValidator
 from lib.ingestion import SurveyDataIngester
@@ -34,9 +34,10 @@ def get_db_connection() -> psycopg2.extensions.connection:
         password=Variable.get("POSTGRES_PASSWORD")
     )
 
-def get_minio_client() -> Minio:
-    """Get MinIO client."""
-    return Minio(
+def get_minio_client() -> ObjectStore:
+    """Get the object store client selected by the STORAGE_BACKEND variable."""
+    return create_storage_client(
+        backend=Variable.get("STORAGE_BACKEND", default_var="minio"),
         endpoint=Variable.get("MINIO_ENDPOINT"),
         access_key=Variable.get("MINIO_ACCESS_KEY"),
         secret_key=Variable.get("MINIO_SECRET_KEY"),
@@ -96,7 +97,8 @@ def ingest_survey_data(**context) -> None:
             metadata={
                 "dag_run_id": context['dag_run'].run_id,
                 "execution_date": context['execution_date'].isoformat()
-            }
+            },
+            content_hash=context['dag_run'].conf.get('content_hash')
         )
         
         # Record metric
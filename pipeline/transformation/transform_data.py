@@ -4,18 +4,35 @@ from pathlib import Path
 import logging
 from datetime import datetime
 import os
-from minio import Minio
 from minio.error import S3Error
 import json
-from typing import Dict, List, Optional, Tuple
+from typing import Dict, List, Optional, Sequence, Tuple
 import sys
 from sqlalchemy import create_engine, text
 import io
 
+sys.path.append(str(Path(__file__).parent.parent.parent))
+from lib.cache import ObjectCache
+from lib.catalog import LakeCatalog
+from lib.manifest import IngestionManifest
+from lib.parquet_reader import Filter, read_parquet_selective
+from lib.storage import ObjectStore, create_storage_client, open_object
+
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Columns used by the household and survey transforms; indicator_* columns
+# are read for measurements as well
+TRANSFORM_COLUMNS = {
+    'household_id', 'village_id', 'household_code', 'head_of_household',
+    'household_size', 'survey_round', 'survey_date', 'surveyor_id', 'status'
+}
+
+def _is_transform_column(name: str) -> bool:
+    """Check whether a processed column is used by any transform."""
+    return name in TRANSFORM_COLUMNS or name.startswith('indicator_')
+
 class DataTransformation:
     def __init__(self, minio_bucket: str, db_conn_id: str):
         """
@@ -28,17 +45,14 @@ class DataTransformation:
         self.minio_bucket = minio_bucket
         self.db_conn_id = db_conn_id
         self.minio_client = self._setup_minio()
+        self.cache = ObjectCache.from_env()
+        self.catalog = LakeCatalog.from_env()
         self.db_engine = self._setup_database()
         
-    def _setup_minio(self) -> Minio:
-        """Set up MinIO client connection."""
+    def _setup_minio(self) -> ObjectStore:
+        """Set up the object store client selected by STORAGE_BACKEND."""
         try:
-            client = Minio(
-                "localhost:9000",
-                access_key="minioadmin",
-                secret_key="minioadmin",
-                secure=False
-            )
+            client = create_storage_client()
             
             if not client.bucket_exists(self.minio_bucket):
                 raise S3Error(f"Bucket {self.minio_bucket} does not exist")
@@ -57,33 +71,57 @@ class DataTransformation:
             logger.error(f"Failed to connect to database: {e}")
             raise
             
-    def _load_from_minio(self) -> List[pd.DataFrame]:
+    def _load_from_minio(self,
+                         since: Optional[datetime] = None,
+                         filters: Optional[Sequence[Filter]] = None) -> List[pd.DataFrame]:
         """
-        Load all processed parquet files from MinIO.
+        Load processed parquet files from MinIO.
+        
+        When the ingestion manifest is present only the current object of
+        each source file is read, so re-ingested files are not loaded twice.
+        Only the columns the transforms use and the row groups that can
+        match the filters are fetched, and with a lake catalog whole files
+        are skipped on their column stats and household bloom filters.
+        
+        Args:
+            since: Only load objects ingested after this time (manifest only)
+            filters: (column, op, value) conditions, e.g.
+                [('survey_round', '==', 'year_two')]
         
         Returns:
             List[pd.DataFrame]: List of DataFrames containing the processed data
         """
         dfs = []
         try:
-            # List all objects in the processed directory
-            objects = self.minio_client.list_objects(
-                self.minio_bucket,
-                prefix="processed/",
-                recursive=True
-            )
+            manifest = IngestionManifest(self.minio_client, self.minio_bucket)
+            if manifest.entries:
+                object_names = manifest.objects(since=since)
+            else:
+                # List all objects in the processed directory
+                objects = self.minio_client.list_objects(
+                    self.minio_bucket,
+                    prefix="processed/",
+                    recursive=True
+                )
+                object_names = [obj.object_name for obj in objects]
             
-            for obj in objects:
-                if obj.object_name.endswith('.parquet'):
-                    # Get the object data
-                    data = self.minio_client.get_object(
-                        self.minio_bucket,
-                        obj.object_name
-                    )
+            if self.catalog is not None and filters:
+                # Skip files whose recorded stats rule out every filter
+                object_names = self.catalog.prune(self.minio_bucket, object_names, filters)
+            
+            for object_name in object_names:
+                if not object_name.endswith('.parquet'):
+                    continue
                     
-                    # Read parquet data into DataFrame
-                    df = pd.read_parquet(io.BytesIO(data.read()))
-                    dfs.append(df)
+                if self.cache:
+                    # Unchanged objects are read from local disk
+                    df = self.cache.read_parquet(self.minio_client, self.minio_bucket, object_name,
+                                                 columns=_is_transform_column, filters=filters)
+                else:
+                    # Fetch only the footer and the needed column chunks
+                    source = open_object(self.minio_client, self.minio_bucket, object_name)
+                    df = read_parquet_selective(source, columns=_is_transform_column, filters=filters)
+                dfs.append(df)
                     
             return dfs
         except Exception as e:
@@ -218,10 +256,13 @@ class DataTransformation:
             logger.error(f"Error loading data to database: {e}")
             raise
             
-    def transform_survey_data(self) -> Dict[str, int]:
+    def transform_survey_data(self, filters: Optional[Sequence[Filter]] = None) -> Dict[str, int]:
         """
         Main transformation function to process all survey data.
         
+        Args:
+            filters: (column, op, value) conditions limiting the rows loaded
+        
         Returns:
             Dict[str, int]: Statistics about the transformation process
         """
@@ -234,7 +275,7 @@ class DataTransformation:
         
         try:
             # Load data from MinIO
-            dfs = self._load_from_minio()
+            dfs = self._load_from_minio(filters=filters)
             if not dfs:
                 raise ValueError("No data found in MinIO")
                 
@@ -270,20 +311,24 @@ class DataTransformation:
             logger.error(f"Error during transformation process: {e}")
             raise
 
-def transform_survey_data(minio_bucket: str, db_conn_id: str) -> Dict[str, int]:
+def transform_survey_data(minio_bucket: str,
+                          db_conn_id: str,
+                          filters: Optional[Sequence[Filter]] = None) -> Dict[str, int]:
     """
     Wrapper function for the data transformation process.
     
     Args:
         minio_bucket: Name of the MinIO bucket containing processed data
         db_conn_id: Database connection identifier
+        filters: (column, op, value) conditions, e.g.
+            [('survey_round', '==', 'year_two')]
         
     Returns:
         Dict[str, int]: Statistics about the transformation process
     """
     try:
         transformation = DataTransformation(minio_bucket, db_conn_id)
-        return transformation.transform_survey_data()
+        return transformation.transform_survey_data(filters=filters)
     except Exception as e:
         logger.error(f"Failed to transform survey data: {e}")
         raise